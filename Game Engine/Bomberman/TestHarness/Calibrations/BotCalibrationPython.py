@@ -1,39 +1,148 @@
+"""Calibration bot for Python 2 and Python 3 bots.
+
+BotRunner.CalibrateBot times one run of this script before the game starts and
+gives a Python bot that much more time every round.  To reflect what a real bot
+pays before it can think, it does the same work: start the interpreter, import
+json and NumPy, read the round's state.json (58 KB on a 21x21 map), decode it,
+lay the map out in arrays and write move.txt.  The time of every stage is
+printed, the harness logs it.
+
+If NumPy is not installed the import is left out and said so.  If there is no
+state.json in the output folder a state of the same shape and size is made up.
+"""
+from __future__ import print_function
+
+import time
+
+STARTED = time.time()
+
+import io
+import json
 import random
 import sys
 from os import path
 
+MAP_SIZE = 21
+ENTITY_CODES = {
+    'Domain.Entities.IndestructibleWallEntity, Domain': 1,
+    'Domain.Entities.DestructibleWallEntity, Domain': 2,
+    'Domain.Entities.PlayerEntity, Domain': 3,
+}
+POWER_UP_CODES = {
+    'Domain.Entities.PowerUps.BombBagPowerUpEntity, Domain': 1,
+    'Domain.Entities.PowerUps.BombRaduisPowerUpEntity, Domain': 2,
+    'Domain.Entities.PowerUps.SuperPowerUp, Domain': 3,
+}
+MOVES = [-1, 1, 2, 3, 4, 5, 6]
+
+
+class Stages(object):
+    """Seconds spent in every stage, in order."""
+
+    def __init__(self):
+        self.last = STARTED
+        self.stages = []
+
+    def mark(self, stage):
+        now = time.time()
+        self.stages.append((stage, now - self.last))
+        self.last = now
+
+    def report(self):
+        for stage, seconds in self.stages:
+            print('{0:<10} {1:8.1f} ms'.format(stage, seconds * 1000))
+        print('{0:<10} {1:8.1f} ms since the first line'.format('total', (self.last - STARTED) * 1000))
+
+
+def made_up_state(size=MAP_SIZE):
+    """state.json text of a ``size`` square map laid out the way the engine's are."""
+    blocks = []
+    for x in range(1, size + 1):
+        column = []
+        for y in range(1, size + 1):
+            location = {'X': x, 'Y': y}
+            entity = None
+            if x in (1, size) or y in (1, size) or (x % 2 and y % 2):
+                entity = {'$type': 'Domain.Entities.IndestructibleWallEntity, Domain', 'Location': location}
+            elif (x + y) % 3 == 0:
+                entity = {'$type': 'Domain.Entities.DestructibleWallEntity, Domain', 'Location': location}
+            column.append({'Entity': entity, 'Bomb': None, 'PowerUp': None, 'Exploding': False,
+                           'Location': location})
+        blocks.append(column)
+    players = [{'Name': 'Player {0}'.format(key), 'Key': key, 'Points': 0, 'Killed': False, 'BombBag': 1,
+                'BombRadius': 1, 'Location': {'X': x, 'Y': y}}
+               for key, x, y in (('A', 2, 2), ('B', size - 1, size - 1))]
+    return json.dumps({'RegisteredPlayerEntities': players, 'CurrentRound': 0, 'MapHeight': size,
+                       'MapWidth': size, 'GameBlocks': blocks, 'MapSeed': 0}, separators=(',', ':'))
+
+
+def lay_out(state, numpy):
+    """Entity, power up and bomb fuse grids of ``state``, as NumPy arrays if there is NumPy."""
+    width, height = state['MapWidth'], state['MapHeight']
+    entities = [[0] * width for _ in range(height)]
+    power_ups = [[0] * width for _ in range(height)]
+    fuses = [[0] * width for _ in range(height)]
+    for column in state['GameBlocks']:
+        for block in column:
+            x, y = block['Location']['X'] - 1, block['Location']['Y'] - 1
+            if block['Entity'] is not None:
+                entities[y][x] = ENTITY_CODES.get(block['Entity']['$type'], 0)
+            if block['PowerUp'] is not None:
+                power_ups[y][x] = POWER_UP_CODES.get(block['PowerUp']['$type'], 0)
+            if block['Bomb'] is not None:
+                fuses[y][x] = block['Bomb']['BombTimer']
+    if numpy is not None:
+        return numpy.array(entities, dtype=numpy.int8), numpy.array(power_ups, dtype=numpy.int8), \
+            numpy.array(fuses, dtype=numpy.int8)
+    return entities, power_ups, fuses
+
+
 def main(output_path, player_key):
-    possible_moves = [
-        {'Command': 'DoNothing', 'CommandCode': -1},
-        {'Command': 'MoveUp', 'CommandCode': 1},
-        {'Command': 'MoveLeft', 'CommandCode': 2},
-        {'Command': 'MoveRight', 'CommandCode': 3},
-        {'Command': 'MoveDown', 'CommandCode': 4},
-        {'Command': 'PlaceBomb', 'CommandCode': 5},
-        {'Command': 'TriggerBomb', 'CommandCode': 6}]
-    move = random.choice(possible_moves)
-    move_file = open(path.join(output_path, 'move.txt'), 'w')
-    move_file.write(str(move['CommandCode']) + '\r\n')
-    move_file.close()
-
-    state_file = open(path.join(output_path, 'state.json'), 'r')
-	content = state_file.readlines()
-    state_file.close()
+    stages = Stages()
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    stages.mark('imports')
+
+    state_path = path.join(output_path, 'state.json')
+    if path.isfile(state_path):
+        with io.open(state_path, 'rb') as state_file:
+            content = state_file.read().decode('utf-8')
+    else:
+        content = made_up_state()
+    stages.mark('read')
+
+    state = json.loads(content)
+    stages.mark('decode')
+
+    lay_out(state, numpy)
+    stages.mark('arrays')
+
+    with io.open(path.join(output_path, 'move.txt'), 'w') as move_file:
+        move_file.write(u'{0}\r\n'.format(random.choice(MOVES)))
+    stages.mark('move')
+
+    print('Python {0}, NumPy {1}, {2} bytes of state{3}'.format(
+        sys.version.split()[0], numpy.__version__ if numpy is not None else 'not installed', len(content),
+        '' if path.isfile(state_path) else ' (made up, no state.json for player {0})'.format(player_key)))
+    stages.report()
+
 
 if __name__ == '__main__':
-    if(len(sys.argv) < 2):
+    if len(sys.argv) < 2:
         player_key = ''
     else:
         player_key = sys.argv[1]
 
-    if(len(sys.argv) < 3):
+    if len(sys.argv) < 3:
         output_path = ''
     else:
         output_path = sys.argv[2]
 
-    if (output_path != '' and path.exists(output_path) == False):
-       print
-       print ('Error: Output folder "' + sys.argv[1] + '" does not exist.')
-       exit(-1)
+    if output_path != '' and not path.exists(output_path):
+        print()
+        print('Error: Output folder "' + output_path + '" does not exist.')
+        sys.exit(-1)
 
     main(output_path, player_key)
@@ -44,6 +44,7 @@ namespace TestHarness.TestHarnesses.Bot.Runners
 
             using (var handler = new ProcessHandler(AppDomain.CurrentDomain.BaseDirectory, pythonExecutable, processArgs, ParentHarness.Logger))
             {
+                handler.ProcessToRun.OutputDataReceived += (sender, args) => ParentHarness.Logger.LogInfo("Output from calibration: " + args.Data);
                 handler.RunProcess();
             }
         }
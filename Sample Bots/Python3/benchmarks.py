@@ -0,0 +1,229 @@
+"""Benchmarks of the bot's hot paths on fixed states, checked against an earlier run.
+
+Every scenario is one state: the sample state.json, and states played out on
+the simulator from maps ``mapgen`` generates for fixed seeds, every player
+moving by a depth one search (``search.Planner`` past its deadline) so the
+games are the same on every run:
+
+* ``early``: two players, eight rounds in.
+* ``bombs``: four players carrying three bombs of radius two, thirty rounds in.
+* ``four``: four players, eighty rounds in.
+* ``medium`` and ``large``: eight players on 31x31 and twelve on 41x41.
+
+For every state this times reading it (the sample files only), the danger map,
+distance fields from every player with and without blasts, building the
+derived maps, one simulator step and a search of the first player to a fixed
+depth, as the best of a few runs of as many calls as fit in a fraction of a
+second.  A search with a deadline is also run to see how far past its deadline
+it returns; that has to stay under ``OVERRUN_LIMIT`` whatever the machine.
+
+    python benchmarks.py --output before.json
+    python benchmarks.py --baseline before.json --threshold 0.25
+
+Results are written as JSON, seconds per call by benchmark.  With a baseline
+the run fails (exit status 1) if any benchmark got slower by more than the
+threshold, or if any search overran.
+"""
+import argparse
+import collections
+import json
+import os
+import platform
+import random
+import sys
+import time
+import timeit
+
+import numpy as np
+
+import danger
+import diff
+import distance
+import mapgen
+import search
+import zobrist
+from simulator import ACTIONS, Simulator
+from state import load_state, parse_map, parse_state
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Sample State Files')
+# name, players, map seed, rounds played, bomb bag and radius every player starts with (None keeps the map's).
+SCENARIOS = (
+    ('early', 2, 1, 8, None, None),
+    ('bombs', 4, 5, 30, 3, 2),
+    ('four', 4, 3, 80, None, None),
+    ('medium', 8, 4, 40, None, None),
+    ('large', 12, 5, 40, None, None),
+)
+DECIDE_DEPTH = 3
+THINK = 0.2
+OVERRUN_LIMIT = 0.05
+THRESHOLD = 0.25
+REPEAT = 3
+
+
+def self_play(players, seed, rounds, bomb_bag=None, bomb_radius=None):
+    """State ``rounds`` into a game on the map for ``seed``, every player moving by a depth one search."""
+    sim = Simulator(mapgen.generate(players, seed), seed=seed)
+    for index in range(players):
+        if bomb_bag is not None:
+            sim.bomb_bag[index] = bomb_bag
+        if bomb_radius is not None:
+            sim.radius[index] = bomb_radius
+    for _ in range(rounds):
+        if sim.finished():
+            break
+        state = sim.to_state()
+        sim.step([None if player.killed else search.Planner(state, player.key, 0).search()[0]
+                  for player in state.players])
+        del sim.log[:]
+    return sim.to_state()
+
+
+def scenarios(paths=()):
+    """``(name, state, files)`` for every scenario, ``files`` the raw state.json and map.txt where there are any."""
+    found = []
+    for name, folder in [('sample', SAMPLE_DIR)] + [(path, os.path.dirname(path)) for path in paths]:
+        files = {}
+        for file_name in ('state.json', 'map.txt'):
+            path = os.path.join(folder, file_name) if name == 'sample' or file_name == 'map.txt' else name
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    files[file_name] = f.read()
+        found.append((name, parse_state(files['state.json']), files))
+    for name, players, seed, rounds, bomb_bag, bomb_radius in SCENARIOS:
+        found.append((name, self_play(players, seed, rounds, bomb_bag, bomb_radius), {}))
+    return found
+
+
+def measure(call, repeat=REPEAT):
+    """Seconds per call, the best of ``repeat`` runs of as many calls as take a fifth of a second."""
+    timer = timeit.Timer(call)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def benchmarks(state, files):
+    """``(name, call)`` of everything timed on ``state``."""
+    calls = []
+    if 'state.json' in files:
+        calls.append(('parse_state', lambda: parse_state(files['state.json'])))
+    if 'map.txt' in files and parse_map(files['map.txt']) is not None:
+        calls.append(('parse_map', lambda: parse_map(files['map.txt'])))
+
+    passable = distance.open_cells(state)
+    players = np.zeros((len(state.players),) + passable.shape, dtype=bool)
+    for player in state.players:
+        players[player.index, player.y, player.x] = True
+    danger_grid = danger.danger_map(state)
+    bombs = distance.bomb_cells(state)
+    calls.append(('danger', lambda: danger.danger_map(state)))
+    calls.append(('distances', lambda: distance.distances(passable, players)))
+    calls.append(('timed_distances', lambda: distance.timed_distances(passable, players, danger_grid, bombs)))
+    calls.append(('derive', lambda: diff.Derived.build(state)))
+
+    sim = Simulator(state, seed=0)
+    rng = random.Random(0)
+    commands = [None if player.killed else rng.choice(ACTIONS) for player in state.players]
+
+    def step():
+        mark = sim.mark()
+        sim.step(commands)
+        sim.undo(mark)
+
+    calls.append(('step', step))
+
+    me = next((player.key for player in state.players if not player.killed), None)
+    table = zobrist.TranspositionTable(search.TABLE_BITS)
+
+    def decide():
+        table.clear()
+        planner = search.Planner(state, me, float('inf'), table)
+        return list(planner.children(ACTIONS, DECIDE_DEPTH - 1))
+
+    if me is not None:
+        calls.append(('decide', decide))
+    return calls
+
+
+def overrun(state, think=THINK, repeat=REPEAT):
+    """Most seconds ``search.choose_action`` took past a deadline ``think`` seconds away."""
+    me = next((player.key for player in state.players if not player.killed), None)
+    if me is None:
+        return 0.0
+    worst = 0.0
+    for _ in range(repeat):
+        deadline = time.monotonic() + think
+        search.choose_action(state, me, deadline)
+        worst = max(worst, time.monotonic() - deadline)
+    return worst
+
+
+def run(paths=(), repeat=REPEAT, think=THINK):
+    """Results of every benchmark: ``{'results': {name: seconds}, 'overruns': {scenario: seconds}, ...}``."""
+    report = collections.OrderedDict()
+    report['python'] = platform.python_version()
+    report['machine'] = platform.machine()
+    report['scenarios'] = collections.OrderedDict()
+    report['results'] = collections.OrderedDict()
+    report['overruns'] = collections.OrderedDict()
+    for scenario, state, files in scenarios(paths):
+        report['scenarios'][scenario] = {
+            'size': '{}x{}'.format(state.width, state.height),
+            'players': len(state.players),
+            'alive': sum(not player.killed for player in state.players),
+            'round': state.round,
+            'bombs': sum(1 for _ in state.bombs()),
+        }
+        print('{} ({size}, {alive} of {players} players alive, round {round}, {bombs} bombs)'.format(
+            scenario, **report['scenarios'][scenario]))
+        for name, call in benchmarks(state, files):
+            seconds = report['results']['{}/{}'.format(scenario, name)] = measure(call, repeat)
+            print('  {:<20} {:10.3f} ms'.format(name, seconds * 1000))
+        seconds = report['overruns'][scenario] = overrun(state, think, repeat)
+        print('  {:<20} {:10.3f} ms past a {:.0f} ms deadline'.format('overrun', seconds * 1000, think * 1000))
+    return report
+
+
+def regressions(report, baseline, threshold=THRESHOLD):
+    """``(name, before, after)`` of every benchmark more than ``threshold`` slower than in ``baseline``."""
+    slower = []
+    for name, after in report['results'].items():
+        before = baseline['results'].get(name)
+        if before and after > before * (1 + threshold):
+            slower.append((name, before, after))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='fraction a benchmark may get slower than the baseline')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='runs per benchmark, the best one counts')
+    parser.add_argument('--think', type=float, default=THINK, help='seconds the deadline search is given')
+    parser.add_argument('--states', nargs='*', default=(), help='more state.json files to benchmark')
+    args = parser.parse_args()
+
+    report = run(args.states, args.repeat, args.think)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    failed = False
+    for scenario, seconds in report['overruns'].items():
+        if seconds > OVERRUN_LIMIT:
+            print('{}: search returned {:.1f} ms past its deadline'.format(scenario, seconds * 1000))
+            failed = True
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for name, before, after in regressions(report, baseline, args.threshold):
+            print('{}: {:.3f} ms, was {:.3f} ms ({:+.0%})'.format(name, after * 1000, before * 1000,
+                                                                  after / before - 1))
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""The board as bitboards: one Python int per kind of thing on the map.
+
+Bit ``cell`` of an int stands for the cell at index ``cell`` of the compact
+state's grids (``y * width + x``), so walls, destructible walls, bombs, blasts
+and every player's position are each one int of ``width * height`` bits.  Ints
+are immutable, so a ``Board`` is copied by copying a handful of references, and
+whole sets of cells are combined with a single ``&``, ``|`` or shift:
+
+* the four neighbours of a set of cells are the set shifted by one and by a row
+  (``spread``), masked so that nothing wraps from one row into the next;
+* a flood fill (``Board.distances``) spreads its frontier one step at a time;
+* a blast ray is a precomputed mask of the cells in one direction, cut at the
+  first wall or destructible wall in it, which is the lowest (right, down) or
+  highest (left, up) set bit of the ray and the blockers;
+* ``Board.resolve`` sets the bombs off round by round, chain reactions
+  included, the way ``danger.resolve`` does on NumPy grids.
+
+Run this module to check every operation against the grid implementations in
+``danger``, ``distance`` and ``simulator`` on the benchmark states, and to time
+both side by side.
+"""
+import array
+
+from danger import SAFE
+
+RIGHT = 0
+LEFT = 1
+DOWN = 2
+UP = 3
+
+_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+
+# Ray masks by map size, see ``_ray_masks``.
+_rays = {}
+
+
+def bits_of(values, table=None):
+    """Int with bit ``cell`` set wherever ``values[cell]`` (a byte grid of zeros and ones) is set.
+
+    ``table`` is a ``bytes.translate`` table that first maps other byte grids to zeros and ones.
+    """
+    values = bytes(values)
+    if table is not None:
+        values = values.translate(table)
+    digits = values.translate(_DIGITS)[::-1]
+    return int(digits, 2) if digits else 0
+
+
+def cells_of(bits):
+    """Indices of the set bits of ``bits``, lowest first."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def _ray_masks(width, height):
+    """``masks[direction][cell]``: the cells one, two, ... steps from ``cell`` in ``direction`` up to the edge."""
+    masks = _rays.get((width, height))
+    if masks is None:
+        masks = []
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            by_cell = []
+            for cell in range(width * height):
+                y, x = divmod(cell, width)
+                cumulative, ray = [], 0
+                x, y = x + dx, y + dy
+                while 0 <= x < width and 0 <= y < height:
+                    ray |= 1 << (y * width + x)
+                    cumulative.append(ray)
+                    x, y = x + dx, y + dy
+                by_cell.append(tuple(cumulative))
+            masks.append(tuple(by_cell))
+        masks = _rays[width, height] = tuple(masks)
+    return masks
+
+
+class Board(object):
+    """Walls, destructible walls, bombs, blasts and player positions of one round as ints.
+
+    ``bomb_list`` holds ``(cell, fuse, radius, owner)`` of every bomb (the
+    search's timelines leave the owner out) and ``players`` the position of
+    every player (0 once it is dead), both tuples, so nothing in a board is ever
+    changed in place.
+    """
+    __slots__ = ('width', 'height', 'full', 'not_first_column', 'not_last_column', 'wall', 'destructible',
+                 'bombs', 'exploding', 'bomb_list', 'players', 'rays')
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.full = (1 << (width * height)) - 1
+        first_column = sum(1 << (y * width) for y in range(height))
+        self.not_first_column = self.full & ~first_column
+        self.not_last_column = self.full & ~(first_column << (width - 1))
+        self.wall = self.destructible = self.bombs = self.exploding = 0
+        self.bomb_list = ()
+        self.players = ()
+        self.rays = _ray_masks(width, height)
+
+    @classmethod
+    def from_state(cls, state):
+        board = cls(state.width, state.height)
+        board.wall = bits_of(state.wall)
+        board.destructible = bits_of(state.destructible)
+        board.exploding = bits_of(state.exploding)
+        board.bomb_list = tuple(state.bombs())
+        board.bombs = sum(1 << cell for cell, _, _, _ in board.bomb_list)
+        board.players = tuple(0 if player.killed else 1 << (player.y * state.width + player.x)
+                              for player in state.players)
+        return board
+
+    def copy(self):
+        other = Board.__new__(Board)
+        for name in Board.__slots__:
+            setattr(other, name, getattr(self, name))
+        return other
+
+    def open_cells(self):
+        """Cells that can be walked on, walls and destructible walls aside."""
+        return self.full & ~self.wall & ~self.destructible
+
+    def spread(self, bits):
+        """``bits`` and the four neighbours of every cell in it."""
+        width = self.width
+        return (bits | (bits << 1) & self.not_first_column | (bits >> 1) & self.not_last_column |
+                bits << width | bits >> width) & self.full
+
+    def moves(self, index):
+        """Cells player ``index`` can move to this round: open, no bomb and nobody on it."""
+        position = self.players[index]
+        occupied = 0
+        for other in self.players:
+            occupied |= other
+        return self.spread(position) & self.open_cells() & ~self.bombs & ~occupied
+
+    def blast(self, cell, radius, destructible=None):
+        """Cells the bomb on ``cell`` catches: its own and its four rays, each to the first wall.
+
+        A destructible wall is caught and stops the ray, an indestructible one
+        just stops it.  ``destructible`` defaults to the board's.
+        """
+        if destructible is None:
+            destructible = self.destructible
+        wall = self.wall
+        blockers = wall | destructible
+        caught = 1 << cell
+        for direction, masks in enumerate(self.rays):
+            steps = masks[cell]
+            if not steps or radius <= 0:
+                continue
+            ray = steps[min(radius, len(steps)) - 1]
+            hit = ray & blockers
+            if hit:
+                if direction in (RIGHT, DOWN):
+                    first = hit & -hit
+                    ray &= (first << 1) - 1
+                else:
+                    first = 1 << (hit.bit_length() - 1)
+                    ray &= ~(first - 1)
+                ray &= ~wall
+            caught |= ray
+        return caught
+
+    def resolve(self):
+        """``(rounds, times)``: the cells caught in every round from now (``{round: bits}``) and ``{bomb cell: round}``.
+
+        Bombs caught by a blast go off in the same round.  Destructible walls
+        caught in one round no longer stop the blasts of later ones.
+        """
+        pending = {bomb[0]: (bomb[1], bomb[2]) for bomb in self.bomb_list}
+        destructible = self.destructible
+        rounds, times = {}, {}
+        while pending:
+            now = min(fuse for fuse, _ in pending.values())
+            going = [cell for cell, (fuse, _) in pending.items() if fuse == now]
+            caught = 0
+            while going:
+                for cell in going:
+                    caught |= self.blast(cell, pending.pop(cell)[1], destructible)
+                    times[cell] = now
+                going = [cell for cell in pending if caught >> cell & 1]
+            rounds[now] = caught
+            destructible &= ~caught
+        return rounds, times
+
+    def danger(self):
+        """The ``danger.resolve`` grid as bytes: the first round every cell is caught in, ``SAFE`` if never."""
+        grid = bytearray([SAFE]) * (self.width * self.height)
+        seen = 0
+        for now, caught in sorted(self.resolve()[0].items()):
+            for cell in cells_of(caught & ~seen):
+                grid[cell] = now
+            seen |= caught
+        return bytes(grid)
+
+    def distances(self, sources, passable=None, limit=None):
+        """Flood fill from ``sources``: the list of cells first reached after 0, 1, 2, ... steps.
+
+        Sources count even if they are not passable themselves (a player
+        standing on its own bomb).  ``passable`` defaults to ``open_cells``.
+        """
+        if passable is None:
+            passable = self.open_cells()
+        layers = [sources]
+        reached = frontier = sources
+        while frontier and (limit is None or len(layers) <= limit):
+            frontier = self.spread(frontier) & passable & ~reached
+            if frontier:
+                layers.append(frontier)
+                reached |= frontier
+        return layers
+
+
+def steps(layers, size, unreached=-1):
+    """Steps to every one of ``size`` cells from ``Board.distances`` layers, as an int16 array."""
+    result = array.array('h', [unreached]) * size
+    for step, layer in enumerate(layers):
+        for cell in cells_of(layer):
+            result[cell] = step
+    return result
+
+
+def _check(state):
+    """Compare every bitboard operation on ``state`` with the grid implementation it stands in for."""
+    import numpy as np
+
+    import danger
+    import distance
+    from simulator import MOVE_DOWN, MOVE_LEFT, MOVE_RIGHT, MOVE_UP, Simulator
+
+    board = Board.from_state(state)
+    assert board.danger() == danger.danger_map(state).tobytes(), 'danger'
+    passable = distance.open_cells(state)
+    sim = Simulator(state, seed=0)
+    for player in state.players:
+        if player.killed:
+            continue
+        sources = np.zeros(passable.shape, dtype=bool)
+        sources[player.y, player.x] = True
+        expected = distance.distances(passable, sources).ravel().tolist()
+        assert steps(board.distances(board.players[player.index]), state.size).tolist() == expected, 'distances'
+        targets = {sim._target(player.index, action) for action in (MOVE_UP, MOVE_LEFT, MOVE_RIGHT, MOVE_DOWN)}
+        assert set(cells_of(board.moves(player.index))) == targets - {None}, 'moves'
+
+
+def _benchmark(scenarios):
+    import timeit
+
+    import numpy as np
+
+    import danger
+    import distance
+    from simulator import MOVE_DOWN, MOVE_LEFT, MOVE_RIGHT, MOVE_UP, Simulator
+
+    def report(name, call):
+        timer = timeit.Timer(call)
+        number, _ = timer.autorange()
+        seconds = min(timer.repeat(3, number)) / number
+        print('  {:<36} {:8.1f} us'.format(name, seconds * 1e6))
+
+    for name, state, _ in scenarios:
+        _check(state)
+        board = Board.from_state(state)
+        alive = [player for player in state.players if not player.killed]
+        print('{} ({}x{}, {} bombs): bitboards agree with the grids'.format(
+            name, state.width, state.height, len(board.bomb_list)))
+        wall, destructible = danger.grid(state.wall, state), danger.grid(state.destructible, state)
+        report('danger.danger_map', lambda: danger.danger_map(state))
+        report('Board.danger', board.danger)
+        report('Board.resolve', board.resolve)
+        if board.bomb_list:
+            cell, _, radius, _ = board.bomb_list[0]
+            report('danger.resolve, one bomb', lambda: danger.resolve(wall, destructible, [cell], [1], [radius]))
+            report('Board.blast, one bomb', lambda: board.blast(cell, radius))
+        if alive:
+            passable = distance.open_cells(state)
+            sources = np.zeros(passable.shape, dtype=bool)
+            sources[alive[0].y, alive[0].x] = True
+            position = board.players[alive[0].index]
+            report('distance.distances, one player', lambda: distance.distances(passable, sources))
+            report('Board.distances, one player', lambda: board.distances(position))
+            sim = Simulator(state, seed=0)
+            index = alive[0].index
+            report('Simulator._target, four moves', lambda: [sim._target(index, action) for action in
+                                                              (MOVE_UP, MOVE_LEFT, MOVE_RIGHT, MOVE_DOWN)])
+            report('Board.moves', lambda: board.moves(index))
+        report('State.copy', state.copy)
+        report('Board.copy', board.copy)
+
+
+if __name__ == '__main__':
+    import sys
+
+    import benchmarks
+
+    _benchmark(benchmarks.scenarios(sys.argv[1:]))
@@ -1,13 +1,27 @@
-import argparse
-import json
-import logging
-import logging.config
+import time
+
+STARTED = time.monotonic()
+# Processor time used before the first line ran, mostly starting the interpreter.
+STARTUP_CPU = time.process_time()
+
 import os
-import random
 import sys
 
+# Only what handing the round to the daemon takes is imported up front.  The
+# search, numpy and logging are loaded by ``main`` when the round is played here.
+import daemon
+
+IMPORTED = time.monotonic()
+
+# The engine allows two seconds per round, the margin covers writing move.txt and exiting.
+DEADLINE = 2.0
+SAFETY_MARGIN = 0.3
+# The opponent model and the timing log are written after the move only with this much time left before the limit.
+SAVE_CUTOFF = 0.1
+
+DO_NOTHING = -1
 ACTIONS = {
-    -1: 'DoNothing',
+    DO_NOTHING: 'DoNothing',
     1: 'MoveUp',
     2: 'MoveLeft',
     3: 'MoveRight',
@@ -16,76 +30,177 @@ ACTIONS = {
     6: 'TriggerBomb',
 }
 
+LOG_FILE = 'p3.log'
+# Write log records as they come instead of after the move (see logbuffer).
+LOG_DIRECT = bool(os.environ.get('BOT_LOG_DIRECT'))
+
+
+def main(player_key, output_path, deadline=None, timer=None, pool=None, limit=None, reply=None):
+    """Play the round in ``output_path``, searching in ``pool`` (a ``parallel.SearchPool``) if there is one.
+
+    ``reply`` is called with the action as soon as move.txt is written.  The
+    opponent model and the timing log are written after that, unless it is
+    within ``SAVE_CUTOFF`` of ``limit``, the ``time.monotonic`` value by which
+    the process has to be done.
+    """
+    import logging
 
-def main(player_key, output_path):
+    from cache import open_cache
+    from opponents import OpponentModel
+    from search import TABLE_BITS, choose_action
+    from state import load_round
+    from timing import Timer
+
+    logger = logging.getLogger()
+    if deadline is None:
+        deadline = time.monotonic() + DEADLINE - SAFETY_MARGIN
+    if timer is None:
+        timer = Timer()
+    timer.mark('imports')
     logger.info('Player key: {}'.format(player_key))
     logger.info('Output path: {}'.format(output_path))
 
 
-    with open(os.path.join(output_path, 'state.json'), 'r', encoding='utf-8-sig') as f:
-        state = json.load(f)
+    state = load_round(output_path)
+    logger.info('Round: {}'.format(state.round))
+    timer.mark('load')
 
-    action = random.choice(list(ACTIONS.keys()))
+    search_cache = open_cache(state, player_key, TABLE_BITS)
+    timer.mark('cache')
+    timer.count('cache_reused', search_cache is not None and search_cache.reused)
+    model = OpponentModel.load()
+    timer.mark('model')
+    try:
+        action = choose_action(state, player_key, deadline, search_cache, timer, model, pool)
+    finally:
+        if search_cache is not None:
+            search_cache.close()
+        timer.mark('close')
     logger.info('Action: {}'.format(ACTIONS[action]))
 
+    write_move(output_path, action)
+    if reply is not None:
+        reply(action)
+    timer.mark('move')
+
+    # The engine times the process until it exits, not until move.txt is
+    # written, so played here the files below still count against its limit.
+    # A daemon has replied by now and is not timed.
+    if limit is not None and time.monotonic() >= limit - SAVE_CUTOFF:
+        logger.warning('Too close to the limit to save the opponent model and timing log')
+        return action
+    model.save()
+    try:
+        timer.write(output_path, round=state.round, key=player_key)
+    except OSError:
+        logger.exception('Cannot write timing log')
+    return action
+
+
+def write_move(output_path, action):
     with open(os.path.join(output_path, 'move.txt'), 'w') as f:
         f.write('{}\n'.format(action))
 
 
 def handle_exception(exc_type, exc_value, exc_traceback):
+    import logging
+
     if issubclass(exc_type, KeyboardInterrupt):
         sys.__excepthook__(exc_type, exc_value, exc_traceback)
         return
-    logger.error("Uncaught exception", exc_info=(exc_type, exc_value, exc_traceback))
+    logging.getLogger().error("Uncaught exception", exc_info=(exc_type, exc_value, exc_traceback))
+    flush_logging()
 
 
-if __name__ == '__main__':
+def configure_logging(limit=None, direct=LOG_DIRECT):
+    """Info to stdout, errors to stderr and everything to ``LOG_FILE``, opened with the first record.
+
+    Unless ``direct``, records are held until ``flush_logging``, and those
+    below warning are left out when that runs within ``logbuffer.CUTOFF`` of
+    ``limit`` (a ``time.monotonic`` value).
+    """
+    import logging
+
+    formatter = logging.Formatter('%(levelname)-7s - [%(funcName)s] %(message)s')
+    root = logging.getLogger()
+    handlers = []
+    for handler, level in ((logging.StreamHandler(sys.stdout), logging.INFO),
+                           (logging.StreamHandler(sys.stderr), logging.ERROR),
+                           (logging.FileHandler(LOG_FILE, delay=True), logging.DEBUG)):
+        handler.setLevel(level)
+        handler.setFormatter(formatter)
+        handlers.append(handler)
+    if direct:
+        for handler in handlers:
+            root.addHandler(handler)
+    else:
+        import logbuffer
+
+        logbuffer.install(handlers)
+        logbuffer.set_limit(limit)
+    root.setLevel(logging.DEBUG)
+
+    sys.excepthook = handle_exception
+    root.disabled = False
+
+
+def flush_logging():
+    """Write out the log records held back during the round, if they are."""
+    logbuffer = sys.modules.get('logbuffer')
+    if logbuffer is not None:
+        logbuffer.flush()
+
+
+def parse_args(argv):
+    """``(player key, output path, no daemon, deadline, safety margin)`` from the command line.
+
+    The engine runs ``bot.py <key> <output path>``, which is read as it is;
+    argparse is only loaded for options.
+    """
+    if len(argv) <= 2 and not any(arg.startswith('-') for arg in argv):
+        player_key, output_path = (list(argv) + [None, os.getcwd()][len(argv):])[:2]
+        return player_key, output_path, False, DEADLINE, SAFETY_MARGIN
+
+    import argparse
+
     parser = argparse.ArgumentParser()
     parser.add_argument('player_key', nargs='?')
     parser.add_argument('output_path', nargs='?', default=os.getcwd())
-    args = parser.parse_args()
-
-    assert (os.path.isdir(args.output_path))
-
-    logging.config.dictConfig({
-        'version': 1,
-        'formatters': {
-            'simple': {
-                'format': '%(asctime)s - %(levelname)-7s - [%(filename)s:%(funcName)s] %(message)s',
-            },
-            'min': {
-                'format': '%(levelname)-7s - [%(funcName)s] %(message)s',
-            },
-        },
-        'filters': {},
-        'handlers': {
-            'stdout': {
-                'level': 'INFO',
-                'class': 'logging.StreamHandler',
-                'formatter': 'min',
-                'stream': 'ext://sys.stdout',
-            },
-            'stderr': {
-                'level': 'ERROR',
-                'class': 'logging.StreamHandler',
-                'formatter': 'min',
-                'stream': 'ext://sys.stderr',
-            },
-            'file': {
-                'level': 'DEBUG',
-                'class': 'logging.FileHandler',
-                'formatter': 'min',
-                'filename': 'p3.log',
-            },
-        },
-        'root': {
-            'level': 'DEBUG',
-            'handlers': ['stdout', 'stderr', 'file'],
-        },
-    })
+    parser.add_argument('--no-daemon', action='store_true', help='always play the round in this process')
+    parser.add_argument('--deadline', type=float, default=DEADLINE,
+                        help='seconds from process start until the engine stops waiting for move.txt')
+    parser.add_argument('--safety-margin', type=float, default=SAFETY_MARGIN,
+                        help='seconds before the deadline at which the search stops')
+    args = parser.parse_args(argv)
+    return args.player_key, args.output_path, args.no_daemon, args.deadline, args.safety_margin
 
-    logger = logging.getLogger()
-    sys.excepthook = handle_exception
-    logger.disabled = False
 
-    main(args.player_key, args.output_path)
+if __name__ == '__main__':
+    player_key, output_path, no_daemon, deadline, safety_margin = parse_args(sys.argv[1:])
+    assert (os.path.isdir(output_path))
+    limit, deadline = STARTED + deadline, STARTED + deadline - safety_margin
+
+    # Hand the round to a running daemon if there is one, it already has everything loaded.
+    try:
+        action = None if no_daemon else daemon.request_move(player_key, output_path, deadline)
+    except daemon.DaemonTimeout as error:
+        # The daemon is still on the round and has its cache open, and the
+        # deadline has passed: playing it here too would miss the engine's limit.
+        print(error, file=sys.stderr)
+        action = DO_NOTHING
+        write_move(output_path, action)
+    if action is not None:
+        print(ACTIONS[action])
+    else:
+        from timing import Timer
+
+        timer = Timer(STARTED)
+        timer.mark('imports', IMPORTED)
+        timer.count('startup_cpu', round(STARTUP_CPU, 6))
+        timer.mark('daemon')
+        configure_logging(limit)
+        timer.mark('logging')
+        try:
+            main(player_key, output_path, deadline, timer, limit=limit)
+        finally:
+            flush_logging()
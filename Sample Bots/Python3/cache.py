@@ -0,0 +1,198 @@
+"""Search results carried over from one round to the next in a memory mapped file.
+
+The engine starts bot.py afresh every round, although two consecutive states
+only differ in a few cells.  ``open_cache`` maps a small binary file from the
+bot folder into memory and hands the previous round's transposition table back
+to the search, together with last round's state and the ``diff.Derived`` maps
+brought forward to this round through the changes in between.  The search
+writes straight into the mapping, so there is nothing to load or save beyond
+what the operating system pages in and out.
+
+Layout, all little endian: a fixed header (see ``_HEADER``), the transposition
+table slots (see ``zobrist.TranspositionTable``), the packed state (see
+``state.pack``), then the derived maps: danger as one byte per cell, target
+distances as int16 per cell and the cells visited as one byte per cell for
+every player.  The header names the map seed, player and round
+stored; a file written for another game, player, map size or table size, or
+for a later round than the one being played, is wiped and started over.
+
+A round holds an exclusive ``flock`` on the file from ``open_cache`` to
+``Cache.close``.  A second process asking for it meanwhile (say a daemon and a
+``bot.py --no-daemon`` for the same player) searches without the cache rather
+than write into the same mapping.
+"""
+import array
+import logging
+import mmap
+import os
+import struct
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows, where the file goes unlocked.
+    fcntl = None
+
+import diff
+import state as compact
+from zobrist import TranspositionTable
+
+MAGIC = b'BMBCACHE'
+VERSION = 3
+CACHE_DIR = os.environ.get('BOT_CACHE_DIR', os.path.dirname(os.path.abspath(__file__)))
+
+# magic, version, table bits, width, height, players, map seed, round, player key,
+# table generation and whether the state and maps after the table are complete.
+_HEADER = struct.Struct('<8sHHHHHqi16sHH')
+_HEADER_SIZE = 128
+
+logger = logging.getLogger(__name__)
+
+
+def cache_path(player_key, directory=CACHE_DIR):
+    return os.path.join(directory, 'bot-{}.cache'.format(player_key or 'unknown'))
+
+
+class Cache(object):
+    """One round's view of the cache file, see ``open_cache``."""
+
+    def __init__(self, mapping, state, player_key, table_bits, fd=None):
+        size, players = state.size, len(state.players)
+        self.state = state
+        self.player_key = player_key
+        self._mapping = mapping
+        # The open file holding the lock, released when it is closed.
+        self._fd = fd
+        self._key = (player_key or '').encode('utf-8')[:16]
+
+        self._view = view = memoryview(mapping)
+        offset = _HEADER_SIZE + TranspositionTable.footprint(table_bits)
+        self.table = TranspositionTable(table_bits, view[_HEADER_SIZE:offset])
+        sections = []
+        for length in (compact.packed_size(size, players), size, 2 * size, players * size):
+            sections.append(view[offset:offset + length])
+            offset += length
+        self._state, self._danger, distance, self._visited = sections
+        self._distance = distance.cast('h')
+
+        header = self._read_header()
+        self.reused = header is not None
+        self._complete = bool(header and header[1])
+        if header is None:
+            self.table.clear()
+        else:
+            self.table.generation = header[0]
+        # The sections are rewritten in place, so until ``close`` the file vouches for none of them.
+        self._write_header(False)
+
+    @staticmethod
+    def file_size(state, table_bits):
+        size, players = state.size, len(state.players)
+        return (_HEADER_SIZE + TranspositionTable.footprint(table_bits) + compact.packed_size(size, players)
+                + (3 + players) * size)
+
+    def _read_header(self):
+        """``(generation, complete)`` if the file was written for this game, else None."""
+        state = self.state
+        fields = _HEADER.unpack_from(self._mapping)
+        magic, version, bits, width, height, players, seed, round, key = fields[:9]
+        if (magic, version, bits, width, height, players, seed, key.rstrip(b'\0')) != (
+                MAGIC, VERSION, self.table.bits, state.width, state.height, len(state.players), state.seed,
+                self._key):
+            return None
+        if round > state.round:
+            return None
+        return fields[9:]
+
+    def _write_header(self, complete):
+        state = self.state
+        _HEADER.pack_into(self._mapping, 0, MAGIC, VERSION, self.table.bits, state.width, state.height,
+                          len(state.players), state.seed, state.round, self._key, self.table.generation, complete)
+
+    def previous(self):
+        """Last round's state and maps as stored, or None."""
+        if not self._complete:
+            return None
+        previous = compact.unpack(self._state)
+        size = previous.size
+        visited = self._visited.tobytes()
+        return diff.Derived(previous, self._danger.tobytes(), self._distance.tolist(),
+                            [bytearray(visited[index * size:(index + 1) * size])
+                             for index in range(len(previous.players))])
+
+    def derived(self, previous=None):
+        """``diff.Derived`` maps for this round, brought forward from last round's when there are any.
+
+        ``previous`` is what ``previous`` returned, if it has been called already.
+        """
+        derived = self.previous() if previous is None else previous
+        if derived is None:
+            return diff.Derived.build(self.state)
+        delta = diff.diff(derived.state, self.state)
+        logger.debug('Since round {}: {} walls destroyed, {} bombs placed, {} exploded, {} changed, '
+                     '{} power ups revealed, {} taken, {} players moved, {} killed'.format(
+                         derived.state.round, len(delta.walls_destroyed), len(delta.bombs_placed),
+                         len(delta.bombs_exploded), len(delta.bombs_changed), len(delta.power_ups_revealed),
+                         len(delta.power_ups_taken), len(delta.players_moved), len(delta.players_killed)))
+        derived.update(self.state, delta)
+        return derived
+
+    def store(self, derived):
+        """Keep ``derived`` (for this round's state) for the next round."""
+        self._state[:] = compact.pack(derived.state)
+        self._danger[:] = derived.danger
+        self._distance[:] = array.array('h', derived.distance)
+        self._visited[:] = b''.join(derived.visited)
+        self._complete = True
+
+    def close(self):
+        """Write the header for this round and unmap the file."""
+        self._write_header(self._complete)
+        self.table.release()
+        for view in (self._state, self._danger, self._distance, self._visited, self._view):
+            view.release()
+        self._mapping.close()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_cache(state, player_key, table_bits, path=None):
+    """Map the cache file for ``player_key``, creating or resizing it as needed.
+
+    Returns None if the file cannot be used (e.g. a read-only bot folder), the
+    search then runs with a table of its own.
+    """
+    path = path or cache_path(player_key)
+    size = Cache.file_size(state, table_bits)
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    except OSError:
+        logger.exception('Cannot map search cache {}'.format(path))
+        return None
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                logger.warning('Search cache {} is in use by another round, searching without it'.format(path))
+                os.close(fd)
+                return None
+        if os.fstat(fd).st_size != size:
+            # A fresh file reads as zeros, which no header matches.
+            os.ftruncate(fd, 0)
+            os.ftruncate(fd, size)
+        mapping = mmap.mmap(fd, size)
+    except (OSError, ValueError):
+        logger.exception('Cannot map search cache {}'.format(path))
+        os.close(fd)
+        return None
+    found = Cache(mapping, state, player_key, table_bits, fd)
+    logger.info('{} search cache {}'.format('Reusing' if found.reused else 'Starting', path))
+    return found
@@ -0,0 +1,237 @@
+"""Long lived worker that plays rounds on behalf of bot.py.
+
+The engine starts bot.py as a new process every round.  Start this worker once
+before the match, from the bot folder:
+
+    python daemon.py
+
+Each round bot.py then just passes its player key and output path over a local
+Unix socket and waits for the move, while the worker keeps its imports, search
+tables and caches warm between rounds.  If no worker is listening bot.py plays
+the round itself, and so it does when the worker answers that it failed to play
+the round or is busy with another player's round.  If one is listening but does
+not answer in time, it is still on the round, so bot.py does not start on it as
+well.
+"""
+import os
+import socket
+import sys
+import time
+
+SOCKET_PATH = os.environ.get('BOT_SOCKET', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot.sock'))
+REQUEST_TIMEOUT = 1.5
+# Time kept back from the worker's search for the reply to travel back and bot.py to exit.
+REPLY_MARGIN = 0.1
+IDLE_TIMEOUT = 600
+# What the worker answers instead of a move when the client has to play the round itself.
+FAILED = b'ERR\n'
+# How long a client turned away while the worker is busy gets to send its request.
+REFUSE_TIMEOUT = 0.1
+WORKERS = int(os.environ.get('BOT_WORKERS') or 0)
+
+
+def _logger():
+    # Asking for a move is on bot.py's fast path, which does without logging.
+    import logging
+
+    return logging.getLogger(__name__)
+
+
+def _read_all(connection):
+    chunks = []
+    while True:
+        chunk = connection.recv(4096)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+
+class DaemonTimeout(Exception):
+    """A worker took the round but did not answer in time, it may still be playing it."""
+
+
+def request_move(player_key, output_path, deadline=None, path=SOCKET_PATH):
+    """Ask a running worker to play the round.
+
+    The worker searches until ``deadline`` (a ``time.monotonic`` value, by
+    default ``REQUEST_TIMEOUT`` from now) less ``REPLY_MARGIN``.  Returns the
+    action the worker wrote to move.txt, or None if the round is left to the
+    caller: there is no worker to ask, it is gone, it failed to play the round
+    or it is busy with another one.  Raises ``DaemonTimeout`` if there is one
+    but it did not answer by the deadline, or there is no time left to ask it.
+    """
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+        return None
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            client.connect(path)
+        except OSError:
+            # A socket left behind by a worker that is gone.
+            return None
+        budget = REQUEST_TIMEOUT if deadline is None else deadline - time.monotonic()
+        if budget <= REPLY_MARGIN:
+            raise DaemonTimeout('No time left to ask the worker')
+        try:
+            client.settimeout(budget)
+            client.sendall('{}\n{}\n{:.3f}\n'.format(player_key or '', os.path.abspath(output_path),
+                                                     budget).encode('utf-8'))
+            client.shutdown(socket.SHUT_WR)
+            reply = _read_all(client)
+        except socket.timeout as error:
+            raise DaemonTimeout('No answer from the worker: {}'.format(error))
+        except OSError:
+            # The worker hung up, it is not on the round.
+            return None
+    finally:
+        client.close()
+
+    try:
+        return int(reply)
+    except ValueError:
+        # ``FAILED``, or nothing at all from a worker that died on the round.
+        return None
+
+
+def _handle(connection, play):
+    received = time.monotonic()
+    request = _read_all(connection).decode('utf-8').split('\n')
+    if len(request) < 3:
+        _logger().error('Malformed request {!r}'.format(request))
+        connection.sendall(FAILED)
+        return
+    player_key, output_path = request[0] or None, request[1]
+    try:
+        budget = float(request[2])
+    except ValueError:
+        budget = REQUEST_TIMEOUT
+
+    sent = []
+
+    def reply(action):
+        # The client has what it waits for, whatever the round still does after the move.
+        try:
+            connection.sendall('{}\n'.format(action).encode('utf-8'))
+            connection.shutdown(socket.SHUT_WR)
+        except OSError:
+            _logger().exception('Lost connection to bot client')
+        sent.append(action)
+
+    try:
+        play(player_key, output_path, received + budget - REPLY_MARGIN, reply)
+    except Exception:
+        _logger().exception('Failed to play round for {} in {}'.format(player_key, output_path))
+        if not sent:
+            connection.sendall(FAILED)
+
+
+def _refuse(connection):
+    """Turn a client away while another round is being played, it plays its round itself."""
+    connection.settimeout(REFUSE_TIMEOUT)
+    player_key = _read_all(connection).decode('utf-8').split('\n')[0]
+    _logger().warning('Busy with another round, {} plays its own'.format(player_key or 'the client'))
+    connection.sendall(FAILED)
+
+
+def _claim(path):
+    """Remove a stale socket left behind by a worker that died, refuse if one is still alive."""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+    else:
+        raise RuntimeError('A bot daemon is already listening on {}'.format(path))
+    finally:
+        probe.close()
+
+
+def serve(path=SOCKET_PATH, idle_timeout=IDLE_TIMEOUT, workers=0):
+    """Play rounds as they are asked for, with ``workers`` search processes started up front if more than one."""
+    import threading
+
+    import bot
+
+    bot.configure_logging()
+    _claim(path)
+    pool = None
+    if workers > 1:
+        from parallel import SearchPool
+
+        pool = SearchPool(workers)
+
+    def play(player_key, output_path, deadline, reply):
+        return bot.main(player_key, output_path, deadline, pool=pool, reply=reply)
+
+    def play_round(connection):
+        try:
+            connection.settimeout(None)
+            _handle(connection, play)
+        except OSError:
+            _logger().exception('Lost connection to bot client')
+        finally:
+            connection.close()
+            # The client has its move, the round's log can be written now.
+            bot.flush_logging()
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(4)
+    server.settimeout(idle_timeout or None)
+    _logger().info('Bot daemon listening on {}'.format(path))
+    bot.flush_logging()
+
+    # Rounds are played one at a time on their own thread, so that a client that
+    # comes in meanwhile (another player sharing the bot folder) is turned away
+    # at once instead of waiting out its deadline.
+    playing = None
+    try:
+        while True:
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                if playing is not None and playing.is_alive():
+                    continue
+                _logger().info('No rounds for {}s, shutting down'.format(idle_timeout))
+                break
+            if playing is not None and playing.is_alive():
+                try:
+                    _refuse(connection)
+                except OSError:
+                    pass
+                finally:
+                    connection.close()
+                continue
+            playing = threading.Thread(target=play_round, args=(connection,), daemon=True)
+            playing.start()
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
+        if playing is not None:
+            playing.join()
+        if pool is not None:
+            pool.close()
+
+
+if __name__ == '__main__':
+    if not hasattr(socket, 'AF_UNIX'):
+        sys.exit('Unix sockets are not available on this platform, run bot.py directly')
+
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--socket', default=SOCKET_PATH, help='path of the Unix socket to listen on')
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT,
+                        help='exit after this many seconds without a round, 0 to run forever')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='search processes to split every round between, 0 or 1 to search in the daemon')
+    args = parser.parse_args()
+
+    try:
+        serve(args.socket, args.idle_timeout, args.workers)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,276 @@
+"""What changed since last round, and maps carried forward through those changes.
+
+``diff`` compares two compact states and returns a ``Delta``.  ``Derived``
+holds the maps the search works from: the blast danger grid, the walking
+distance to the nearest target and the cells every player has stood on.
+``Derived.build`` works them out from scratch with the NumPy grids of
+``danger`` and ``distance``.  ``Derived.update`` brings them forward to the
+next state touching only what the delta can reach:
+
+* Blasts.  Two bombs can only affect each other if the cells their blasts could
+  cover, ignoring destructible walls, overlap, so bombs fall apart into groups
+  that blow up independently.  Groups made of unchanged bombs, with no destroyed
+  wall and no changed or exploded bomb in reach, keep their danger (moved on by
+  the rounds passed); only the rest is resolved again.
+* Distances.  Cells that lose every shortest path to a target (a power up taken
+  or a wall gone) are cleared level by level, then they and the newly opened
+  cells are filled in again from their neighbours.
+"""
+import collections
+
+import numpy as np
+
+import danger
+import distance
+import mapindex
+
+Delta = collections.namedtuple('Delta', 'rounds walls_destroyed bombs_placed bombs_exploded bombs_changed '
+                                        'power_ups_revealed power_ups_taken players_moved players_killed')
+
+
+def _cells(mask):
+    return np.flatnonzero(mask).tolist()
+
+
+def _grid(values, dtype=np.int8):
+    return np.frombuffer(values, dtype=dtype)
+
+
+def diff(old, new):
+    """``Delta`` from state ``old`` to the later state ``new`` of the same game.
+
+    Bombs count as changed when their timer did not simply run down (a trigger)
+    or their radius or owner is different; a bomb that went off and was replaced
+    by a new one on the same cell counts as exploded and placed.  Players moved
+    holds ``(index, from, to)``.
+    """
+    rounds = new.round - old.round
+    old_fuse, new_fuse = _grid(old.bomb_fuse), _grid(new.bomb_fuse)
+    had, has = old_fuse > 0, new_fuse > 0
+    ran_down = had & has & (new_fuse == old_fuse - rounds)
+    replaced = had & has & (new_fuse > old_fuse - rounds)
+    same_bomb = ((_grid(old.bomb_radius, np.int16) == _grid(new.bomb_radius, np.int16))
+                 & (_grid(old.bomb_owner) == _grid(new.bomb_owner)))
+    old_power_up, new_power_up = _grid(old.power_up), _grid(new.power_up)
+
+    width = new.width
+    moved, killed = [], []
+    for before, after in zip(old.players, new.players):
+        if (before.x, before.y) != (after.x, after.y):
+            moved.append((after.index, before.y * width + before.x, after.y * width + after.x))
+        if after.killed and not before.killed:
+            killed.append(after.index)
+
+    return Delta(
+        rounds=rounds,
+        walls_destroyed=_cells((_grid(old.destructible) != 0) & (_grid(new.destructible) == 0)),
+        bombs_placed=_cells(has & ~had | replaced),
+        bombs_exploded=_cells(had & ~has | replaced),
+        bombs_changed=_cells(had & has & ~replaced & ~(ran_down & same_bomb)),
+        power_ups_revealed=_cells((new_power_up != 0) & (old_power_up != new_power_up)),
+        power_ups_taken=_cells((old_power_up != 0) & (new_power_up == 0)),
+        players_moved=moved,
+        players_killed=killed,
+    )
+
+
+def _targets(state):
+    """``Derived.is_target`` of every cell as a ``(height, width)`` bool grid."""
+    destructible = danger.grid(state.destructible, state) != 0
+    near = danger.grid(state.power_up, state) != 0
+    near[1:] |= destructible[:-1]
+    near[:-1] |= destructible[1:]
+    near[:, 1:] |= destructible[:, :-1]
+    near[:, :-1] |= destructible[:, 1:]
+    return near
+
+
+class Derived(object):
+    """Maps worked out for one state, see the module docstring.
+
+    ``danger`` is the ``danger.resolve`` grid as bytes, ``distance`` the
+    walking distance from every open cell to the nearest target (the map size
+    where there is none) and ``visited`` one byte per cell for every player.
+    """
+
+    def __init__(self, state, danger_map, distance, visited):
+        self.state = state
+        self.danger = danger_map
+        self.distance = distance
+        self.visited = visited
+        self.size = state.size
+        self.steps = (-state.width, -1, 1, state.width)
+        self._reaches = {}
+
+    @classmethod
+    def build(cls, state):
+        visited = []
+        for player in state.players:
+            visited.append(bytearray(state.size))
+            visited[-1][player.y * state.width + player.x] = 1
+        passable = distance.open_cells(state)
+        walked = distance.distances(passable, passable & _targets(state)).ravel()
+        walked[walked == distance.UNREACHED] = state.size
+        return cls(state, danger.blasts(state).danger.tobytes(), walked.tolist(), visited)
+
+    def is_open(self, cell):
+        return not self.state.wall[cell] and not self.state.destructible[cell]
+
+    def is_target(self, cell):
+        """Cells worth walking to: visible power ups and spots next to a destructible wall."""
+        state = self.state
+        if state.power_up[cell]:
+            return True
+        return any(state.destructible[cell + step] for step in self.steps if 0 <= cell + step < self.size)
+
+    def visited_cells(self, index):
+        visited = self.visited[index]
+        return [cell for cell in range(self.size) if visited[cell]]
+
+    def update(self, state, delta):
+        """Carry the maps forward to ``state``, ``delta`` being ``diff(self.state, state)``."""
+        old = self.state
+        self.state = state
+        width = state.width
+        for player in state.players:
+            self.visited[player.index][player.y * width + player.x] = 1
+        self._update_danger(old, delta)
+        self._update_distance(old, delta)
+
+    # Blasts
+
+    def _reach(self, cell, radius):
+        """Cells a bomb could ever cover, stopping only at the map edge and indestructible walls."""
+        reach = self._reaches.get((cell, radius))
+        if reach is None:
+            index = mapindex.for_state(self.state)
+            reach = [cell]
+            for direction in range(len(mapindex.DIRECTIONS)):
+                reach.extend(index.ray(cell, direction, radius))
+            reach = self._reaches[cell, radius] = frozenset(reach)
+        return reach
+
+    def _groups(self, bombs):
+        """Split ``(cell, fuse, radius)`` bombs into groups whose reaches overlap, with the cells each covers."""
+        parent = list(range(len(bombs)))
+
+        def find(index):
+            while parent[index] != index:
+                parent[index] = parent[parent[index]]
+                index = parent[index]
+            return index
+
+        owner = {}
+        for index, (cell, _, radius) in enumerate(bombs):
+            for reached in self._reach(cell, radius):
+                other = owner.setdefault(reached, index)
+                if other != index:
+                    parent[find(other)] = find(index)
+        groups = collections.defaultdict(lambda: ([], set()))
+        for index, (cell, _, radius) in enumerate(bombs):
+            members, covered = groups[find(index)]
+            members.append(bombs[index])
+            covered |= self._reach(cell, radius)
+        return list(groups.values())
+
+    def _update_danger(self, old, delta):
+        state = self.state
+        rounds = delta.rounds
+        danger_map = self.danger
+        if rounds:
+            danger_map = danger_map.translate(bytes(value if value == danger.SAFE else max(value - rounds, 0)
+                                                    for value in range(256)))
+
+        changed = set(delta.bombs_exploded) | set(delta.bombs_changed)
+        dirty = set()
+        for cell in changed:
+            dirty |= self._reach(cell, old.bomb_radius[cell])
+        fresh = changed | set(delta.bombs_placed)
+        destroyed = set(delta.walls_destroyed)
+
+        bombs = [(cell, fuse, radius) for cell, fuse, radius, _ in state.bombs()]
+        resolve = []
+        for members, covered in self._groups(bombs):
+            if any(cell in fresh for cell, _, _ in members) or not covered.isdisjoint(dirty) \
+                    or not covered.isdisjoint(destroyed):
+                resolve.extend(members)
+                dirty |= covered
+        if dirty:
+            dirty = np.fromiter(dirty, dtype=np.intp, count=len(dirty))
+            grid = np.frombuffer(danger_map, dtype=np.uint8).copy()
+            if resolve:
+                resolved = danger.resolve(danger.grid(state.wall, state), danger.grid(state.destructible, state),
+                                          *zip(*resolve)).danger.ravel()
+                grid[dirty] = resolved[dirty]
+            else:
+                grid[dirty] = danger.SAFE
+            danger_map = grid.tobytes()
+        self.danger = danger_map
+
+    # Distances
+
+    def _update_distance(self, old, delta):
+        """Raise the cells that lost their way to a target, then lower everything from the new starting points."""
+        touched = set(delta.power_ups_revealed) | set(delta.power_ups_taken)
+        for cell in delta.walls_destroyed:
+            touched.add(cell)
+            touched.update(cell + step for step in self.steps if 0 <= cell + step < self.size)
+        if not touched:
+            return
+
+        distance, size, steps = self.distance, self.size, self.steps
+        is_open, is_target = self.is_open, self.is_target
+        lost = [cell for cell in touched if distance[cell] == 0 and not is_target(cell)]
+        invalid = set(lost)
+        level = lost
+        while level:
+            following = []
+            for cell in level:
+                reached = distance[cell] + 1
+                for step in steps:
+                    other = cell + step
+                    if other in invalid or distance[other] != reached or not is_open(other) or is_target(other):
+                        continue
+                    # Still fine if some other neighbour one step closer to a target is.
+                    if any(distance[other + back] == reached - 1 and other + back not in invalid
+                           and is_open(other + back) for back in steps):
+                        continue
+                    invalid.add(other)
+                    following.append(other)
+            level = following
+
+        for cell in invalid:
+            distance[cell] = size
+        starts = invalid | {cell for cell in touched if is_open(cell)}
+        self._fill(starts)
+
+    def _fill(self, starts):
+        """Lower ``distance`` outwards from ``starts``, each starting from a target or its best open neighbour."""
+        distance, size, steps = self.distance, self.size, self.steps
+        is_open = self.is_open
+        buckets = collections.defaultdict(list)
+        for cell in starts:
+            if not is_open(cell):
+                continue
+            if self.is_target(cell):
+                best = 0
+            else:
+                best = min([distance[cell]] + [distance[cell + step] + 1 for step in steps
+                                               if is_open(cell + step) and distance[cell + step] < size])
+            distance[cell] = best
+            if best < size:
+                buckets[best].append(cell)
+
+        current = 0
+        while buckets:
+            level = buckets.pop(current, ())
+            reached = current + 1
+            for cell in level:
+                if distance[cell] != current:
+                    continue
+                for step in steps:
+                    other = cell + step
+                    if distance[other] > reached and is_open(other):
+                        distance[other] = reached
+                        buckets[reached].append(other)
+            current = reached
@@ -0,0 +1,404 @@
+"""Whether a player can still get out of the way of the bombs, searched over cells and rounds together.
+
+A blast only kills in the round it goes off, so what matters is not how far the
+nearest safe cell is but whether there is a walk that is never on a cell at the
+wrong moment.  That is a search over ``(cell, round)`` states, done a round at a
+time on ``bitboard`` ints: every cell a player can be on after round ``t`` is
+one int, grown by ``Board.spread`` and cut by what round ``t`` allows.
+
+The rules are the simulator's.  Players are marked before and after they move,
+so a cell is deadly after round ``t`` if a blast reaches it in round ``t`` or
+``t + 1``.  A bomb blocks its cell up to the round it goes off, a destructible
+wall up to the round a blast takes it.  Every round a blast reaches a cell
+counts, not just the first one a ``danger`` grid knows of.  Other players are
+not in the way.
+
+``Escapes`` works the timeline of one set of bombs out once, from
+``Board.resolve``:
+
+* ``survivors`` holds every cell a player can start from and live through all
+  the blasts, found in one pass backwards from the last of them;
+* ``distance(cell)`` is the rounds from ``cell`` to the nearest cell no blast
+  reaches, like ``distance.escape_distance``, and is kept per start cell.
+
+``escapes`` memoises them by the bombs and walls of a board.
+``suicidal_cells`` answers "would a bomb placed here kill me?" for a whole set
+of candidate cells, the fresh bomb's fuse being ``simulator.bomb_timer`` of the
+bomb bag.  The timeline of the bombs already there is worked out once, and
+every candidate only adds what its own bomb changes.  The candidates are then
+swept backwards together: copies of the board, one per candidate, are laid side
+by side in one int, so every round of the sweep is a handful of operations for
+all of them.  Answers are memoised by cell and bombs, like ``escapes``.
+
+Run this module to check both against the simulator played out move by move on
+the benchmark states, and to time them.
+"""
+import collections
+
+from bitboard import cells_of
+from simulator import bomb_timer
+
+UNREACHED = -1
+# Timelines kept by ``escapes``, and answers by ``suicidal_cells``, before they are all dropped.
+MEMO_SIZE = 4096
+
+_memo = {}
+_suicidal = {}
+
+
+def _timeline(board, resolved=None):
+    """``(last, deadly, enter, caught)`` of the bombs on ``board``, ``resolved`` being its ``Board.resolve`` if known.
+
+    ``deadly[t]`` holds the cells not to be on after round ``t`` and
+    ``enter[t]`` the cells that can be moved onto in round ``t``, up to the
+    round after ``last``, the last blast.  ``caught`` is every cell a blast
+    reaches.
+    """
+    rounds, times = board.resolve() if resolved is None else resolved
+    last = max(rounds) if rounds else 0
+    floor = board.full & ~board.wall
+    deadly = [rounds.get(now, 0) | rounds.get(now + 1, 0) for now in range(last + 1)]
+    bombs, gone = 0, {}
+    for cell, time in times.items():
+        bombs |= 1 << cell
+        gone[time] = gone.get(time, 0) | 1 << cell
+    enter = []
+    destructible, caught = board.destructible, 0
+    for now in range(last + 2):
+        enter.append(floor & ~destructible & ~bombs)
+        bombs &= ~gone.get(now, 0)
+        destructible &= ~rounds.get(now, 0)
+        caught |= rounds.get(now, 0)
+    return last, deadly, enter, caught
+
+
+def _placed(board, resolved, cell, radius, fuse):
+    """``(round, caught, destructible)`` of a fresh bomb on ``cell``, ``resolved`` being ``board.resolve()``.
+
+    The bomb goes off in ``round``, at its fuse or with the first blast to
+    reach it, and catches ``caught``; ``destructible`` are the walls still up
+    then.  Unless its blast sets off a bomb still ticking, or takes a wall a
+    later blast may have been stopped by, every other blast is where it was.
+    None if it does not leave them be.
+    """
+    rounds, times = resolved
+    now = min([fuse] + [time for time, caught in rounds.items() if caught >> cell & 1])
+    destructible = board.destructible
+    for time, caught in rounds.items():
+        if time < now:
+            destructible &= ~caught
+    caught = board.blast(cell, radius, destructible)
+    if any(time > now and caught >> other & 1 for other, time in times.items()) or \
+            caught & destructible and max(rounds, default=0) > now:
+        return None
+    return now, caught, destructible
+
+
+def _sweep(spread, full, last, deadly, enter):
+    """Cells a player can stand on now and live through every blast of the timeline.
+
+    After the last blast every cell is fine, going back a round keeps the cells
+    one move from a fine one.
+    """
+    alive = full
+    for now in range(last, -1, -1):
+        alive = (alive | spread(alive & enter[now + 1])) & ~deadly[now]
+    return alive
+
+
+class Escapes(object):
+    """The ways out of one board's bombs, see the module docstring."""
+    __slots__ = ('board', 'last', 'deadly', 'enter', 'safe', 'survivors', '_distances')
+
+    def __init__(self, board):
+        self.board = board
+        self.last, self.deadly, self.enter, caught = _timeline(board)
+        self.safe = self.enter[-1] & ~caught
+        self.survivors = _sweep(board.spread, board.full, self.last, self.deadly, self.enter) & board.full & ~board.wall
+        self._distances = {}
+
+    def survives(self, cell):
+        return bool(self.survivors >> cell & 1)
+
+    def distance(self, cell):
+        """Rounds from ``cell`` to a cell no blast ever reaches, ``UNREACHED`` if there is no way to one."""
+        found = self._distances.get(cell)
+        if found is not None:
+            return found
+        spread, enter, deadly, last = self.board.spread, self.enter, self.deadly, self.last
+        reached = 1 << cell & ~deadly[0]
+        found, now = UNREACHED, 0
+        while reached:
+            if reached & self.safe:
+                found = now
+                break
+            now += 1
+            if now <= last:
+                reached = (reached | spread(reached) & enter[now]) & ~deadly[now]
+            else:
+                # Every blast is over, from here on it is a plain search.
+                grown = reached | spread(reached) & enter[-1]
+                if grown == reached:
+                    break
+                reached = grown
+        self._distances[cell] = found
+        return found
+
+
+def _key(board):
+    return (board.width, board.wall, board.destructible,
+            tuple(sorted((bomb[0], bomb[1], bomb[2]) for bomb in board.bomb_list)))
+
+
+def escapes(board):
+    """``Escapes`` of ``board``, shared by every board with the same walls and bombs."""
+    key = _key(board)
+    found = _memo.get(key)
+    if found is None:
+        if len(_memo) >= MEMO_SIZE:
+            _memo.clear()
+        found = _memo[key] = Escapes(board)
+    return found
+
+
+def _copies(bits, size, count):
+    """``bits`` repeated ``count`` times, ``size`` bits apart."""
+    copies, done = bits, 1
+    while done < count:
+        copies |= copies << done * size
+        done *= 2
+    return copies & ((1 << count * size) - 1)
+
+
+def _stacked_survivors(board, cells, radius, fuse):
+    """Whether a player on each of ``cells`` lives through a fresh bomb there, in one sweep for all of them.
+
+    Copy ``k`` of the board takes bits ``k * size`` on, with the timeline of
+    the ``k``-th cell: the timeline of the bombs already on the board, copied
+    to all of them, with what the fresh bomb changes on top.  A fresh bomb that changes the other blasts gets a timeline of its own.
+    """
+    width, size = board.width, board.width * board.height
+    resolved = board.resolve()
+    base_last, base_deadly, base_enter, _ = _timeline(board, resolved)
+    last, shared = base_last, 0
+    # By round: blasts of the fresh bombs, their cells blocked up to then and the walls they open after.
+    deadly, blocked, opened = collections.defaultdict(int), collections.defaultdict(int), collections.defaultdict(int)
+    own = []
+    for copy, cell in enumerate(cells):
+        shift = copy * size
+        found = _placed(board, resolved, cell, radius, fuse)
+        if found is None:
+            placed = board.copy()
+            placed.bomb_list = board.bomb_list + ((cell, fuse, radius, -1),)
+            own.append((shift, _timeline(placed)))
+            last = max(last, own[-1][1][0])
+            continue
+        shared |= 1 << shift
+        now, caught, destructible = found
+        last = max(last, now)
+        deadly[now] |= caught << shift
+        if now:
+            deadly[now - 1] |= caught << shift
+        blocked[now] |= 1 << cell + shift
+        opened[now + 1] |= (caught & destructible) << shift
+
+    count = len(cells)
+    shared *= (1 << size) - 1
+
+    def replicated(bits):
+        # The timeline of the board's own bombs, on every copy it holds for.
+        return _copies(bits, size, count) & shared
+
+    stacked_deadly = [(replicated(base_deadly[now]) if now <= base_last else 0) | deadly[now]
+                      for now in range(last + 1)]
+    stacked_enter = [0] * (last + 2)
+    still_blocked = 0
+    for now in range(last + 1, -1, -1):
+        still_blocked |= blocked[now]
+        stacked_enter[now] = replicated(base_enter[min(now, base_last + 1)]) & ~still_blocked
+    now_open = 0
+    for now in range(last + 2):
+        now_open |= opened[now]
+        stacked_enter[now] |= now_open
+    for shift, (own_last, own_deadly, own_enter, _) in own:
+        for now in range(own_last + 1):
+            stacked_deadly[now] |= own_deadly[now] << shift
+        for now in range(last + 2):
+            stacked_enter[now] |= own_enter[min(now, own_last + 1)] << shift
+
+    full = _copies(board.full, size, count)
+    first_column = _copies(board.full & ~board.not_first_column, size, count)
+    top = _copies((1 << width) - 1, size, count)
+    bottom = top << (size - width)
+    not_first_column, not_last_column = full & ~first_column, full & ~(first_column << (width - 1))
+
+    def spread(bits):
+        # Board.spread, kept from stepping off one copy onto the next.
+        return (bits | (bits << 1) & not_first_column | (bits >> 1) & not_last_column |
+                (bits << width) & ~top | (bits >> width) & ~bottom) & full
+
+    alive = _sweep(spread, full, last, stacked_deadly, stacked_enter)
+    floor = board.full & ~board.wall
+    return [bool(alive >> (copy * size + cell) & floor >> cell & 1) for copy, cell in enumerate(cells)]
+
+
+def suicidal_cells(board, cells, radius, bomb_bag):
+    """The cells of ``cells`` (an int) where a player with ``radius`` and ``bomb_bag`` cannot survive its own new bomb.
+
+    The player stands on the bomb it has just placed, with every bomb already
+    on ``board`` still ticking.
+    """
+    fuse = bomb_timer(bomb_bag)
+    key = _key(board)
+    suicidal, unknown = 0, []
+    for cell in cells_of(cells):
+        found = _suicidal.get((key, cell, radius, fuse))
+        if found is None:
+            unknown.append(cell)
+        elif found:
+            suicidal |= 1 << cell
+    if unknown:
+        if len(_suicidal) >= MEMO_SIZE:
+            _suicidal.clear()
+        for cell, survives in zip(unknown, _stacked_survivors(board, unknown, radius, fuse)):
+            _suicidal[key, cell, radius, fuse] = not survives
+            if not survives:
+                suicidal |= 1 << cell
+    return suicidal
+
+
+def _survives_alone(board, cell, radius, bomb_bag):
+    """``suicidal_cells`` for one cell the long way, with an ``Escapes`` of its own."""
+    placed = board.copy()
+    placed.bomb_list = board.bomb_list + ((cell, bomb_timer(bomb_bag), radius, -1),)
+    placed.bombs = board.bombs | 1 << cell
+    return Escapes(placed).survives(cell)
+
+
+def _survives(sim, index, last, now=0, seen=None):
+    """Whether player ``index`` can live to round ``last`` in ``sim`` by moving, tried move by move."""
+    from simulator import DO_NOTHING, MOVE_DOWN, MOVE_LEFT, MOVE_RIGHT, MOVE_UP
+
+    if now >= last:
+        return True
+    seen = set() if seen is None else seen
+    for action in (DO_NOTHING, MOVE_UP, MOVE_LEFT, MOVE_RIGHT, MOVE_DOWN):
+        mark = sim.mark()
+        try:
+            sim.step([action if other == index else None for other in range(len(sim.killed))])
+            key = now + 1, sim.position[index]
+            if sim.killed[index] or key in seen:
+                continue
+            seen.add(key)
+            if _survives(sim, index, last, now + 1, seen):
+                return True
+        finally:
+            sim.undo(mark)
+    return False
+
+
+def _check(state):
+    """Compare ``survivors``, ``distance`` and ``suicidal_cells`` on ``state`` with the simulator and ``distance``."""
+    import numpy as np
+
+    import distance
+    from bitboard import Board
+    from simulator import Simulator
+
+    board = Board.from_state(state)
+    found = Escapes(board)
+    alone = [player for player in state.players if not player.killed][:1]
+    if not alone:
+        return
+    index = alone[0].index
+    sim = Simulator(state, seed=0)
+    for other in range(len(state.players)):
+        if other != index:
+            sim.on_map[other], sim.killed[other] = False, True
+    # Cells a blast or a bomb is near enough to matter, everything else trivially survives.
+    near = board.bombs
+    for cells in found.deadly:
+        near |= cells
+    near = board.spread(board.spread(near))
+    floor = board.full & ~board.wall & ~board.destructible
+    for cell in cells_of(near & (floor | board.bombs)):
+        sim.position[index] = cell
+        assert found.survives(cell) == _survives(sim, index, found.last), 'survivors at {}'.format(cell)
+    assert found.survivors & ~near & floor == ~near & floor, 'survivors away from the bombs'
+
+    # escape_distance knows only the first blast on every cell and never clears a wall, so compare where that is all.
+    rounds = board.resolve()[0]
+    caught, overlap = 0, 0
+    for cells in rounds.values():
+        overlap |= caught & cells
+        caught |= cells
+    simple = not overlap and not caught & board.destructible
+    passable = distance.open_cells(state)
+    danger = np.frombuffer(board.danger(), dtype=np.uint8).reshape(passable.shape)
+    bombs = distance.bomb_cells(state)
+    for cell in cells_of(floor & ~board.bombs):
+        steps = found.distance(cell)
+        assert steps == UNREACHED or found.survives(cell), 'distance without surviving at {}'.format(cell)
+        if simple and not found.deadly[0] >> cell & 1:
+            assert steps == distance.escape_distance(passable, cell, danger, bombs), 'distance at {}'.format(cell)
+
+    player = state.players[index]
+    candidates = floor & ~board.bombs & near
+    suicidal = suicidal_cells(board, candidates, player.bomb_radius, player.bomb_bag)
+    fuse = bomb_timer(player.bomb_bag)
+    for cell in cells_of(candidates):
+        assert bool(suicidal >> cell & 1) != _survives_alone(board, cell, player.bomb_radius, player.bomb_bag), \
+            'suicidal_cells against Escapes at {}'.format(cell)
+        sim.detonates[cell] = sim.round + fuse
+        sim.bomb_radius[cell], sim.bomb_owner[cell] = player.bomb_radius, index
+        sim.position[index] = cell
+        last = max(found.last, fuse)
+        assert bool(suicidal >> cell & 1) == (not _survives(sim, index, last)), 'suicidal at {}'.format(cell)
+        del sim.detonates[cell], sim.bomb_radius[cell], sim.bomb_owner[cell]
+
+
+def _benchmark(scenarios):
+    import timeit
+
+    import numpy as np
+
+    import distance
+    from bitboard import Board
+
+    def report(name, call):
+        timer = timeit.Timer(call)
+        number, _ = timer.autorange()
+        seconds = min(timer.repeat(3, number)) / number
+        print('  {:<36} {:8.1f} us'.format(name, seconds * 1e6))
+
+    for name, state, _ in scenarios:
+        _check(state)
+        board = Board.from_state(state)
+        print('{} ({}x{}, {} bombs): escapes agree with the simulator'.format(
+            name, state.width, state.height, len(board.bomb_list)))
+        report('Escapes, every start cell', lambda: Escapes(board))
+        alive = [player for player in state.players if not player.killed]
+        if not alive:
+            continue
+        player = alive[0]
+        cell = player.y * state.width + player.x
+        passable = distance.open_cells(state)
+        danger = np.frombuffer(board.danger(), dtype=np.uint8).reshape(passable.shape)
+        bombs = distance.bomb_cells(state)
+        report('distance.escape_distance, one cell', lambda: distance.escape_distance(passable, cell, danger, bombs))
+        report('Escapes.distance, one cell', lambda: Escapes(board).distance(cell))
+        candidates = board.spread(1 << cell) & board.open_cells() & ~board.bombs
+        count = bin(candidates).count('1')
+        report('Escapes per candidate, {} cells'.format(count),
+               lambda: [_survives_alone(board, cell, player.bomb_radius, player.bomb_bag)
+                        for cell in cells_of(candidates)])
+        report('suicidal_cells, {} cells'.format(count),
+               lambda: (_suicidal.clear(), suicidal_cells(board, candidates, player.bomb_radius, player.bomb_bag)))
+
+
+if __name__ == '__main__':
+    import sys
+
+    import benchmarks
+
+    _benchmark(benchmarks.scenarios(sys.argv[1:]))
@@ -0,0 +1,78 @@
+"""Log records kept in memory during a round and written out after the move.
+
+The engine reads the bot's stdout line by line, and p3.log takes a write per
+record, so logging as the round goes costs search time.  ``install`` puts a
+``RoundHandler`` (a ``QueueHandler`` on a bounded queue) in front of the real
+handlers instead: records are formatted and queued, nothing is written, and a
+full queue drops records rather than wait.  ``flush`` hands the queued records
+to the handlers through a ``QueueListener`` once move.txt is written.
+
+If a limit is set (the time the engine stops waiting for the bot) ``flush``
+only writes records below warning while there are more than ``CUTOFF`` seconds
+left, so diagnostics never hold up a round that is already late.  Records
+dropped either way are counted in a warning at the end of the flush.
+"""
+import atexit
+import logging
+import logging.handlers
+import queue
+import time
+
+CAPACITY = 1000
+CUTOFF = 0.1
+
+_handler = None
+_listener = None
+
+
+class RoundHandler(logging.handlers.QueueHandler):
+    """Queues records for ``flush``, dropping them when the queue is full."""
+
+    def __init__(self, capacity=CAPACITY):
+        super().__init__(queue.Queue(capacity))
+        self.limit = None
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def install(handlers, capacity=CAPACITY):
+    """Send the root logger's records through a ``RoundHandler`` to ``handlers``."""
+    global _handler, _listener
+    _handler = RoundHandler(capacity)
+    _listener = logging.handlers.QueueListener(_handler.queue, *handlers, respect_handler_level=True)
+    logging.getLogger().addHandler(_handler)
+    # Whatever is still queued when the process ends, e.g. after an uncaught exception.
+    atexit.register(flush)
+
+
+def set_limit(limit):
+    """``time.monotonic`` value after which the round is lost anyway, None for no limit."""
+    if _handler is not None:
+        _handler.limit = limit
+
+
+def flush():
+    """Write out the records queued so far."""
+    if _handler is None:
+        return
+    records, limit = _handler.queue, _handler.limit
+    while True:
+        try:
+            record = records.get_nowait()
+        except queue.Empty:
+            break
+        if record.levelno < logging.WARNING and limit is not None and time.monotonic() >= limit - CUTOFF:
+            _handler.dropped += 1
+            continue
+        _listener.handle(record)
+    if _handler.dropped:
+        _listener.handle(logging.makeLogRecord({
+            'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING', 'funcName': 'flush',
+            'msg': 'Dropped {} log records'.format(_handler.dropped),
+        }))
+        _handler.dropped = 0
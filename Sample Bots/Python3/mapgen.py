@@ -0,0 +1,357 @@
+"""Python port of the engine's map generator, seed for seed.
+
+``generate(players, seed)`` makes the same round 0 map as
+``GameMapGenerator.GenerateGameMap(seed)`` does for that many players, written
+straight into a compact ``state.State``, power ups under walls included:
+
+* the map is 21, 31 or 41 cells square for up to 4, 8 and 12 players, with
+  indestructible walls around the edge and on every cell with odd engine
+  coordinates, and players placed along the sides (in the corners for four);
+* destructible walls are rolled for one quadrant and mirrored into the others,
+  kept out of two cells around every player, with one wall three cells along
+  from every player and the middle of the map filled in;
+* two bomb bag and four bomb radius power ups per player are hidden under
+  walls, by ``DistanceBasedPowerUpGenerator`` for four players (maps it finds
+  unsuitable are drawn again from the next seed) and ``RandomPowerUpGenerator``
+  otherwise, and the super power up is put in the middle.
+
+The random numbers come from ``DotNetRandom``, a port of the seeded
+``System.Random``, and are drawn in the engine's order.  Everything that does
+not depend on them is worked out once per player count (see ``Layout``), which
+leaves a few hundred random numbers and byte writes per map.
+
+Run this module to time bulk generation.
+"""
+import array
+import collections
+
+import mapindex
+from state import BOMB_BAG, BOMB_RADIUS, SUPER_POWER_UP, Player, State
+
+# GameEngine/Properties/Settings.settings
+SMALL_MAP_SIZE = 21
+MEDIUM_MAP_SIZE = 31
+LARGE_MAP_SIZE = 41
+DEFAULT_BOMB_BAG = 1
+DEFAULT_BOMB_RADIUS = 1
+DESTRUCTIBLE_WALL_FREQUENCY = 0.35
+BOMB_BAG_POWER_UP_MULTIPLIER = 2
+BOMB_RADIUS_POWER_UP_MULTIPLIER = 4
+
+SAFE_ZONE_SIZE = 2
+POWER_UPS_PER_PLAYER = 6
+QUADRANTS = 4
+
+_INT_MAX = 2147483647
+_MBIG = _INT_MAX
+_MSEED = 161803398
+
+# Where the seeding loops of the Random(int) constructor read and write, in order.
+_SEED_ORDER = [21 * i % 55 for i in range(1, 55)]
+_SEED_MIX = [(i, 1 + (i + 30) % 55) for i in range(1, 56)] * 4
+
+_layouts = {}
+
+
+class DotNetRandom(object):
+    """``System.Random(seed)``: Knuth's subtractive generator as the .NET Framework seeds and runs it."""
+    __slots__ = ('_seeds', '_next', '_nextp')
+
+    def __init__(self, seed):
+        seeds = [0] * 56
+        subtraction = _INT_MAX if seed == -_INT_MAX - 1 else abs(seed)
+        mj = _MSEED - subtraction
+        seeds[55] = mj
+        mk = 1
+        for ii in _SEED_ORDER:
+            seeds[ii] = mk
+            mk = mj - mk
+            if mk < 0:
+                mk += _MBIG
+            mj = seeds[ii]
+        for i, other in _SEED_MIX:
+            value = seeds[i] - seeds[other]
+            # seeds[55] starts out negative for seeds above _MSEED, and the int subtraction wraps around.
+            if value < -_INT_MAX - 1:
+                value += 2 ** 32
+            elif value > _INT_MAX:
+                value -= 2 ** 32
+            if value < 0:
+                value += _MBIG
+            seeds[i] = value
+        self._seeds = seeds
+        self._next = 0
+        self._nextp = 21
+
+    def _sample(self):
+        seeds = self._seeds
+        position = self._next + 1
+        if position >= 56:
+            position = 1
+        other = self._nextp + 1
+        if other >= 56:
+            other = 1
+        value = seeds[position] - seeds[other]
+        if value == _MBIG:
+            value -= 1
+        if value < 0:
+            value += _MBIG
+        seeds[position] = value
+        self._next = position
+        self._nextp = other
+        return value
+
+    def sample(self):
+        """``Sample()``: a float in [0, 1)."""
+        return self._sample() * (1.0 / _MBIG)
+
+    def next(self, low=None, high=None):
+        """``Next()``, ``Next(high)`` with one argument or ``Next(low, high)`` with two."""
+        if low is None:
+            return self._sample()
+        if high is None:
+            low, high = 0, low
+        return int(self._sample() * (1.0 / _MBIG) * (high - low)) + low
+
+    def next_many(self, count, low, high):
+        """``count`` calls of ``Next(low, high)`` in one go."""
+        seeds, position, other = self._seeds, self._next, self._nextp
+        scale = 1.0 / _MBIG
+        span = high - low
+        values = []
+        for _ in range(count):
+            position = 1 if position == 55 else position + 1
+            other = 1 if other == 55 else other + 1
+            value = seeds[position] - seeds[other]
+            if value == _MBIG:
+                value -= 1
+            if value < 0:
+                value += _MBIG
+            seeds[position] = value
+            values.append(int(value * scale * span) + low)
+        self._next, self._nextp = position, other
+        return values
+
+
+def map_size(players):
+    if not 2 <= players <= 12:
+        raise ValueError('Number of players should be between 2 and 12, not {}'.format(players))
+    if players <= 4:
+        return SMALL_MAP_SIZE
+    if players <= 8:
+        return MEDIUM_MAP_SIZE
+    return LARGE_MAP_SIZE
+
+
+def player_location(number, players, size):
+    """``PlacePlayerOnMap``: engine coordinates of player ``number`` (from 1) of ``players``."""
+    per_side = -(-players // 4)
+    side = (number - 1) % 4 + 1
+    position = -(-number // 4)
+    along = size // per_side
+    if side == 1:
+        return along * position - along + 2, 2
+    if side == 2:
+        return size + along - along * position - 1, size - 1
+    if side == 3:
+        return 2, size + along - along * position - 1
+    return size - 1, along * position - along + 2
+
+
+class Layout(object):
+    """Everything about the maps for one player count that the random numbers do not change.
+
+    ``rolls`` holds, in the order the engine draws them, the open cells every
+    destructible wall roll decides (a cell of the rolled quadrant and its
+    mirror images), ``fixed`` the cells that get a wall whatever is rolled.
+    """
+
+    def __init__(self, players):
+        self.players = players
+        self.size = size = map_size(players)
+        self.cells = size * size
+        # The middle is still an indestructible wall while the walls are laid, the super power up clears it later.
+        self.middle = (size // 2) * size + size // 2
+        wall = bytearray(mapindex.lattice(size, size))
+        wall[self.middle] = 1
+        self.locations = [player_location(number, players, size) for number in range(1, players + 1)]
+        taken = set(self.cell(x, y) for x, y in self.locations)
+
+        def near_player(x, y):
+            return any((x - px) ** 2 + (y - py) ** 2 < SAFE_ZONE_SIZE ** 2 for px, py in self.locations)
+
+        def open_cells(x, y):
+            """``GenerateDesctructableWall`` on ``(x, y)`` and its mirror images, the cells a wall could go on."""
+            found = []
+            for mx, my in ((x, y), (size + 1 - x, y), (x, size + 1 - y), (size + 1 - x, size + 1 - y)):
+                cell = self.cell(mx, my)
+                if not wall[cell] and cell not in taken and not near_player(mx, my) and cell not in found:
+                    found.append(cell)
+            return tuple(found)
+
+        width, height = size // 2 + 2, size // 2 + 2
+        self.rolls = [open_cells(x, y) for x in range(1, width) for y in range(1, height)]
+        fixed = set()
+        for x in range(width - 2, width + 2):
+            for y in range(height - 2, height + 2):
+                fixed.update(open_cells(x, y))
+        # GenerateWallAroundPlayer: one wall three cells along the side every player starts on.
+        for x, y in self.locations:
+            spots = []
+            if y in (2, size - 1):
+                spots.append((x + 3 if x + 3 < size else x - 3, y))
+            if x in (2, size - 1):
+                spots.append((x, y + 3 if y + 3 < size else y - 3))
+            for sx, sy in spots:
+                cell = self.cell(sx, sy)
+                if not wall[cell] and cell not in taken:
+                    fixed.add(cell)
+        self.fixed = sorted(fixed)
+        self.wall = array.array('b', mapindex.lattice(size, size))
+
+        # DistanceBasedPowerUpGenerator looks at the quadrant in front of every corner, by distance from it.
+        quadrant = size // 2
+        self.by_distance = [collections.OrderedDict() for _ in range(QUADRANTS)]
+        for number, by_distance in enumerate(self.by_distance):
+            for x in range(1, quadrant):
+                for y in range(1, quadrant):
+                    by_distance.setdefault(x - 1 + y - 1, []).append(self.quadrant_cell(number, x, y))
+
+    def cell(self, x, y):
+        """Flat index of the engine location ``(x, y)``."""
+        return (y - 1) * self.size + x - 1
+
+    def quadrant_cell(self, quadrant, x, y):
+        """``ToQuadrantLocation``: ``(x, y)`` of the top left quadrant mirrored into ``quadrant``."""
+        mirror = self.size + 1
+        if quadrant == 1:
+            return self.cell(mirror - x, y)
+        if quadrant == 2:
+            return self.cell(x, mirror - y)
+        if quadrant == 3:
+            return self.cell(mirror - x, mirror - y)
+        return self.cell(x, y)
+
+
+def layout(players):
+    found = _layouts.get(players)
+    if found is None:
+        found = _layouts[players] = Layout(players)
+    return found
+
+
+def _destructible_walls(layout, rng):
+    destructible = bytearray(layout.cells)
+    frequency = DESTRUCTIBLE_WALL_FREQUENCY * 100
+    for cells, roll in zip(layout.rolls, rng.next_many(len(layout.rolls), 0, 100)):
+        if roll < frequency:
+            for cell in cells:
+                destructible[cell] = 1
+    for cell in layout.fixed:
+        destructible[cell] = 1
+    return destructible
+
+
+def _random_power_ups(layout, rng, destructible, power_up):
+    """``RandomPowerUpGenerator``: power ups under walls picked by trial and error, quadrant by quadrant."""
+    players = layout.players
+    end = layout.size // 2 + 1
+    for number in range(QUADRANTS):
+        for kind, multiplier, quadrant in ((BOMB_BAG, BOMB_BAG_POWER_UP_MULTIPLIER, QUADRANTS - number),
+                                           (BOMB_RADIUS, BOMB_RADIUS_POWER_UP_MULTIPLIER, number)):
+            count = multiplier * players // QUADRANTS
+            while count > 0:
+                x = rng.next(1, end)
+                y = rng.next(1, end)
+                cell = layout.quadrant_cell(quadrant, x, y)
+                if not power_up[cell] and destructible[cell]:
+                    power_up[cell] = kind
+                    count -= 1
+
+
+def _distance_bands(layout, destructible):
+    """Walls in the top left quadrant by their distance from the corner."""
+    return collections.Counter({distance: sum(destructible[cell] for cell in cells)
+                                for distance, cells in layout.by_distance[0].items()})
+
+
+def _distance_power_ups(layout, rng, destructible, power_up, bands):
+    """``DistanceBasedPowerUpGenerator``: the same power ups at the same distances from every corner."""
+    first = rng.next(0, 3)
+    order = [BOMB_BAG if (first + number) % 3 == 0 else BOMB_RADIUS for number in range(POWER_UPS_PER_PLAYER)]
+
+    distances = sorted(distance for distance, count in bands.items() if count)
+    plan = [distance for distance in distances if bands[distance] > 1]
+    # At least one power up within five steps of the start, outside the safe zone.
+    if plan and plan[0] > 5:
+        for distance in distances:
+            if distance > 2:
+                plan.insert(0, distance)
+                break
+    while len(plan) > POWER_UPS_PER_PLAYER:
+        del plan[rng.next(1, 4)]
+    plan.sort()
+
+    for by_distance in layout.by_distance:
+        for kind, distance in zip(order, plan):
+            walls = [cell for cell in by_distance[distance] if destructible[cell]]
+            if not walls:
+                raise ValueError('GameMapGenerator finds no wall {} cells from a corner'.format(distance))
+            cell = walls[rng.next(len(walls))]
+            if power_up[cell]:
+                raise ValueError('GameMapGenerator puts two power ups on one cell')
+            power_up[cell] = kind
+
+
+def generate(players, seed):
+    """Round 0 ``State`` of the map the engine generates for ``players`` players from ``seed``."""
+    found = layout(players)
+    seeds = DotNetRandom(seed)
+    while True:
+        rng = DotNetRandom(seeds.next())
+        destructible = _destructible_walls(found, rng)
+        power_up = bytearray(found.cells)
+        if players == 4:
+            bands = _distance_bands(found, destructible)
+            # IsMapSuitable: more distances with several walls than power ups per player.
+            if sum(1 for count in bands.values() if count > 1) <= POWER_UPS_PER_PLAYER:
+                continue
+            _distance_power_ups(found, rng, destructible, power_up, bands)
+        else:
+            _random_power_ups(found, rng, destructible, power_up)
+        break
+
+    destructible[found.middle] = 0
+    power_up[found.middle] = SUPER_POWER_UP
+    size = found.size
+    state = State(size, size, 0, seed)
+    state.wall = array.array('b', found.wall)
+    state.destructible = array.array('b', destructible)
+    state.power_up = array.array('b', power_up)
+    for index, (x, y) in enumerate(found.locations):
+        state.players.append(Player(index, chr(ord('A') + index % 26), None, 0, False,
+                                    DEFAULT_BOMB_BAG, DEFAULT_BOMB_RADIUS, x - 1, y - 1))
+    return state
+
+
+def generate_many(players, seeds):
+    """``generate`` for every seed in ``seeds``, as a generator."""
+    for seed in seeds:
+        yield generate(players, seed)
+
+
+def _benchmark(count=2000):
+    import time
+
+    for players in (2, 4, 8, 12):
+        layout(players)
+        started = time.perf_counter()
+        for _ in generate_many(players, range(count)):
+            pass
+        elapsed = time.perf_counter() - started
+        print('{:>2} players, {}x{}: {:8.0f} maps/s'.format(players, layout(players).size, layout(players).size,
+                                                           count / elapsed))
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,157 @@
+"""Static geometry of the map, worked out once and kept next to the bot.
+
+``GameMapGenerator`` puts indestructible walls around the edge and on every
+cell with odd engine coordinates, whatever the seed, and the power up generator
+always clears the one in the middle for the super power up.  Everything that
+only depends on the walls is therefore the same for all maps of a size:
+
+* ``steps``: the open cell one step in each direction of every cell, in the
+  engine's command order (up, left, right, down), ``-1`` where a wall is.
+* rays: every cell each direction could be blasted in from a bomb on a cell,
+  stopping at the first indestructible wall.  ``ray(cell, direction, radius)``
+  cuts one down to a bomb's radius.
+
+``for_state`` looks the index up in memory, then in ``mapindex-<w>x<h>.bin``
+next to the bot, and only builds (and saves) it if neither matches the walls of
+the state.  The file holds a small header followed by the raw int32 tables.
+"""
+import array
+import logging
+import os
+import struct
+
+UP = 0
+LEFT = 1
+RIGHT = 2
+DOWN = 3
+DIRECTIONS = ((0, -1), (-1, 0), (1, 0), (0, 1))
+
+MAGIC = b'BMBINDEX'
+VERSION = 2
+INDEX_DIR = os.environ.get('BOT_CACHE_DIR', os.path.dirname(os.path.abspath(__file__)))
+
+# magic, version, width, height, ray cells.
+_HEADER = struct.Struct('<8sHHHi')
+_TABLES = ('steps', 'ray_start', 'ray_cells')
+
+_indexes = {}
+
+logger = logging.getLogger(__name__)
+
+
+def lattice(width, height):
+    """Indestructible walls as ``GenerateIndestructableWalls`` lays them out, one byte per cell."""
+    wall = bytearray(width * height)
+    for y in range(height):
+        for x in range(width):
+            if x in (0, width - 1) or y in (0, height - 1) or (x % 2 == 0 and y % 2 == 0):
+                wall[y * width + x] = 1
+    # The super power up goes in the middle, where the generator removes the wall again.
+    wall[height // 2 * width + width // 2] = 0
+    return bytes(wall)
+
+
+class MapIndex(object):
+
+    def __init__(self, width, height, wall):
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.wall = bytes(wall)
+        for name in _TABLES:
+            setattr(self, name, array.array('i'))
+
+    @classmethod
+    def build(cls, width, height, wall=None):
+        index = cls(width, height, lattice(width, height) if wall is None else wall)
+        index._build_steps()
+        index._build_rays()
+        return index
+
+    def _cell(self, x, y):
+        """Flat index of ``(x, y)``, or -1 off the map or on a wall."""
+        if 0 <= x < self.width and 0 <= y < self.height and not self.wall[y * self.width + x]:
+            return y * self.width + x
+        return -1
+
+    def _build_steps(self):
+        for cell in range(self.size):
+            y, x = divmod(cell, self.width)
+            self.steps.extend(self._cell(x + dx, y + dy) for dx, dy in DIRECTIONS)
+
+    def _build_rays(self):
+        for cell in range(self.size):
+            y, x = divmod(cell, self.width)
+            for dx, dy in DIRECTIONS:
+                self.ray_start.append(len(self.ray_cells))
+                distance = 1
+                while not self.wall[cell] and self._cell(x + dx * distance, y + dy * distance) >= 0:
+                    self.ray_cells.append((y + dy * distance) * self.width + x + dx * distance)
+                    distance += 1
+        self.ray_start.append(len(self.ray_cells))
+
+    def neighbours(self, cell):
+        """Open cells next to ``cell``."""
+        return [other for other in self.steps[4 * cell:4 * cell + 4] if other >= 0]
+
+    def ray(self, cell, direction, radius=None):
+        """Cells a blast from ``cell`` reaches in ``direction`` going ``radius`` cells, walls allowing."""
+        start, end = self.ray_start[4 * cell + direction], self.ray_start[4 * cell + direction + 1]
+        if radius is not None:
+            end = min(end, start + radius)
+        return self.ray_cells[start:end]
+
+    def dump(self):
+        parts = [_HEADER.pack(MAGIC, VERSION, self.width, self.height, len(self.ray_cells)), self.wall]
+        parts.extend(getattr(self, name).tobytes() for name in _TABLES)
+        return b''.join(parts)
+
+    @classmethod
+    def load(cls, data):
+        """Index from the output of ``dump``, or None if ``data`` is not one."""
+        if len(data) < _HEADER.size:
+            return None
+        magic, version, width, height, rays = _HEADER.unpack_from(data)
+        if (magic, version) != (MAGIC, VERSION):
+            return None
+        size = width * height
+        lengths = (4 * size, 4 * size + 1, rays)
+        if len(data) != _HEADER.size + size + 4 * sum(lengths):
+            return None
+        offset = _HEADER.size + size
+        index = cls(width, height, data[_HEADER.size:offset])
+        for name, length in zip(_TABLES, lengths):
+            getattr(index, name).frombytes(data[offset:offset + 4 * length])
+            offset += 4 * length
+        return index
+
+
+def index_path(width, height, directory=INDEX_DIR):
+    return os.path.join(directory, 'mapindex-{}x{}.bin'.format(width, height))
+
+
+def for_state(state, directory=INDEX_DIR):
+    """``MapIndex`` for the walls of ``state``, from memory, from disk or built and saved."""
+    wall = bytes(state.wall)
+    index = _indexes.get(wall)
+    if index is not None:
+        return index
+
+    path = index_path(state.width, state.height, directory)
+    try:
+        with open(path, 'rb') as f:
+            index = MapIndex.load(f.read())
+    except OSError:
+        index = None
+    if index is None or index.wall != wall:
+        index = MapIndex.build(state.width, state.height, wall)
+        try:
+            with open(path + '.tmp', 'wb') as f:
+                f.write(index.dump())
+            os.replace(path + '.tmp', path)
+        except OSError:
+            logger.exception('Cannot save map index {}'.format(path))
+        else:
+            logger.info('Saved map index {}'.format(path))
+    _indexes[wall] = index
+    return index
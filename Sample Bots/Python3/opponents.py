@@ -0,0 +1,261 @@
+"""What every opponent tends to do, learnt from the rounds seen so far.
+
+Between two consecutive rounds the command every opponent gave can be read off
+the states: it moved (towards the nearest target on ``diff.Derived``'s
+distance field, or not), a bomb of its own appeared where it stood, one of its
+bombs jumped to a fuse of one, or none of those.  ``OpponentModel.observe``
+counts those five kinds of command by the situation the opponent was in, and
+the situation is five yes/no questions about its cell: is a blast due there,
+can it place a bomb, is a destructible wall next to it, does it have bombs on
+the map, is another player within ``NEAR`` steps.
+
+Counts are kept by player name (the engine's NickName for the bot, the same one
+roundInfo.json lists), so they carry over from match to match, in
+``opponents.bin`` next to the search cache: a header, then per opponent its
+name and ``SITUATIONS * KINDS`` 16 bit counts.  A situation whose counts reach
+``HALVE_AT`` is halved, so the counts follow a bot that changes.
+
+``OpponentModel.replies`` turns the counts into likely commands for the
+opponents close to us, and the joint replies worth searching against.  An
+opponent with fewer than ``MIN_OBSERVATIONS`` rounds seen is left standing
+still, which is what the search assumed for everyone before.
+"""
+import array
+import itertools
+import logging
+import os
+import struct
+
+import danger
+from cache import CACHE_DIR
+from simulator import DO_NOTHING, MOVE_DOWN, MOVE_LEFT, MOVE_RIGHT, MOVE_UP, PLACE_BOMB, TRIGGER_BOMB
+
+MAGIC = b'BMBOPPNT'
+VERSION = 1
+
+# Kinds of command.
+NOTHING = 0
+TOWARDS = 1
+AWAY = 2
+BOMB = 3
+TRIGGER = 4
+KINDS = 5
+
+# Situation bits.
+IN_DANGER = 1
+CAN_BOMB = 2
+NEXT_TO_WALL = 4
+BOMBS_OUT = 8
+PLAYER_NEAR = 16
+SITUATIONS = 32
+
+NEAR = 3
+HALVE_AT = 1000
+MIN_OBSERVATIONS = 5
+# Opponents further than this from us are left standing still by the search.
+REPLY_RANGE = 4
+# Commands less likely than this are not searched, nor more than so many joint replies.
+MIN_LIKELIHOOD = 0.1
+MAX_REPLIES = 4
+
+_HEADER = struct.Struct('<8sHHH')
+_NAME = struct.Struct('<H')
+
+logger = logging.getLogger(__name__)
+
+
+def model_path(directory=CACHE_DIR):
+    return os.path.join(directory, 'opponents.bin')
+
+
+def _moves(width):
+    return ((MOVE_UP, -width), (MOVE_LEFT, -1), (MOVE_RIGHT, 1), (MOVE_DOWN, width))
+
+
+def situation(state, danger_map, index):
+    """Situation bits of player ``index`` in ``state``, ``danger_map`` being its ``danger.resolve`` grid as bytes."""
+    player = state.players[index]
+    width = state.width
+    cell = player.y * width + player.x
+    owned = sum(1 for _, _, _, owner in state.bombs() if owner == index)
+    bits = 0
+    if danger_map[cell] != danger.SAFE:
+        bits |= IN_DANGER
+    if player.bomb_bag > owned and not state.bomb_fuse[cell]:
+        bits |= CAN_BOMB
+    if any(state.destructible[cell + step] for _, step in _moves(width)):
+        bits |= NEXT_TO_WALL
+    if owned:
+        bits |= BOMBS_OUT
+    if any(other.index != index and not other.killed and abs(other.x - player.x) + abs(other.y - player.y) <= NEAR
+           for other in state.players):
+        bits |= PLAYER_NEAR
+    return bits
+
+
+def command_kind(old, new, distance, index):
+    """Kind of command player ``index`` gave between ``old`` and the next round's ``new``."""
+    before, after = old.players[index], new.players[index]
+    width = old.width
+    cell = before.y * width + before.x
+    moved_to = after.y * width + after.x
+    if moved_to != cell:
+        return TOWARDS if distance[moved_to] < distance[cell] else AWAY
+    if new.bomb_owner[cell] == index and not old.bomb_fuse[cell]:
+        return BOMB
+    for bomb, fuse, _, owner in old.bombs():
+        # A triggered bomb goes off next round whatever its fuse was.
+        if owner == index and fuse > 2 and new.bomb_fuse[bomb] == 1:
+            return TRIGGER
+    return NOTHING
+
+
+class OpponentModel(object):
+    """Command counts by opponent name and situation, see the module docstring."""
+
+    def __init__(self, counts=None, path=None):
+        self.counts = {} if counts is None else counts
+        self.path = path
+        self.changed = False
+
+    @classmethod
+    def load(cls, path=None):
+        """The model saved at ``path``, or an empty one if there is none that can be read."""
+        path = path or model_path()
+        counts = {}
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return cls(counts, path)
+        try:
+            magic, version, situations, kinds = _HEADER.unpack_from(data)
+            if (magic, version, situations, kinds) != (MAGIC, VERSION, SITUATIONS, KINDS):
+                raise ValueError('not a model of this version')
+            offset, length = _HEADER.size, 2 * SITUATIONS * KINDS
+            while offset < len(data):
+                size, = _NAME.unpack_from(data, offset)
+                offset += _NAME.size
+                name = data[offset:offset + size].decode('utf-8')
+                offset += size
+                counts[name] = array.array('H', data[offset:offset + length])
+                offset += length
+        except (ValueError, struct.error, UnicodeDecodeError):
+            logger.warning('Starting over, cannot read opponent model {}'.format(path))
+            counts = {}
+        return cls(counts, path)
+
+    def save(self):
+        """Write the counts out if they changed, replacing the file in one go."""
+        if not self.changed:
+            return
+        parts = [_HEADER.pack(MAGIC, VERSION, SITUATIONS, KINDS)]
+        for name, counts in sorted(self.counts.items()):
+            encoded = name.encode('utf-8')
+            parts.extend((_NAME.pack(len(encoded)), encoded, counts.tobytes()))
+        partial = self.path + '.partial'
+        try:
+            with open(partial, 'wb') as f:
+                f.write(b''.join(parts))
+            os.replace(partial, self.path)
+        except OSError:
+            logger.exception('Cannot save opponent model {}'.format(self.path))
+            return
+        self.changed = False
+
+    def _counts(self, name):
+        counts = self.counts.get(name)
+        if counts is None:
+            counts = self.counts[name] = array.array('H', bytes(2 * SITUATIONS * KINDS))
+        return counts
+
+    def observe(self, previous, state, player_key=None):
+        """Count what every opponent did from ``previous`` (a ``diff.Derived``) to ``state``, the round after it.
+
+        The previous state comes out of the cache without names, so they are
+        taken from ``state``.  Returns the number of commands counted.
+        """
+        old = previous.state
+        if state.round != old.round + 1 or len(state.players) != len(old.players):
+            return 0
+        seen = 0
+        for before, after in zip(old.players, state.players):
+            if after.key == player_key or before.killed or after.killed or not after.name:
+                continue
+            counts = self._counts(after.name)
+            offset = situation(old, previous.danger, before.index) * KINDS
+            counts[offset + command_kind(old, state, previous.distance, before.index)] += 1
+            if max(counts[offset:offset + KINDS]) >= HALVE_AT:
+                for kind in range(offset, offset + KINDS):
+                    counts[kind] //= 2
+            seen += 1
+        self.changed = self.changed or bool(seen)
+        return seen
+
+    def kinds(self, name, bits):
+        """Likelihood of every kind of command by ``name`` in situation ``bits``, or None if too little is known."""
+        counts = self.counts.get(name)
+        if counts is None:
+            return None
+        found = counts[bits * KINDS:(bits + 1) * KINDS].tolist()
+        if sum(found) < MIN_OBSERVATIONS:
+            # Fall back on what it does in any situation.
+            found = [sum(counts[kind::KINDS]) for kind in range(KINDS)]
+            if sum(found) < MIN_OBSERVATIONS:
+                return None
+        total = float(sum(found))
+        return [count / total for count in found]
+
+    def commands(self, state, derived, index):
+        """``{command: likelihood}`` of player ``index`` in ``state`` (whose maps ``derived`` holds), or None."""
+        player = state.players[index]
+        bits = situation(state, derived.danger, index)
+        likelihood = self.kinds(player.name, bits)
+        if likelihood is None:
+            return None
+        width = state.width
+        cell = player.y * width + player.x
+        occupied = {other.y * width + other.x for other in state.players if not other.killed}
+        towards, away = [], []
+        for command, step in _moves(width):
+            target = cell + step
+            if state.wall[target] or state.destructible[target] or state.bomb_fuse[target] or target in occupied:
+                continue
+            (towards if derived.distance[target] < derived.distance[cell] else away).append(command)
+
+        found = {DO_NOTHING: likelihood[NOTHING]}
+        for kind, options in ((TOWARDS, towards), (AWAY, away), (BOMB, [PLACE_BOMB] if bits & CAN_BOMB else []),
+                              (TRIGGER, [TRIGGER_BOMB] if bits & BOMBS_OUT else [])):
+            if not options:
+                # It cannot do that here, so it most likely gives a command that fails.
+                found[DO_NOTHING] += likelihood[kind]
+                continue
+            for command in options:
+                found[command] = found.get(command, 0.0) + likelihood[kind] / len(options)
+        return found
+
+    def replies(self, state, derived, me):
+        """Up to ``MAX_REPLIES`` likely ``(likelihood, {index: command})`` of the opponents near player ``me``.
+
+        Opponents that are further away or not known well enough do nothing.
+        An empty ``{}`` reply is all there is when nobody is close.
+        """
+        mine = state.players[me]
+        choices = []
+        for player in state.players:
+            if player.index == me or player.killed or abs(player.x - mine.x) + abs(player.y - mine.y) > REPLY_RANGE:
+                continue
+            commands = self.commands(state, derived, player.index)
+            if commands is None:
+                continue
+            likely = sorted(((chance, command) for command, chance in commands.items() if chance >= MIN_LIKELIHOOD),
+                            reverse=True)
+            choices.append([(chance, player.index, command) for chance, command in likely])
+        replies = []
+        for combination in itertools.product(*choices):
+            chance = 1.0
+            for likelihood, _, _ in combination:
+                chance *= likelihood
+            replies.append((chance, {index: command for _, index, command in combination}))
+        replies.sort(key=lambda reply: reply[0], reverse=True)
+        return replies[:MAX_REPLIES]
@@ -0,0 +1,277 @@
+"""Parallel search over a pool of worker processes.
+
+The search is single threaded, so on a machine with cores to spare
+``SearchPool`` splits the tree of the round between worker processes that each
+run ``search.Planner.deepen`` on their share, with a transposition table of
+their own, until the deadline.  Up to seven workers split our first commands
+between them; more split the 49 pairs of our first two commands, so every
+worker up to 49 has a share.  The pool is started once (the daemon starts it
+with ``--workers``) and every worker keeps its table from round to round.  The
+engine starts ``bot.py`` afresh every round, so only a bot handing its rounds
+to a running daemon gets a pool; one playing its round itself searches alone.
+
+The board goes to the workers through one ``multiprocessing.shared_memory``
+block instead of being pickled: the packed state (``state.pack``) followed by
+the ``diff.Derived`` maps, laid out like the search cache.  A job message only
+names the block and carries the player key, the deadline, the worker's share of
+the commands and the opponents' likely replies.
+
+Workers send back ``search.Planner.split_children`` of their share after every
+depth they finish: for each first command, the best value over its second
+commands in the share under every likely reply.  At the deadline the values of
+the deepest depth every worker got to are merged (``search.merge_split``) and
+the best command among them is played, the same choice a single search
+reaching that depth makes.  Commands the engine rejects fail at every depth,
+so a worker left with none of its share does not hold the others back.
+
+Run this module to compare the pool with the single process search on the
+benchmark states, ``--workers`` sets the pool size.
+"""
+import array
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import signal
+import time
+from multiprocessing import shared_memory
+
+import diff
+import search
+import state as compact
+import zobrist
+from simulator import ACTIONS, DO_NOTHING
+
+# Enough for a 41x41 map with 12 players, the block grows if a round needs more.
+BLOCK_SIZE = 64 * 1024
+# Workers stop this much before the deadline so their last depth reaches the pool in time.
+RESULT_MARGIN = 0.005
+
+logger = logging.getLogger(__name__)
+
+
+def _sections(size, players):
+    """Lengths of the packed state, danger, distance and visited sections of the block."""
+    return compact.packed_size(size, players), size, 2 * size, players * size
+
+
+def _write_board(buffer, derived):
+    state = derived.state
+    data = b''.join((compact.pack(state), derived.danger, array.array('h', derived.distance).tobytes(),
+                     b''.join(derived.visited)))
+    buffer[:len(data)] = data
+
+
+def _read_board(buffer, size, players):
+    """``diff.Derived`` (with its state) as ``_write_board`` left it in ``buffer``."""
+    lengths = _sections(size, players)
+    data = bytes(buffer[:sum(lengths)])
+    offset, parts = 0, []
+    for length in lengths:
+        parts.append(data[offset:offset + length])
+        offset += length
+    packed, danger, distance, visited = parts
+    state = compact.unpack(packed)
+    return diff.Derived(state, danger, array.array('h', distance).tolist(),
+                        [bytearray(visited[index * size:(index + 1) * size]) for index in range(players)])
+
+
+def _shares(workers):
+    """For every worker, our first commands it searches with the second commands to search after each.
+
+    Up to seven workers take whole first commands, more split the pairs of first and second commands.
+    """
+    if workers <= len(ACTIONS):
+        return [{action: ACTIONS for action in ACTIONS[worker::workers]} for worker in range(workers)]
+    pairs = [(first, second) for first in ACTIONS for second in ACTIONS]
+    shares = []
+    for worker in range(workers):
+        share = {}
+        for first, second in pairs[worker::workers]:
+            share.setdefault(first, []).append(second)
+        shares.append(share)
+    return shares
+
+
+def _work(connection):
+    """Worker loop: search every job's share of the commands and send each finished depth back."""
+    # Ctrl+C is the daemon's to handle, it closes the pool.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    table = zobrist.TranspositionTable(search.TABLE_BITS)
+    block = None
+    try:
+        while True:
+            try:
+                job = connection.recv()
+            except EOFError:
+                break
+            if job is None:
+                break
+            number, name, size, players, player_key, deadline, seconds, replies = job
+            if block is None or block.name != name:
+                if block is not None:
+                    block.close()
+                block = shared_memory.SharedMemory(name)
+            derived = _read_board(block.buf, size, players)
+            table.new_search()
+            planner = search.Planner(derived.state, player_key, deadline, table, derived)
+            planner.replies = replies
+            for depth, scored in planner.deepen(seconds=seconds):
+                connection.send((number, depth, scored, planner.nodes))
+            connection.send((number, None, None, planner.nodes))
+    finally:
+        if block is not None:
+            block.close()
+
+
+class SearchPool(object):
+    """Worker processes searching the root of every round between them, see the module docstring."""
+
+    def __init__(self, workers=None):
+        workers = workers or os.cpu_count() or 1
+        # Every worker needs a pair of our first two commands of its own to search.
+        self.workers = min(workers, len(ACTIONS) ** 2)
+        # Made before the workers so that they share the pool's resource tracker, which unlinks the block
+        # should the pool die without closing it.
+        self.block = shared_memory.SharedMemory(create=True, size=BLOCK_SIZE)
+        self.jobs = 0
+        self._connections = []
+        self._processes = []
+        context = multiprocessing.get_context()
+        for _ in range(self.workers):
+            ours, theirs = context.Pipe()
+            process = context.Process(target=_work, args=(theirs,), daemon=True)
+            process.start()
+            theirs.close()
+            self._connections.append(ours)
+            self._processes.append(process)
+        logger.info('Started {} search workers'.format(self.workers))
+
+    def _publish(self, derived):
+        state = derived.state
+        needed = sum(_sections(state.size, len(state.players)))
+        if self.block is None or self.block.size < needed:
+            self._release()
+            self.block = shared_memory.SharedMemory(create=True, size=max(needed, BLOCK_SIZE))
+        _write_board(self.block.buf, derived)
+
+    def search(self, state, player_key, deadline, derived, replies=()):
+        """``(action, value, depth, nodes)`` of the merged searches, or None if a worker had nothing by the deadline.
+
+        ``derived`` holds the maps of ``state`` and ``replies`` are what
+        ``search.likely_replies`` found for us.
+        """
+        player = state.player(player_key)
+        if player is None or player.killed:
+            return DO_NOTHING, 0.0, 0, 0
+        self._publish(derived)
+        self.jobs += 1
+        number = self.jobs
+        shares = _shares(self.workers)
+        for worker, (connection, share) in enumerate(zip(self._connections, shares)):
+            try:
+                connection.send((number, self.block.name, state.size, len(state.players), player_key,
+                                 deadline - RESULT_MARGIN, share, list(replies)))
+            except OSError:
+                logger.error('Search worker {} is gone'.format(worker))
+                return None
+
+        # Per worker: the values of every depth it finished, whether it is done and its node count.
+        found = [{} for _ in shares]
+        done = [False] * len(shares)
+        nodes = [0] * len(shares)
+        pending = dict(zip(self._connections, range(len(shares))))
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for connection in multiprocessing.connection.wait(list(pending), remaining):
+                worker = pending[connection]
+                try:
+                    answer, depth, scored, counted = connection.recv()
+                except EOFError:
+                    logger.error('Search worker {} is gone'.format(worker))
+                    del pending[connection]
+                    continue
+                if answer != number:
+                    # Late news of an earlier round.
+                    continue
+                nodes[worker] = counted
+                if depth is None:
+                    done[worker] = True
+                    del pending[connection]
+                else:
+                    found[worker][depth] = scored
+        return self._merge(found, done, sum(nodes), replies)
+
+    @staticmethod
+    def _merge(found, done, nodes, replies):
+        # A worker that is done with nothing accepted has no say in how deep the others got.
+        deepest = [max(depths) for depths, finished in zip(found, done)
+                   if depths and not (finished and not depths[max(depths)])]
+        if not all(found) or not deepest:
+            return None
+        depth = min(deepest)
+        scored = search.merge_split([depths[min(depth, max(depths))] for depths in found], replies)
+        if not scored:
+            return None
+        value, action = max(scored, key=lambda item: item[0])
+        return action, value, depth, nodes
+
+    def _release(self):
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+    def close(self):
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+        for process in self._processes:
+            process.join(1.0)
+            if process.is_alive():
+                process.terminate()
+        for connection in self._connections:
+            connection.close()
+        self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _benchmark(scenarios, workers, think):
+    with SearchPool(workers) as pool:
+        print('{} workers'.format(pool.workers))
+        for name, state, _ in scenarios:
+            derived = diff.Derived.build(state)
+            for player in state.players:
+                if player.killed:
+                    continue
+                planner = search.Planner(state, player.key, time.monotonic() + think,
+                                         zobrist.TranspositionTable(search.TABLE_BITS), derived)
+                single = planner.search()
+                started = time.monotonic()
+                merged = pool.search(state, player.key, started + think, derived)
+                overrun = (time.monotonic() - started - think) * 1000
+                print('{} {}: single {} at depth {} in {} nodes, pool {} at depth {} in {} nodes, '
+                      '{:.1f} ms past the deadline'.format(name, player.key, single[0], single[2], planner.nodes,
+                                                           merged[0], merged[2], merged[3], overrun))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    import benchmarks
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('states', nargs='*', help='state.json files to add to the benchmark states')
+    parser.add_argument('--workers', type=int, default=None, help='pool size, one per core by default')
+    parser.add_argument('--think', type=float, default=0.2, help='seconds to search every state for')
+    args = parser.parse_args()
+    _benchmark(benchmarks.scenarios(args.states), args.workers, args.think)
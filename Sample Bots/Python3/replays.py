@@ -0,0 +1,240 @@
+"""Engine replays streamed into a columnar store of compressed NumPy shards.
+
+The engine leaves a folder for every round of a match under
+``Replays/{map seed}/{round}`` (see ``BombermanGame.LogEngineInfo``), each with
+the full state.json.  ``ingest`` walks those folders as a pipeline of
+generators, one state.json at a time:
+
+    match_folders -> round_files -> read_states -> ShardWriter.append
+
+and every state goes into a row of the store in its compact form, so analysing
+thousands of matches never means holding more than one shard of rows.
+
+A store is a folder of ``shard-NNNNN.npz`` files written with
+``np.savez_compressed``.  Every shard holds up to ``SHARD_ROUNDS`` rounds of
+maps of one size and player count, one array per column: ``match`` (the map
+seed) and ``round`` per row, one ``(rows, height, width)`` array per grid of
+``state.State`` and one ``(rows, players)`` array per player field, named
+``player_<field>``.  Ingesting into an existing store adds shards and leaves
+out matches it already holds, a match being known by its map seed and the
+names of its players.
+
+    python replays.py ingest Replays replays.store
+    python replays.py info replays.store
+"""
+import argparse
+import array
+import logging
+import os
+
+import numpy as np
+
+from state import Player, State, load_state
+
+SHARD_ROUNDS = 4096
+
+# State grids with the dtype of their array typecodes, then player fields.
+GRIDS = (('wall', np.int8), ('destructible', np.int8), ('bomb_fuse', np.int8), ('bomb_radius', np.int16),
+         ('bomb_owner', np.int8), ('power_up', np.int8), ('exploding', np.int8))
+PLAYER_FIELDS = (('key', 'U16'), ('name', 'U64'), ('x', np.int16), ('y', np.int16), ('killed', np.bool_),
+                 ('bomb_bag', np.int16), ('bomb_radius', np.int32), ('points', np.int32))
+
+logger = logging.getLogger(__name__)
+
+
+def _numbered(folder):
+    """Subfolders of ``folder`` named by a number, as ``(number, path)`` in order."""
+    found = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_dir() and entry.name.lstrip('-').isdigit():
+                found.append((int(entry.name), entry.path))
+    found.sort()
+    return found
+
+
+def match_folders(root):
+    """Every match folder under ``root``, or ``root`` itself if it holds rounds."""
+    if os.path.isfile(os.path.join(root, '0', 'state.json')):
+        yield root
+        return
+    for _, path in _numbered(root):
+        yield path
+
+
+def round_files(folder):
+    """The state.json of every round of the match in ``folder``, in order of rounds."""
+    for round, path in _numbered(folder):
+        path = os.path.join(path, 'state.json')
+        if os.path.isfile(path):
+            yield path
+        else:
+            logger.warning('Round {} of {} has no state.json'.format(round, folder))
+
+
+def match_key(state):
+    return state.seed, tuple(player.name or '' for player in state.players)
+
+
+def read_states(paths):
+    for path in paths:
+        yield load_state(path)
+
+
+def shard_paths(store):
+    if not os.path.isdir(store):
+        return []
+    return sorted(os.path.join(store, name) for name in os.listdir(store)
+                  if name.startswith('shard-') and name.endswith('.npz'))
+
+
+class ShardWriter(object):
+    """Collects rows of one map shape and writes them out a shard at a time."""
+
+    def __init__(self, store, shard_rounds=SHARD_ROUNDS):
+        os.makedirs(store, exist_ok=True)
+        self.store = store
+        self.shard_rounds = shard_rounds
+        existing = shard_paths(store)
+        self.number = int(os.path.basename(existing[-1])[6:-4]) + 1 if existing else 0
+        self.matches = set()
+        for path in existing:
+            with np.load(path) as shard:
+                self.matches.update(zip(shard['match'].tolist(), map(tuple, shard['player_name'].tolist())))
+        self.shape = None
+        self.rows = []
+        self.written = 0
+
+    def append(self, state):
+        shape = (state.width, state.height, len(state.players))
+        if shape != self.shape or len(self.rows) >= self.shard_rounds:
+            self.flush()
+            self.shape = shape
+        self.rows.append(state)
+
+    def flush(self):
+        """Write the rows collected so far as a shard."""
+        rows = self.rows
+        if not rows:
+            return None
+        width, height, players = self.shape
+        columns = {
+            'match': np.array([state.seed for state in rows], dtype=np.int32),
+            'round': np.array([state.round for state in rows], dtype=np.int32),
+        }
+        for name, dtype in GRIDS:
+            column = np.empty((len(rows), height, width), dtype=dtype)
+            for row, state in enumerate(rows):
+                column[row] = np.frombuffer(getattr(state, name), dtype=dtype).reshape(height, width)
+            columns[name] = column
+        for name, dtype in PLAYER_FIELDS:
+            values = [[getattr(player, name) for player in state.players] for state in rows]
+            if name in ('key', 'name'):
+                values = [[value or '' for value in row] for row in values]
+            columns['player_' + name] = np.array(values, dtype=dtype)
+
+        path = os.path.join(self.store, 'shard-{:05d}.npz'.format(self.number))
+        partial = os.path.join(self.store, 'partial.npz')
+        np.savez_compressed(partial, **columns)
+        os.replace(partial, path)
+        logger.info('Wrote {} rounds to {}'.format(len(rows), path))
+        self.number += 1
+        self.written += len(rows)
+        self.rows = []
+        return path
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def ingest(root, store, shard_rounds=SHARD_ROUNDS):
+    """Append every match under ``root`` that ``store`` does not hold yet, returns the rounds added."""
+    with ShardWriter(store, shard_rounds) as writer:
+        for folder in match_folders(root):
+            states = read_states(round_files(folder))
+            first = next(states, None)
+            if first is None:
+                continue
+            key = match_key(first)
+            if key in writer.matches:
+                logger.info('Skipping {}, match {} is already stored'.format(folder, first.seed))
+                continue
+            writer.append(first)
+            for state in states:
+                writer.append(state)
+            writer.matches.add(key)
+    return writer.written
+
+
+def shards(store):
+    """Every shard of ``store`` as an open ``np.load`` result, its columns read as they are used."""
+    for path in shard_paths(store):
+        with np.load(path) as shard:
+            yield shard
+
+
+def states(store):
+    """Every round in ``store`` as a ``state.State``, shard by shard."""
+    for shard in shards(store):
+        columns = {name: shard[name] for name in shard.files}
+        players = columns['player_key'].shape[1]
+        height, width = columns['wall'].shape[1:]
+        for row in range(len(columns['match'])):
+            state = State(width, height, int(columns['round'][row]), int(columns['match'][row]))
+            for name, _ in GRIDS:
+                setattr(state, name, array.array(getattr(state, name).typecode, columns[name][row].tobytes()))
+            for index in range(players):
+                fields = [columns['player_' + name][row, index].item() for name, _ in PLAYER_FIELDS]
+                key, name, x, y, killed, bomb_bag, bomb_radius, points = fields
+                state.players.append(Player(index, key or None, name or None, points, killed, bomb_bag,
+                                            bomb_radius, x, y))
+            yield state
+
+
+def info(store):
+    rounds = size = 0
+    # Matches are known by map seed and player names like ``ShardWriter`` does, one can span two shards.
+    matches = set()
+    for path in shard_paths(store):
+        with np.load(path) as shard:
+            match = shard['match']
+            height, width = shard['wall'].shape[1:]
+            players = shard['player_key'].shape[1]
+            keys = set(zip(match.tolist(), map(tuple, shard['player_name'].tolist())))
+            print('{}: {} rounds of {} matches, {}x{} with {} players, {} KiB'.format(
+                os.path.basename(path), len(match), len(keys), width, height, players,
+                os.path.getsize(path) // 1024))
+            rounds += len(match)
+            matches |= keys
+            size += os.path.getsize(path)
+    print('{} rounds of {} matches, {} KiB'.format(rounds, len(matches), size // 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command')
+    command = commands.add_parser('ingest', help='add the matches of a Replays folder to a store')
+    command.add_argument('replays', help='Replays folder, or the folder of a single match')
+    command.add_argument('store')
+    command.add_argument('--shard-rounds', type=int, default=SHARD_ROUNDS, help='rounds per shard at most')
+    command = commands.add_parser('info', help='list the shards of a store')
+    command.add_argument('store')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)-7s - [%(funcName)s] %(message)s')
+    if args.command == 'ingest':
+        logger.info('Added {} rounds'.format(ingest(args.replays, args.store, args.shard_rounds)))
+    elif args.command == 'info':
+        info(args.store)
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,390 @@
+"""Anytime move planner.
+
+``choose_action`` runs an iterative deepening search over the seven engine
+commands for our own player and returns the best move of the deepest search
+that finished before the deadline.  Depth one finishes almost immediately, so
+there is always a move ready; the search checks the clock every few nodes and a
+depth that runs out of time is thrown away in favour of the previous one.
+
+Lines of play are stepped through ``simulator.Simulator`` with the opponents
+standing still, and commands the engine would reject are pruned, as are bombs
+``escape.suicidal_cells`` finds no getting away from.  Given an
+``opponents.OpponentModel``, our first command is instead scored against the
+likely replies of the opponents close by, weighted by how likely they are.  At
+the leaves the bomb timeline tells whether some walk gets us out of the way of
+every blast at the round it goes off (``escape``) and how many walls our own
+bombs are going to take.  It is worked out on ``bitboard`` ints, which for the
+few bombs of a line of play is several times quicker than the NumPy grids of
+``danger`` and ``distance``.
+
+Many move orders lead to the same position, so the value of every position
+searched is kept in a ``zobrist.TranspositionTable``.  Values are stored less
+the points already scored in the position, which makes them independent of the
+line of play that got there (bar the movement bonus, which depends on the cells
+walked over before) and of the round the search started from.  The table and
+the ``diff.Derived`` maps (the distance field towards targets, the root danger
+grid and the cells every player has visited) carry over from one round to the
+next through ``cache``; without one the table stays in memory.
+"""
+import logging
+import time
+
+import bitboard
+import diff
+import escape
+import zobrist
+from simulator import ACTIONS, DO_NOTHING, PLACE_BOMB, POINTS_WALL, Simulator
+
+DEAD = -100000.0
+DOOMED = -50000.0
+BOMB_BAG_VALUE = 30.0
+BOMB_RADIUS_VALUE = 25.0
+TARGET_DISTANCE_WEIGHT = 0.5
+MAX_DEPTH = 20
+TABLE_BITS = 17
+
+logger = logging.getLogger(__name__)
+
+_table = None
+
+
+class Timeout(Exception):
+    pass
+
+
+class Timeline(object):
+    """Where we can stand and still live through one set of bombs, and what our own bombs will hit."""
+    __slots__ = ('survivors', 'walls_hit')
+
+    def __init__(self, planner, bombs, mine):
+        board = planner.bomb_board(bombs, planner.sim.destructible)
+        self.survivors = escape.escapes(board).survivors
+        self.walls_hit = 0
+        if mine:
+            board.bomb_list = mine
+            caught = 0
+            for cells in board.resolve()[0].values():
+                caught |= cells
+            self.walls_hit = bin(caught & board.destructible).count('1')
+
+
+class Planner(object):
+
+    def __init__(self, state, player_key, deadline, table=None, derived=None, model=None):
+        self.deadline = deadline
+        self.nodes = 0
+        self.table = zobrist.TranspositionTable(TABLE_BITS) if table is None else table
+        if derived is None:
+            derived = diff.Derived.build(state)
+        self.sim = sim = Simulator(state, visited=[derived.visited_cells(index) for index in range(len(state.players))])
+        self.size = state.size
+
+        player = state.player(player_key)
+        self.me = None if player is None else player.index
+        self.board = bitboard.Board(state.width, state.height)
+        self.board.wall = bitboard.bits_of(state.wall)
+        self.timelines = {}
+        self.suicides = {}
+        self.target_distance = derived.distance
+        key = self.timeline_key()
+        mine = tuple(bomb for bomb in key[0] if sim.bomb_owner[bomb[0]] == self.me)
+        self.timelines[key] = Timeline(self, key[0], mine)
+        self.side = 0 if self.me is None else sim.keys.side[self.me]
+        self.replies = likely_replies(model, state, derived, self.me)
+
+    def expired(self):
+        return time.monotonic() >= self.deadline
+
+    def timeline_key(self):
+        sim = self.sim
+        bombs = tuple(sorted((cell, detonates - sim.round, sim.bomb_radius[cell])
+                             for cell, detonates in sim.detonates.items()))
+        return bombs, bytes(sim.destructible)
+
+    def timeline(self):
+        key = self.timeline_key()
+        timeline = self.timelines.get(key)
+        if timeline is None:
+            bombs, sim = key[0], self.sim
+            mine = tuple(bomb for bomb in bombs if sim.bomb_owner[bomb[0]] == self.me)
+            timeline = self.timelines[key] = Timeline(self, bombs, mine)
+        return timeline
+
+    def bomb_board(self, bombs, destructible):
+        board = self.board.copy()
+        board.destructible = bitboard.bits_of(destructible)
+        board.bomb_list = bombs
+        return board
+
+    def suicidal(self):
+        """Whether the bomb we have just placed leaves us no walk out of the way of every blast.
+
+        ``escape.suicidal_cells`` is asked for the open cells around ours at
+        once, which are where the other lines of play over the same bombs
+        place theirs.
+        """
+        sim, me = self.sim, self.me
+        cell = sim.position[me]
+        bombs, destructible = self.timeline_key()
+        bombs = tuple(bomb for bomb in bombs if bomb[0] != cell)
+        key = bombs, destructible, sim.radius[me], sim.bomb_bag[me]
+        asked, suicidal = self.suicides.get(key, (0, 0))
+        if not asked >> cell & 1:
+            board = self.bomb_board(bombs, destructible)
+            near = board.spread(board.spread(1 << cell)) & board.open_cells()
+            cells = (near | 1 << cell) & ~asked & ~sum(1 << bomb[0] for bomb in bombs)
+            suicidal |= escape.suicidal_cells(board, cells, sim.radius[me], sim.bomb_bag[me])
+            asked |= cells
+            self.suicides[key] = asked, suicidal
+        return bool(suicidal >> cell & 1)
+
+    def commands(self, action, reply=None):
+        """Our ``action`` with every other player still alive doing what ``reply`` has for it, or nothing."""
+        reply = reply or {}
+        return [action if index == self.me else (None if killed else reply.get(index, DO_NOTHING))
+                for index, killed in enumerate(self.sim.killed)]
+
+    def search(self):
+        """Iterative deepening until the deadline, returns ``(action, value, depth)`` of the deepest finished search."""
+        if self.me is None or self.sim.killed[self.me]:
+            return DO_NOTHING, 0.0, 0
+
+        best = DO_NOTHING, DEAD, 0
+        for depth, scored in self.deepen():
+            value, action = max(scored, key=lambda item: item[0])
+            best = action, value, depth
+        return best
+
+    def deepen(self, actions=ACTIONS, seconds=None):
+        """Search our first command among ``actions`` one depth deeper at a time until the deadline.
+
+        Yields ``(depth, scored)`` for every depth finished, ``scored`` being
+        the ``(value, action)`` of every action the engine would accept.
+        Given ``seconds``, which maps our first commands to the second
+        commands to search after them, ``scored`` is ``split_children``'s instead.
+        """
+        order = list(actions)
+        depth = 0
+        # Depth one is a handful of nodes and always runs, even if the deadline has already passed.
+        while depth == 0 or not self.expired():
+            depth += 1
+            try:
+                if seconds is not None:
+                    scored = list(self.split_children(seconds, depth - 1))
+                else:
+                    scored = list(self.root_children(order, depth - 1) if self.replies else
+                                  self.children(order, depth - 1))
+            except Timeout:
+                return
+            yield depth, scored
+            if not scored or depth >= MAX_DEPTH:
+                return
+            if seconds is None:
+                # Best first, and what the engine rejects is rejected at every depth.
+                _, best = max(scored, key=lambda item: item[0])
+                order = [best] + [action for _, action in sorted(scored, reverse=True) if action != best]
+
+    def children(self, order, depth):
+        """``(value, action)`` of every action the engine would accept, doing nothing always is.
+
+        A bomb there is no getting away from is left out like a rejected command.
+        """
+        sim = self.sim
+        for action in order:
+            mark = sim.mark()
+            try:
+                failed = sim.step(self.commands(action))
+                if action != DO_NOTHING and self.me in failed:
+                    continue
+                if action == PLACE_BOMB and self.suicidal():
+                    continue
+                yield self.value(depth), action
+            finally:
+                sim.undo(mark)
+
+    def root_children(self, order, depth):
+        """``(value, action)`` like ``children``, averaged over the likely replies weighted by their likelihood.
+
+        A rejected command leaves us where we were, so under a reply that makes
+        it fail (an opponent stepping into the cell first) the position is
+        scored as it is.  An action is left out only if it fails under every reply.
+        A bomb there is no getting away from is scored dead without searching on.
+        """
+        sim = self.sim
+        total = sum(chance for chance, _ in self.replies)
+        for action in order:
+            value, accepted = 0.0, action == DO_NOTHING
+            for chance, reply in self.replies:
+                mark = sim.mark()
+                try:
+                    failed = sim.step(self.commands(action, reply))
+                    placed = self.me not in failed
+                    accepted = accepted or placed
+                    if action == PLACE_BOMB and placed and self.suicidal():
+                        value += chance * (DEAD + sim.round)
+                    else:
+                        value += chance * self.value(depth)
+                finally:
+                    sim.undo(mark)
+            if accepted:
+                yield value / total, action
+
+    def split_children(self, seconds, depth):
+        """``(values, action)`` of our first commands, searched on with only their share ``seconds[action]`` of second commands.
+
+        ``values`` holds the best value over the share under every likely
+        reply, or standing still without any, None where the share has no
+        command the engine would accept.  The best of every share under each
+        reply, weighted like ``root_children``, gives its value, see ``merge_split``.
+        """
+        sim = self.sim
+        replies = self.replies or [(1.0, {})]
+        for action in seconds:
+            values, accepted = [], action == DO_NOTHING
+            for _, reply in replies:
+                mark = sim.mark()
+                try:
+                    failed = sim.step(self.commands(action, reply))
+                    placed = self.me not in failed
+                    accepted = accepted or placed
+                    if action == PLACE_BOMB and placed and self.suicidal():
+                        values.append(DEAD + sim.round)
+                    else:
+                        values.append(self.share_value(seconds[action], depth))
+                finally:
+                    sim.undo(mark)
+            if accepted:
+                yield values, action
+
+    def share_value(self, share, depth):
+        """``value`` with only the commands of ``share`` searched from here, and left out of the table."""
+        self.nodes += 1
+        if not self.nodes & 63 and self.expired():
+            raise Timeout()
+        sim = self.sim
+        if sim.killed[self.me]:
+            return DEAD + sim.round
+        if depth == 0 or sim.finished():
+            return self.evaluate()
+        values = [value for value, _ in self.children(share, depth - 1)]
+        return max(values) if values else None
+
+    def value(self, depth):
+        self.nodes += 1
+        if not self.nodes & 63 and self.expired():
+            raise Timeout()
+        sim = self.sim
+        if sim.killed[self.me]:
+            return DEAD + sim.round
+        if depth == 0 or sim.finished():
+            return self.evaluate()
+        key = sim.hash ^ self.side
+        scored = sim.score(self.me)
+        value = self.table.lookup(key, depth)
+        if value is not None:
+            return value + scored
+        value = max(value for value, _ in self.children(ACTIONS, depth - 1))
+        self.table.store(key, depth, value - scored)
+        return value
+
+    def evaluate(self):
+        sim, me = self.sim, self.me
+        timeline = self.timeline()
+        cell = sim.position[me]
+        score = sim.score(me) + POINTS_WALL * timeline.walls_hit
+        score += BOMB_BAG_VALUE * sim.bomb_bag[me]
+        score += BOMB_RADIUS_VALUE * sim.radius[me].bit_length()
+        score -= TARGET_DISTANCE_WEIGHT * min(self.target_distance[cell], self.size)
+        if not timeline.survivors >> cell & 1:
+            score += DOOMED
+        return score
+
+
+def merge_split(shares, replies):
+    """``(value, action)`` of every first command from the ``split_children`` of all the shares of the second ones.
+
+    ``replies`` are the likely replies searched against, if any.
+    """
+    chances = [chance for chance, _ in replies] or [1.0]
+    best = {}
+    for scored in shares:
+        for values, action in scored:
+            found = best.setdefault(action, [None] * len(chances))
+            for index, value in enumerate(values):
+                if value is not None and (found[index] is None or value > found[index]):
+                    found[index] = value
+    return [(sum(chance * value for chance, value in zip(chances, found)) / sum(chances), action)
+            for action, found in best.items() if None not in found]
+
+
+def likely_replies(model, state, derived, me):
+    """``model``'s likely replies of the opponents around player ``me``, or [] if there is nothing to search against."""
+    if model is None or me is None or state.players[me].killed:
+        return []
+    replies = model.replies(state, derived, me)
+    # Nobody close by or known well enough leaves the search as it was.
+    return replies if any(reply for _, reply in replies) else []
+
+
+def choose_action(state, player_key, deadline, cache=None, timer=None, model=None, pool=None):
+    """Best action for ``player_key`` that could be found before ``deadline`` (a ``time.monotonic`` value).
+
+    ``cache`` is an open ``cache.Cache`` to pick up from and leave this round's
+    results in for the next one.  A ``timing.Timer`` is given the time spent
+    bringing the maps forward and searching, and the search counters.  An
+    ``opponents.OpponentModel`` learns from what the opponents did since the
+    cached round and is searched against.  A ``parallel.SearchPool`` searches
+    in its workers instead, this process only steps in if they come up empty.
+    """
+    global _table
+    if cache is not None:
+        table, derived = cache.table, None
+        if model is not None:
+            previous = cache.previous()
+            if previous is not None:
+                model.observe(previous, state, player_key)
+                derived = cache.derived(previous)
+        if derived is None:
+            derived = cache.derived()
+    else:
+        if _table is None:
+            _table = zobrist.TranspositionTable(TABLE_BITS)
+        table, derived = _table, None
+    if timer is not None:
+        timer.mark('derive')
+    found = None
+    if pool is not None:
+        if derived is None:
+            derived = diff.Derived.build(state)
+        player = state.player(player_key)
+        replies = likely_replies(model, state, derived, None if player is None else player.index)
+        found = pool.search(state, player_key, deadline, derived, replies)
+        if found is None:
+            logger.warning('The search workers came up empty, searching here')
+    if found is not None:
+        action, value, depth, nodes = found
+        if timer is not None:
+            timer.mark('search')
+            timer.count('nodes', nodes)
+            timer.count('depth', depth)
+            timer.count('replies', len(replies))
+            timer.count('workers', pool.workers)
+        logger.debug('{} workers searched {} nodes to depth {}, value {:.1f}'.format(
+            pool.workers, nodes, depth, value))
+    else:
+        table.new_search()
+        planner = Planner(state, player_key, deadline, table, derived, model)
+        action, value, depth = planner.search()
+        if timer is not None:
+            timer.mark('search')
+            timer.count('nodes', planner.nodes)
+            timer.count('depth', depth)
+            timer.count('probes', table.probes)
+            timer.count('hits', table.hits)
+            timer.count('replies', len(planner.replies))
+        logger.debug('Searched {} nodes to depth {}, value {:.1f}'.format(planner.nodes, depth, value))
+        logger.info('Transposition table: {} probes, {:.1%} hits, {} of {} slots written, {} KiB'.format(
+            table.probes, table.hit_rate, table.stores, len(table), table.memory // 1024))
+    if cache is not None:
+        cache.store(derived)
+    return action
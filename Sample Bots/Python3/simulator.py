@@ -0,0 +1,432 @@
+"""Forward model of the game engine.
+
+``Simulator.step`` plays one round exactly the way ``GameRoundProcessor.ProcessRound``
+does: clear explosions, tick bomb timers, detonate (chain reactions included),
+mark entities for destruction, apply commands, mark again, apply power ups,
+destroy marked entities and hand out points per chain, and finally work out the
+movement bonus.
+
+The simulator owns a mutable copy of the compact state and records every change
+in an undo log, so a search can ``step`` down a line of play and ``undo`` back to
+any ``mark`` without copying the board.  Bombs are kept by the round they go off
+in rather than by their timer, so ticking the timers costs nothing.
+
+Collisions between players moving to the same cell are settled with
+``self.random`` the way the engine does it with ``System.Random``.  state.json
+does not say which cells players have walked over before, so the movement bonus
+only counts cells touched from the first simulated round on, unless ``visited``
+is passed in.
+
+``hash`` is the position's Zobrist hash (see ``zobrist``), kept up to date on
+every change and restored by ``undo`` with the rest.
+"""
+import array
+import random
+
+import mapindex
+import zobrist
+from state import BOMB_BAG, BOMB_RADIUS, SUPER_POWER_UP, Player, State
+
+DO_NOTHING = -1
+MOVE_UP = 1
+MOVE_LEFT = 2
+MOVE_RIGHT = 3
+MOVE_DOWN = 4
+PLACE_BOMB = 5
+TRIGGER_BOMB = 6
+
+ACTIONS = (DO_NOTHING, MOVE_UP, MOVE_LEFT, MOVE_RIGHT, MOVE_DOWN, PLACE_BOMB, TRIGGER_BOMB)
+
+# GameEngine/Properties/Settings.settings
+BOMB_TIMER_MULTIPLIER = 3
+MAX_BOMB_TIMER = 10
+POINTS_WALL = 10
+POINTS_PLAYER = 100
+POINTS_MOVEMENT_MULTIPLIER_PERCENTAGE = 100
+SUPER_POWER_UP_POINTS = 50
+
+_ABSENT = object()
+
+
+def bomb_timer(bomb_bag):
+    """Timer of a freshly planted bomb, ``PlaceBombCommand``'s ``(bombbag * 3) + 1`` capped at 10."""
+    return min(MAX_BOMB_TIMER - 1, bomb_bag * BOMB_TIMER_MULTIPLIER) + 1
+
+
+def player_kill_points(state):
+    """Points for a kill as ``BombermanEngine`` works them out from the freshly generated map.
+
+    Only exact for the state of round 0, later on some of the walls are gone.
+    """
+    return (POINTS_PLAYER + POINTS_WALL * sum(state.destructible)) // len(state.players)
+
+
+class Simulator(object):
+
+    def __init__(self, state, kill_points=None, seed=None, visited=None):
+        width, height = state.width, state.height
+        self.width = width
+        self.height = height
+        self.round = state.round
+        self.map_seed = state.seed
+        self.kill_points = player_kill_points(state) if kill_points is None else kill_points
+        self.random = random.Random(seed)
+        self.log = []
+
+        self.wall = bytes(state.wall)
+        self.destructible = bytearray(state.destructible)
+        self.power_up = bytearray(state.power_up)
+        self.usable = self.width * self.height - sum(self.wall)
+        self.exploding = {}
+
+        # Bombs by cell: the round they go off in, their radius and the index of their owner.
+        self.detonates = {}
+        self.bomb_radius = {}
+        self.bomb_owner = {}
+
+        players = state.players
+        self.names = [(player.key, player.name) for player in players]
+        self.position = [player.y * width + player.x for player in players]
+        self.killed = [player.killed for player in players]
+        self.on_map = [not player.killed for player in players]
+        self.bomb_bag = [player.bomb_bag for player in players]
+        self.radius = [player.bomb_radius for player in players]
+        self.planted = [0] * len(players)
+        self.visited = [bytearray(self.width * self.height) for _ in players]
+        self.touched = [0] * len(players)
+        for index, cell in enumerate(self.position):
+            for seen in (visited[index] if visited else ()) or (cell,):
+                if not self.visited[index][seen]:
+                    self.visited[index][seen] = 1
+                    self.touched[index] += 1
+        # state.json points include the movement bonus, keep the two apart.
+        self.coverage = [self._coverage(touched) for touched in self.touched]
+        self.points = [player.points - coverage for player, coverage in zip(players, self.coverage)]
+
+        for cell, fuse, radius, owner in state.bombs():
+            self.detonates[cell] = self.round + fuse
+            self.bomb_radius[cell] = radius
+            self.bomb_owner[cell] = owner
+            if owner >= 0:
+                self.planted[owner] += 1
+
+        # Walls never change, so where every move leads and how far blasts can travel comes from the map index.
+        self.index = index = mapindex.for_state(state)
+        self._targets = {}
+        for action in (MOVE_UP, MOVE_LEFT, MOVE_RIGHT, MOVE_DOWN):
+            # The move commands are numbered in the index's direction order.
+            self._targets[action] = [None if cell < 0 else cell for cell in index.steps[action - 1::4]]
+        self._rays = {}
+
+        self.keys = zobrist.keys(width * height, len(players))
+        self.hash = zobrist.position_hash(self)
+
+    def mark(self):
+        return len(self.log)
+
+    def undo(self, mark):
+        """Roll every change made since ``mark`` back."""
+        log = self.log
+        for container, key, old in reversed(log[mark:]):
+            if old is _ABSENT:
+                del container[key]
+            else:
+                container[key] = old
+        del log[mark:]
+
+    def score(self, index):
+        """Points as the engine reports them: points earned plus the movement bonus."""
+        return self.points[index] + self.coverage[index]
+
+    def alive(self):
+        return len(self.killed) - sum(self.killed)
+
+    def finished(self):
+        return self.alive() < 2 or self.round > self.width * self.height
+
+    def fuse(self, cell):
+        """Timer of the bomb on ``cell`` as state.json would show it."""
+        return self.detonates[cell] - self.round
+
+    def to_state(self):
+        """``State`` of the current round the way state.json shows it.
+
+        Power ups are only visible on cells with nothing on them, like the
+        engine's ``GameBlock.PowerUp``, so those still under a wall are left out.
+        """
+        width = self.width
+        state = State(width, self.height, self.round, self.map_seed)
+        state.wall[:] = array.array('b', self.wall)
+        state.destructible[:] = array.array('b', self.destructible)
+        standing = {cell for index, cell in enumerate(self.position) if self.on_map[index]}
+        for cell, kind in enumerate(self.power_up):
+            if kind and not self.destructible[cell] and cell not in standing:
+                state.power_up[cell] = kind
+        for cell, detonates in self.detonates.items():
+            state.bomb_fuse[cell] = detonates - self.round
+            state.bomb_radius[cell] = self.bomb_radius[cell]
+            state.bomb_owner[cell] = self.bomb_owner[cell]
+        for cell in self.exploding:
+            state.exploding[cell] = 1
+        for index, (key, name) in enumerate(self.names):
+            y, x = divmod(self.position[index], width)
+            state.players.append(Player(index, key, name, self.score(index), self.killed[index],
+                                        self.bomb_bag[index], self.radius[index], x, y))
+        return state
+
+    def _coverage(self, touched):
+        return int(touched / self.usable * POINTS_MOVEMENT_MULTIPLIER_PERCENTAGE)
+
+    def _set(self, container, key, value):
+        self.log.append((container, key, container[key]))
+        container[key] = value
+
+    def step(self, actions):
+        """Process one round with ``actions[i]`` the command of player ``i`` (None for no command).
+
+        Returns the indices of the players whose command the engine would have rejected.
+        """
+        log = self.log
+        now = self.round + 1
+        log.append((self.__dict__, 'round', self.round))
+        log.append((self.__dict__, 'hash', self.hash))
+        self.hash ^= self.keys.round_key(self.round) ^ self.keys.round_key(now)
+        self.round = now
+        failed = []
+
+        # RemoveExplosionsFromMap, DescreaseBombTimers, DetonateBombs
+        blasts = {}
+        chains = {}
+        detonates = self.detonates
+        if detonates and min(detonates.values()) <= now:
+            for cell in sorted(detonates):
+                if detonates[cell] <= now and cell not in chains:
+                    self._detonate(cell, chains, blasts)
+        if blasts or self.exploding:
+            log.append((self.__dict__, 'exploding', self.exploding))
+            self.exploding = blasts
+
+        # MarkEntitiesForDestruction
+        killed = self.killed
+        position = self.position
+        on_map = self.on_map
+        marked = []
+        if blasts:
+            self._mark_players(blasts, marked)
+
+        # ProcessPlayerCommands
+        had_commands = False
+        moves = {}
+        for index, action in enumerate(actions):
+            if action is None or killed[index] and index not in marked:
+                continue
+            had_commands = True
+            if killed[index]:
+                continue
+            if action in self._targets:
+                target = self._target(index, action)
+                if target is None:
+                    failed.append(index)
+                else:
+                    moves[index] = target
+            elif action == PLACE_BOMB:
+                if not self._place_bomb(index, now):
+                    failed.append(index)
+            elif action == TRIGGER_BOMB:
+                if not self._trigger_bomb(index, now, chains):
+                    failed.append(index)
+
+        explored = []
+        if moves:
+            if len(moves) > 1:
+                self._settle_collisions(moves)
+            visited = self.visited
+            player_key = self.keys.player_key
+            for index, target in moves.items():
+                self.hash ^= player_key(index, position[index]) ^ player_key(index, target)
+                log.append((position, index, position[index]))
+                position[index] = target
+                if not visited[index][target]:
+                    log.append((visited[index], target, 0))
+                    visited[index][target] = 1
+                    self._set(self.touched, index, self.touched[index] + 1)
+                    explored.append(index)
+
+        if had_commands and blasts:
+            self._mark_players(blasts, marked)
+
+        # ApplyPowerUps
+        power_up = self.power_up
+        for index in range(len(position)):
+            if on_map[index] and power_up[position[index]]:
+                self._power_up(index, position[index])
+
+        # DestroyMarkedEntities
+        if blasts:
+            self._destroy(blasts, chains, marked)
+
+        # ApplyMovementBonus, which only changes for players that walked onto a new cell.
+        for index in explored:
+            if not killed[index]:
+                coverage = self._coverage(self.touched[index])
+                if coverage != self.coverage[index]:
+                    self._set(self.coverage, index, coverage)
+        return failed
+
+    def _detonate(self, bomb, chains, blasts):
+        """``DetonateBomb``: mark the four rays of ``bomb`` and set off every bomb they reach.
+
+        ``chains`` maps every bomb going off to the bombs it is linked to, the
+        engine's bomb graph that points are later shared over.
+        """
+        chains[bomb] = links = []
+        destructible, detonates = self.destructible, self.detonates
+        radius = self.bomb_radius[bomb]
+        rays = self._rays.get((bomb, radius))
+        if rays is None:
+            rays = self._rays[bomb, radius] = ((bomb,),) + tuple(
+                tuple(self.index.ray(bomb, direction, radius))
+                for direction in (mapindex.RIGHT, mapindex.LEFT, mapindex.DOWN, mapindex.UP))
+        for ray in rays:
+            for cell in ray:
+                hit = blasts.get(cell)
+                if hit is None:
+                    blasts[cell] = [bomb]
+                elif bomb not in hit:
+                    hit.append(bomb)
+                if cell in detonates and cell not in chains:
+                    self._detonate(cell, chains, blasts)
+                    links.append(cell)
+                    chains[cell].append(bomb)
+                if destructible[cell]:
+                    break
+
+    def _mark_players(self, blasts, marked):
+        killed = self.killed
+        for index, cell in enumerate(self.position):
+            if self.on_map[index] and not killed[index] and cell in blasts:
+                self._set(killed, index, True)
+                marked.append(index)
+
+    def _occupied(self, cell):
+        for index, other in enumerate(self.position):
+            if other == cell and self.on_map[index]:
+                return True
+        return False
+
+    def _target(self, index, action):
+        """``MovementCommand``: the cell the player moves to, or None if the move is not allowed."""
+        target = self._targets[action][self.position[index]]
+        if target is None or self.destructible[target] or target in self.detonates or self._occupied(target):
+            return None
+        return target
+
+    def _place_bomb(self, index, now):
+        cell = self.position[index]
+        if self.bomb_bag[index] - self.planted[index] == 0 or cell in self.detonates:
+            return False
+        log = self.log
+        log.append((self.detonates, cell, _ABSENT))
+        log.append((self.bomb_radius, cell, _ABSENT))
+        log.append((self.bomb_owner, cell, _ABSENT))
+        self.detonates[cell] = now + bomb_timer(self.bomb_bag[index])
+        self.bomb_radius[cell] = self.radius[index]
+        self.bomb_owner[cell] = index
+        self.hash ^= self.keys.bomb_key(cell, self.detonates[cell], self.radius[index], index)
+        self._set(self.planted, index, self.planted[index] + 1)
+        return True
+
+    def _trigger_bomb(self, index, now, chains):
+        """``TriggerBombCommand``: the bomb with the lowest timer not yet going off is set to one."""
+        if not self.planted[index]:
+            return False
+        detonates = self.detonates
+        bombs = [(detonates[cell], cell) for cell, owner in self.bomb_owner.items()
+                 if owner == index and cell not in chains]
+        if not bombs:
+            return False
+        old, cell = min(bombs)
+        self.hash ^= self.keys.detonates_key(cell, old) ^ self.keys.detonates_key(cell, now + 1)
+        self._set(detonates, cell, now + 1)
+        return True
+
+    def _settle_collisions(self, moves):
+        """``CommandTransaction.ValidateCommands``: drop one random player per round of collisions."""
+        while True:
+            targets = {}
+            for index, target in moves.items():
+                targets.setdefault(target, []).append(index)
+            contested = [index for indices in targets.values() if len(indices) > 1 for index in indices]
+            if not contested:
+                return
+            loser, lowest = None, 101
+            for index in contested:
+                roll = self.random.randrange(100)
+                if roll < lowest:
+                    loser, lowest = index, roll
+            del moves[loser]
+
+    def _power_up(self, index, cell):
+        kind = self.power_up[cell]
+        keys = self.keys
+        if kind in (BOMB_BAG, SUPER_POWER_UP):
+            bag = self.bomb_bag[index]
+            self.hash ^= keys.bomb_bag_key(index, bag) ^ keys.bomb_bag_key(index, bag + 1)
+            self._set(self.bomb_bag, index, bag + 1)
+        if kind in (BOMB_RADIUS, SUPER_POWER_UP):
+            radius = self.radius[index]
+            self.hash ^= keys.radius_key(index, radius) ^ keys.radius_key(index, radius * 2)
+            self._set(self.radius, index, radius * 2)
+        if kind == SUPER_POWER_UP:
+            self._set(self.points, index, self.points[index] + SUPER_POWER_UP_POINTS)
+        self.hash ^= keys.power_up_key(cell, kind)
+        self._set(self.power_up, cell, 0)
+
+    def _destroy(self, blasts, chains, marked):
+        points = self.points
+        destructible = self.destructible
+        keys = self.keys
+        earned = dict.fromkeys(chains, 0)
+        for cell, bombs in blasts.items():
+            if destructible[cell]:
+                self.hash ^= keys.destructible[cell]
+                self._set(destructible, cell, 0)
+                for bomb in bombs:
+                    earned[bomb] += POINTS_WALL
+        for index in marked:
+            self._set(points, index, points[index] - self.kill_points)
+            self._set(self.on_map, index, False)
+            self.hash ^= keys.player_key(index, self.position[index])
+            for bomb in blasts[self.position[index]]:
+                earned[bomb] += self.kill_points
+
+        owners = {}
+        for cell in chains:
+            owner = owners[cell] = self.bomb_owner[cell]
+            self.hash ^= keys.bomb_key(cell, self.detonates[cell], self.bomb_radius[cell], owner)
+            self.log.append((self.detonates, cell, self.detonates.pop(cell)))
+            self.log.append((self.bomb_radius, cell, self.bomb_radius.pop(cell)))
+            self.log.append((self.bomb_owner, cell, self.bomb_owner.pop(cell)))
+            if owner >= 0:
+                self._set(self.planted, owner, self.planted[owner] - 1)
+
+        # PointsVisitor: every chain's points are shared by the owners still alive.
+        seen = set()
+        for bomb in chains:
+            if bomb in seen:
+                continue
+            seen.add(bomb)
+            group, total, stack = set(), 0, [bomb]
+            while stack:
+                current = stack.pop()
+                total += earned[current]
+                group.add(owners[current])
+                for linked in chains[current]:
+                    if linked not in seen:
+                        seen.add(linked)
+                        stack.append(linked)
+            alive = [owner for owner in group if owner >= 0 and not self.killed[owner]]
+            if total and alive:
+                share = total // len(alive)
+                for owner in alive:
+                    self._set(points, owner, points[owner] + share)
@@ -0,0 +1,351 @@
+"""Plays a whole match over one connection to the engine's SocketHost.
+
+Under the file protocol the engine starts bot.py for every round and the bot
+reads the round from disk.  ``SocketHost`` instead registers players over TCP
+and streams every round to them, so ``SocketBot`` stays connected for the whole
+match and keeps its search table, derived maps, opponent model and the previous
+state in memory: a round costs no process start and no file.
+
+The protocol is ``SocketHarnessMessage``'s: every message is the text
+``<type>|<message><`` encoded as UTF-16 (little endian), with the types below.
+A client registers on port 19010 with its name, is told the port of its own
+game connection and reconnects there; the host then sends its key, the map of
+every round and word of failed commands, its death and the end of the game, and
+takes a command letter per round back.  The maps are ``ConsoleRender`` text,
+the player details beside the map rows, which ``console_map`` turns into the
+map.txt layout for ``state.parse_map``.  Blasts and dead players are filled in
+from the round before.  The host reads every command with a single receive,
+so commands are sent one per round and nothing else is.
+
+Several messages can arrive in one read and one message over several reads, so
+``Framer`` collects the bytes and hands out whole messages as they complete.
+
+``StandInHost`` speaks the host's side of the protocol on localhost and plays
+the match on ``simulator.Simulator``, for trying the client without the engine:
+
+    python socketbot.py --stand-in 2
+
+plays two of these bots against each other over sockets.  Against a real
+SocketHost, start it and run ``python socketbot.py --host <host> --name <name>``.
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+import mapgen
+import search
+from bot import ACTIONS, DEADLINE, SAFETY_MARGIN
+from opponents import OpponentModel
+from simulator import DO_NOTHING, MOVE_DOWN, MOVE_LEFT, MOVE_RIGHT, MOVE_UP, PLACE_BOMB, TRIGGER_BOMB, Simulator
+from state import parse_map, render_map
+from tournament import BotMemory, leader_board
+
+PORT = 19010
+ENCODING = 'utf-16-le'
+SEPARATOR = '|'
+TERMINATOR = '<'
+READ_SIZE = 65536
+
+# SocketHarnessMessage.MessageType
+REGISTRATION_PORT = 1
+GAME_MAP = 2
+COMMAND = 3
+KILLED = 4
+REGISTER_PLAYER = 5
+COMMAND_FAILED = 6
+GAME_COMPLETE = 7
+PLAYER_REGISTERED = 8
+
+# SocketServer.HandleCommandMessage, anything else does nothing.
+LETTERS = {MOVE_UP: 'w', MOVE_LEFT: 'a', MOVE_DOWN: 's', MOVE_RIGHT: 'd', PLACE_BOMB: 'z', TRIGGER_BOMB: 'x'}
+COMMANDS = {letter: action for action, letter in LETTERS.items()}
+
+# Seconds the stand-in host waits for a command before the player does nothing.
+COMMAND_TIMEOUT = DEADLINE
+
+_TERMINATOR_BYTES = TERMINATOR.encode(ENCODING)
+
+logger = logging.getLogger(__name__)
+
+
+def encode(message_type, message=''):
+    return '{}{}{}{}'.format(message_type, SEPARATOR, message, TERMINATOR).encode(ENCODING)
+
+
+class Framer(object):
+    """Splits the bytes read off a connection into ``(type, message)`` pairs."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Messages completed by ``data``, in order."""
+        buffer = self.buffer
+        buffer += data
+        messages = []
+        start = 0
+        while True:
+            end = buffer.find(_TERMINATOR_BYTES, start)
+            # Only a whole code unit is a terminator, not the high byte of one and the low byte of the next.
+            while end >= 0 and (end - start) % 2:
+                end = buffer.find(_TERMINATOR_BYTES, end + 1)
+            if end < 0:
+                break
+            message_type, _, message = bytes(buffer[start:end]).decode(ENCODING).partition(SEPARATOR)
+            messages.append((int(message_type), message))
+            start = end + len(_TERMINATOR_BYTES)
+        del buffer[:start]
+        return messages
+
+
+def console_map(text):
+    """map.txt text of the ``ConsoleRender`` text the host sends."""
+    lines = text.splitlines()
+    rows, details = lines[:1], []
+    for line in lines[1:]:
+        row, tab, detail = line.partition('\t\t')
+        # Details that run past the map are indented by blanks instead of a row.
+        if row.strip():
+            rows.append(row)
+        if tab:
+            details.append(detail)
+    return '\n'.join(rows + details) + '\n'
+
+
+def console_render(state, newline='\r\n'):
+    """``ConsoleRender.RenderTextGameState`` text of ``state``, what the host sends of every round."""
+    lines = render_map(state, minify=False, newline='\n').split('\n')[:-1]
+    rows, details = lines[1:state.height + 1], lines[state.height + 1:]
+    rendered = lines[:1]
+    rendered.extend(row + '\t\t' + detail for row, detail in zip(rows, details))
+    rendered.extend(rows[len(details):])
+    rendered.extend(' ' * (state.width - 1) + '\t\t' + detail for detail in details[len(rows):])
+    return newline.join(rendered) + newline
+
+
+class SocketBot(object):
+    """One player connected to a SocketHost for a whole match.
+
+    ``decide`` has the signature of ``search.choose_action`` and is given
+    ``think`` seconds from the arrival of every map.
+    """
+
+    def __init__(self, name, host='localhost', port=PORT, think=DEADLINE - SAFETY_MARGIN, decide=None, model=None):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.think = think
+        self.decide = decide or search.choose_action
+        self.model = model
+        self.key = None
+        self.killed = False
+        self.state = None
+        self.memory = BotMemory()
+
+    async def register(self):
+        """Port of this player's game connection."""
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            writer.write(encode(REGISTER_PLAYER, self.name))
+            await writer.drain()
+            framer = Framer()
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    raise ConnectionError('Host closed the connection before registering {}'.format(self.name))
+                messages = framer.feed(data)
+                if messages:
+                    break
+        finally:
+            writer.close()
+        message_type, message = messages[0]
+        if message_type != REGISTRATION_PORT:
+            raise ConnectionError('Expected the registration port, got message type {}'.format(message_type))
+        return int(message)
+
+    async def play(self):
+        """Register, play until the game is complete and return the last state seen."""
+        port = await self.register()
+        logger.info('Registered {}, playing on port {}'.format(self.name, port))
+        reader, writer = await asyncio.open_connection(self.host, port)
+        loop = asyncio.get_event_loop()
+        framer = Framer()
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                received = time.monotonic()
+                if not data:
+                    logger.warning('Host closed the connection')
+                    break
+                for message_type, message in framer.feed(data):
+                    if message_type == GAME_MAP:
+                        if not self.killed:
+                            # The search runs in a thread so the connection is still served meanwhile.
+                            letter = await loop.run_in_executor(None, self.command, message, received + self.think)
+                            writer.write(encode(COMMAND, letter))
+                            await writer.drain()
+                    elif message_type == PLAYER_REGISTERED:
+                        self.key = message[:1]
+                        logger.info('Playing as {}'.format(self.key))
+                    elif message_type == KILLED:
+                        self.killed = True
+                        logger.info('Killed')
+                    elif message_type == COMMAND_FAILED:
+                        logger.warning('Command failed: {}'.format(message))
+                    elif message_type == GAME_COMPLETE:
+                        logger.info('Game complete')
+                        return self.state
+                    else:
+                        logger.warning('Ignoring message type {}'.format(message_type))
+        finally:
+            writer.close()
+            if self.model is not None:
+                self.model.save()
+        return self.state
+
+    def command(self, text, deadline):
+        """Command letter for the round ``text`` shows."""
+        state = parse_map(console_map(text).encode('utf-8'), self.state)
+        if state is None:
+            logger.error('Cannot read the map, doing nothing')
+            return ''
+        self.state = self.memory.state = state
+        action = self.decide(state, self.key, deadline, self.memory, model=self.model)
+        logger.info('Round {}: {}'.format(state.round, ACTIONS[action]))
+        return LETTERS.get(action, '')
+
+
+class StandInHost(object):
+    """The host's side of the protocol on localhost, playing the match on the simulator.
+
+    Waits for ``players`` registrations on ``port`` (0 for any free port, see
+    ``self.port`` once started), gives every player its own game port and
+    plays ``mapgen``'s map for ``seed`` until the game is over or ``rounds``
+    have been played.
+    """
+
+    def __init__(self, players, seed=0, port=PORT, rounds=None, command_timeout=COMMAND_TIMEOUT):
+        self.players = players
+        self.seed = seed
+        self.port = port
+        self.rounds = rounds
+        self.command_timeout = command_timeout
+        self.names = []
+        self.connections = []
+        self.sim = None
+        self._registration = None
+        self._connected = asyncio.Event()
+
+    async def start(self):
+        self._registration = await asyncio.start_server(self._register, '127.0.0.1', self.port)
+        self.port = self._registration.sockets[0].getsockname()[1]
+
+    async def _register(self, reader, writer):
+        framer = Framer()
+        messages = []
+        while not messages:
+            data = await reader.read(READ_SIZE)
+            if not data:
+                writer.close()
+                return
+            messages = framer.feed(data)
+        message_type, name = messages[0]
+        if message_type != REGISTER_PLAYER or len(self.names) >= self.players:
+            writer.close()
+            return
+        seat = len(self.names)
+        self.names.append(name)
+        self.connections.append(None)
+        server = await asyncio.start_server(lambda r, w: self._connect(seat, r, w), '127.0.0.1', 0)
+        writer.write(encode(REGISTRATION_PORT, server.sockets[0].getsockname()[1]))
+        await writer.drain()
+        writer.close()
+
+    async def _connect(self, seat, reader, writer):
+        self.connections[seat] = (reader, writer, Framer())
+        if len(self.names) == self.players and all(self.connections):
+            self._connected.set()
+
+    async def run(self):
+        """Play the match once every player is connected, returns the seats in leader board order."""
+        await self._connected.wait()
+        self._registration.close()
+        sim = self.sim = Simulator(mapgen.generate(self.players, self.seed), seed=self.seed)
+        sim.names = [(key, name) for (key, _), name in zip(sim.names, self.names)]
+        killed_round = [0] * self.players
+        for (_, writer, _), (key, _) in zip(self.connections, sim.names):
+            writer.write(encode(PLAYER_REGISTERED, key))
+        while not sim.finished() and (self.rounds is None or sim.round < self.rounds):
+            text = console_render(sim.to_state())
+            for seat, (_, writer, _) in enumerate(self.connections):
+                if not sim.killed[seat]:
+                    writer.write(encode(GAME_MAP, text))
+            actions = await asyncio.gather(*(self._command(seat) for seat in range(self.players)))
+            failed = sim.step(actions)
+            del sim.log[:]
+            for seat in failed:
+                self.connections[seat][1].write(encode(COMMAND_FAILED, 'Command {} failed'.format(actions[seat])))
+            for seat, killed in enumerate(sim.killed):
+                if killed and not killed_round[seat]:
+                    killed_round[seat] = sim.round
+                    self.connections[seat][1].write(encode(KILLED, console_render(sim.to_state())))
+        for _, writer, _ in self.connections:
+            writer.write(encode(GAME_COMPLETE))
+            await writer.drain()
+            writer.close()
+        return [(sim.names[seat][0], self.names[seat], sim.score(seat), sim.killed[seat])
+                for seat in leader_board(sim, killed_round)]
+
+    async def _command(self, seat):
+        if self.sim.killed[seat]:
+            return None
+        reader, _, framer = self.connections[seat]
+        try:
+            while True:
+                data = await asyncio.wait_for(reader.read(READ_SIZE), self.command_timeout)
+                if not data:
+                    return DO_NOTHING
+                for message_type, message in framer.feed(data):
+                    if message_type == COMMAND:
+                        return COMMANDS.get(message.lower(), DO_NOTHING)
+        except asyncio.TimeoutError:
+            logger.warning('No command from {} in time'.format(self.names[seat]))
+            return DO_NOTHING
+
+
+async def stand_in_match(players, seed, think, rounds=None):
+    """Seats of a match between ``players`` bots over sockets to a ``StandInHost``."""
+    host = StandInHost(players, seed, port=0, rounds=rounds)
+    await host.start()
+    bots = [SocketBot('Bot{}'.format(seat), '127.0.0.1', host.port, think) for seat in range(players)]
+    clients = [asyncio.ensure_future(bot.play()) for bot in bots]
+    seats = await host.run()
+    await asyncio.gather(*clients)
+    return seats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='localhost', help='SocketHost to connect to')
+    parser.add_argument('--port', type=int, default=PORT, help='registration port of the host')
+    parser.add_argument('--name', default='Python3', help='player name to register')
+    parser.add_argument('--think', type=float, default=DEADLINE - SAFETY_MARGIN, help='seconds to search per round')
+    parser.add_argument('--stand-in', type=int, metavar='PLAYERS',
+                        help='play this many bots against each other on a local stand-in host instead')
+    parser.add_argument('--seed', type=int, default=0, help='map seed of the stand-in match')
+    parser.add_argument('--rounds', type=int, help='rounds the stand-in match is cut off after')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)-7s - [%(funcName)s] %(message)s')
+    if args.stand_in:
+        seats = asyncio.run(stand_in_match(args.stand_in, args.seed, args.think, args.rounds))
+        for rank, (key, name, points, killed) in enumerate(seats):
+            print('{}. {} ({}) {} points{}'.format(rank + 1, name, key, points, ', killed' if killed else ''))
+        return
+    bot = SocketBot(args.name, args.host, args.port, args.think, model=OpponentModel.load())
+    asyncio.run(bot.play())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,453 @@
+"""Compact, array backed game state for the bot.
+
+The engine serialises every game block of the map as its own JSON object, so
+``json.load`` on state.json builds hundreds of nested dicts that the bot only
+ever reads once.  ``parse_state`` skips the JSON decoder for the map
+altogether.  Json.NET writes the blocks in a fixed shape, column after column,
+so one regular expression over the raw bytes picks out the type of every
+block's entity in order, and the few bombs, power ups and exploding blocks are
+found by patterns that end in their location.  Only the players and the map
+size are decoded as JSON.  Every kind of block found is counted against the
+file, and anything that does not add up is decoded with ``json.loads`` and read
+from the dicts instead.  Run this module to compare the two.
+
+The engine also writes the round to map.txt, a character per block and a short
+list of bombs per player, under a kilobyte against some 58 KB of JSON.
+``parse_map`` builds the same state from it whenever the text shows the whole
+round, and ``load_round`` reads whichever of the two files will do.  Set
+``BOT_CHECK_STATE`` in the environment to read both every round and log any
+difference.  ``render_map`` draws a state the way the engine writes map.txt.
+
+Coordinates are zero based.  The engine location (X, Y) is stored at index
+``(Y - 1) * width + (X - 1)`` of every grid.
+"""
+import array
+import json
+import logging
+import os
+import re
+import struct
+
+NO_POWER_UP = 0
+BOMB_BAG = 1
+BOMB_RADIUS = 2
+SUPER_POWER_UP = 3
+
+NO_OWNER = -1
+
+_WALL = 1
+_DESTRUCTIBLE = 2
+_PLAYER = 3
+
+# width, height, round, map seed, player count; then per player: key, x, y, killed, bomb bag, radius, points.
+_PACKED_HEADER = struct.Struct('<HHiiH')
+_PACKED_PLAYER = struct.Struct('<8sHHbiii')
+# Bytes per cell of the packed grids: wall, destructible, bomb fuse, bomb radius (two), owner, power up, exploding.
+_PACKED_CELL = 8
+
+_ENTITY_TYPES = {
+    'Domain.Entities.IndestructibleWallEntity, Domain': _WALL,
+    'Domain.Entities.DestructibleWallEntity, Domain': _DESTRUCTIBLE,
+    'Domain.Entities.PlayerEntity, Domain': _PLAYER,
+    'Domain.Entities.PowerUps.BombBagPowerUpEntity, Domain': BOMB_BAG,
+    'Domain.Entities.PowerUps.BombRaduisPowerUpEntity, Domain': BOMB_RADIUS,
+    'Domain.Entities.PowerUps.SuperPowerUp, Domain': SUPER_POWER_UP,
+}
+
+
+# Entity of every block in order: the first letter of its type, or the comma after null.
+_BLOCK = re.compile(rb'\{"Entity":(?:null|\{"\$type":"Domain\.Entities\.)(.)', re.S)
+_BOMB = re.compile(rb'"Bomb":\{"Owner":(?:null|\{[^{]*?"Key":"((?:[^"\\]|\\.)*)"[^{]*\{[^}]*\}\}),'
+                   rb'"BombRadius":(\d+),"BombTimer":(\d+),"IsExploding":(?:true|false),"Location":\{"X":(\d+),"Y":(\d+)\}')
+_POWER_UP = re.compile(rb'"PowerUp":\{"\$type":"Domain\.Entities\.PowerUps\.(\w+), Domain","Location":\{"X":(\d+),"Y":(\d+)\}')
+_EXPLODING = re.compile(rb'"Exploding":true,"Location":\{"X":(\d+),"Y":(\d+)\}')
+_MAP_SEED = re.compile(rb'"MapSeed":(-?\d+)')
+_WALL_CODES = bytes(1 if code == ord('I') else 0 for code in range(256))
+_DESTRUCTIBLE_CODES = bytes(1 if code == ord('D') else 0 for code in range(256))
+_MAP_HEADER = re.compile(rb'Map Width: (\d+), Map Height: (\d+), Current Round: (\d+), Seed: (-?\d+)\r?\n')
+_MAP_PLAYER = re.compile(rb'Player Name: ([^\r\n]*)\r?\nKey: ([^\r\n]*)\r?\nPoints: (-?\d+)\r?\nStatus: (\w+)\r?\n'
+                         rb'Bombs: (.*?)\r?\nBombBag: (-?\d+)\r?\nBlastRadius: (\d+)', re.S)
+_MAP_BOMB = re.compile(rb'\{x:(\d+),y:(\d+),fuse:(\d+),radius:(\d+)\}')
+_MAP_WALLS = bytes(1 if code == ord('#') else 0 for code in range(256))
+_MAP_DESTRUCTIBLES = bytes(1 if code == ord('+') else 0 for code in range(256))
+_MAP_POWER_UPS = bytes({ord('&'): BOMB_BAG, ord('!'): BOMB_RADIUS, ord('$'): SUPER_POWER_UP}.get(code, NO_POWER_UP)
+                       for code in range(256))
+_POWER_UP_TYPES = {
+    b'BombBagPowerUpEntity': BOMB_BAG,
+    b'BombRaduisPowerUpEntity': BOMB_RADIUS,
+    b'SuperPowerUp': SUPER_POWER_UP,
+}
+
+
+# Read both state files every round and log where they differ.
+CHECK_SOURCES = bool(os.environ.get('BOT_CHECK_STATE'))
+
+logger = logging.getLogger(__name__)
+
+
+class Player(object):
+    __slots__ = ('index', 'key', 'name', 'points', 'killed', 'bomb_bag', 'bomb_radius', 'x', 'y')
+
+    def __init__(self, index, key, name, points, killed, bomb_bag, bomb_radius, x, y):
+        self.index = index
+        self.key = key
+        self.name = name
+        self.points = points
+        self.killed = killed
+        self.bomb_bag = bomb_bag
+        self.bomb_radius = bomb_radius
+        self.x = x
+        self.y = y
+
+    def copy(self):
+        return Player(self.index, self.key, self.name, self.points, self.killed,
+                      self.bomb_bag, self.bomb_radius, self.x, self.y)
+
+    def __repr__(self):
+        return 'Player({}, x={}, y={}, bag={}, radius={}, points={}{})'.format(
+            self.key, self.x, self.y, self.bomb_bag, self.bomb_radius, self.points,
+            ', killed' if self.killed else '')
+
+
+class State(object):
+    """One round of the game.
+
+    ``wall``, ``destructible``, ``power_up`` and ``exploding`` are byte grids,
+    ``bomb_fuse``/``bomb_radius``/``bomb_owner`` describe the bomb (if any) on a
+    cell, with ``bomb_owner`` holding the owner's index into ``players``.
+    """
+    __slots__ = ('width', 'height', 'round', 'seed', 'wall', 'destructible', 'bomb_fuse',
+                 'bomb_radius', 'bomb_owner', 'power_up', 'exploding', 'players')
+
+    def __init__(self, width, height, round=0, seed=0):
+        size = width * height
+        self.width = width
+        self.height = height
+        self.round = round
+        self.seed = seed
+        self.wall = array.array('b', bytes(size))
+        self.destructible = array.array('b', bytes(size))
+        self.bomb_fuse = array.array('b', bytes(size))
+        self.bomb_radius = array.array('h', bytes(2 * size))
+        self.bomb_owner = array.array('b', [NO_OWNER]) * size
+        self.power_up = array.array('b', bytes(size))
+        self.exploding = array.array('b', bytes(size))
+        self.players = []
+
+    @property
+    def size(self):
+        return self.width * self.height
+
+    def index(self, x, y):
+        return y * self.width + x
+
+    def player(self, key):
+        for player in self.players:
+            if player.key == key:
+                return player
+        return None
+
+    def bombs(self):
+        """Yield ``(cell, fuse, radius, owner)`` for every bomb on the map."""
+        fuse = self.bomb_fuse
+        for cell in range(len(fuse)):
+            if fuse[cell]:
+                yield cell, fuse[cell], self.bomb_radius[cell], self.bomb_owner[cell]
+
+    def copy(self):
+        other = State.__new__(State)
+        other.width = self.width
+        other.height = self.height
+        other.round = self.round
+        other.seed = self.seed
+        other.wall = array.array('b', self.wall)
+        other.destructible = array.array('b', self.destructible)
+        other.bomb_fuse = array.array('b', self.bomb_fuse)
+        other.bomb_radius = array.array('h', self.bomb_radius)
+        other.bomb_owner = array.array('b', self.bomb_owner)
+        other.power_up = array.array('b', self.power_up)
+        other.exploding = array.array('b', self.exploding)
+        other.players = [player.copy() for player in self.players]
+        return other
+
+
+def parse_state(data):
+    """``State`` from the contents of state.json (``bytes`` or ``str``), see the module docstring."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    view = memoryview(data)
+    blocks_at = data.find(b'"GameBlocks":')
+    if blocks_at < 0:
+        return _decode_state(data)
+    # Everything before the blocks is the players and the map size, close it off and decode just that.
+    try:
+        fields = json.loads(bytes(view[:blocks_at]).rstrip().rstrip(b',') + b'}')
+        width, height = fields['MapWidth'], fields['MapHeight']
+        players = fields['RegisteredPlayerEntities']
+    except (ValueError, KeyError, TypeError):
+        return _decode_state(data)
+    seed, seed_at = 0, data.rfind(b'"MapSeed":')
+    if seed_at >= 0:
+        found = _MAP_SEED.match(data, seed_at)
+        if found is None:
+            return _decode_state(data)
+        seed = int(found.group(1))
+
+    codes = _BLOCK.findall(data, blocks_at)
+    if len(codes) != width * height:
+        return _decode_state(data)
+    codes = b''.join(codes)
+    # Blocks come column by column, the grids go row by row.
+    rows = b''.join([codes[y::height] for y in range(height)])
+
+    state = State(width, height, fields.get('CurrentRound', 0), seed)
+    state.wall = array.array('b', rows.translate(_WALL_CODES))
+    state.destructible = array.array('b', rows.translate(_DESTRUCTIBLE_CODES))
+    owners = {}
+    for index, fields in enumerate(players):
+        x, y = fields['Location']['X'], fields['Location']['Y']
+        state.players.append(Player(index, fields['Key'], fields.get('Name'), fields['Points'], fields['Killed'],
+                                    fields['BombBag'], fields['BombRadius'], x - 1, y - 1))
+        owners[fields['Key']] = index
+
+    found = 0
+    for key, radius, timer, x, y in _BOMB.findall(data, blocks_at):
+        cell = (int(y) - 1) * width + int(x) - 1
+        state.bomb_fuse[cell] = int(timer)
+        state.bomb_radius[cell] = int(radius)
+        state.bomb_owner[cell] = owners.get(json.loads(b'"' + key + b'"'), NO_OWNER) if key else NO_OWNER
+        found += 1
+    if found != data.count(b'"Bomb":{', blocks_at):
+        return _decode_state(data)
+    found = 0
+    for kind, x, y in _POWER_UP.findall(data, blocks_at):
+        state.power_up[(int(y) - 1) * width + int(x) - 1] = _POWER_UP_TYPES.get(kind, NO_POWER_UP)
+        found += 1
+    if found != data.count(b'"PowerUp":{', blocks_at):
+        return _decode_state(data)
+    found = 0
+    for x, y in _EXPLODING.findall(data, blocks_at):
+        state.exploding[(int(y) - 1) * width + int(x) - 1] = 1
+        found += 1
+    if found != data.count(b'"Exploding":true', blocks_at):
+        return _decode_state(data)
+    return state
+
+
+def _decode_state(data):
+    """``State`` the plain way, ``json.loads`` and a walk over the dicts, for files ``parse_state`` cannot scan."""
+    fields = json.loads(data)
+    state = State(fields['MapWidth'], fields['MapHeight'], fields.get('CurrentRound', 0), fields.get('MapSeed', 0))
+    owners = {}
+    for index, player in enumerate(fields['RegisteredPlayerEntities']):
+        location = player['Location']
+        state.players.append(Player(index, player['Key'], player.get('Name'), player['Points'], player['Killed'],
+                                    player['BombBag'], player['BombRadius'], location['X'] - 1, location['Y'] - 1))
+        owners[player['Key']] = index
+    for column in fields['GameBlocks']:
+        for block in column:
+            location = block['Location']
+            cell = (location['Y'] - 1) * state.width + location['X'] - 1
+            entity = _ENTITY_TYPES.get(block['Entity']['$type'], 0) if block['Entity'] else 0
+            if entity == _WALL:
+                state.wall[cell] = 1
+            elif entity == _DESTRUCTIBLE:
+                state.destructible[cell] = 1
+            bomb = block['Bomb']
+            if bomb:
+                state.bomb_fuse[cell] = bomb['BombTimer']
+                state.bomb_radius[cell] = bomb['BombRadius']
+                state.bomb_owner[cell] = owners.get((bomb['Owner'] or {}).get('Key'), NO_OWNER)
+            if block['PowerUp']:
+                state.power_up[cell] = _ENTITY_TYPES.get(block['PowerUp']['$type'], 0)
+            if block['Exploding']:
+                state.exploding[cell] = 1
+    return state
+
+
+def load_state(path):
+    with open(path, 'rb') as f:
+        return parse_state(f.read())
+
+
+def parse_map(data, previous=None):
+    """``State`` from the bytes of map.txt, or ``None`` where the text leaves out what state.json shows.
+
+    The text draws one character per block and lists every player's bombs, which
+    is all the compact state holds, except that a blast (``*``) hides what is
+    under it and a player that is not drawn has no location.  Rounds with
+    either are left to state.json, unless the state of the round before is
+    given as ``previous``: a blast leaves no wall, bomb or live player behind,
+    so the cell keeps the power up it had (a power up revealed by the blast
+    shows when it clears), and a dead player keeps its last location.
+    """
+    header = _MAP_HEADER.match(data)
+    if header is None:
+        return None
+    width, height, round, seed = map(int, header.groups())
+    lines = data[header.end():].split(b'\n', height)
+    if len(lines) <= height:
+        return None
+    rows = b''.join([line.rstrip(b'\r') for line in lines[:height]])
+    if len(rows) != width * height or (b'*' in rows and previous is None):
+        return None
+
+    state = State(width, height, round, seed)
+    state.wall = array.array('b', rows.translate(_MAP_WALLS))
+    state.destructible = array.array('b', rows.translate(_MAP_DESTRUCTIBLES))
+    state.power_up = array.array('b', rows.translate(_MAP_POWER_UPS))
+    if previous is not None and (previous.width, previous.height) != (width, height):
+        return None
+    blast = rows.find(b'*')
+    while blast >= 0:
+        state.exploding[blast] = 1
+        if not previous.destructible[blast]:
+            state.power_up[blast] = previous.power_up[blast]
+        blast = rows.find(b'*', blast + 1)
+    bombs = 0
+    for index, fields in enumerate(_MAP_PLAYER.findall(lines[height])):
+        name, key, points, status, placed, bomb_bag, radius = fields
+        cell = rows.find(key)
+        if cell < 0:
+            cell = rows.find(key.lower())
+        if cell < 0 and status != b'Alive' and previous is not None and index < len(previous.players):
+            cell = previous.players[index].y * width + previous.players[index].x
+        if cell < 0 or len(key) != 1:
+            return None
+        placed = _MAP_BOMB.findall(placed)
+        for x, y, fuse, bomb_radius in placed:
+            bomb = (int(y) - 1) * width + int(x) - 1
+            state.bomb_fuse[bomb] = int(fuse)
+            state.bomb_radius[bomb] = int(bomb_radius)
+            state.bomb_owner[bomb] = index
+        bombs += len(placed)
+        # The bag shown is what is left of it.
+        state.players.append(Player(index, key.decode('utf-8'), name.decode('utf-8') or None, int(points),
+                                    status != b'Alive', int(bomb_bag) + len(placed), int(radius),
+                                    cell % width, cell // width))
+    # Every bomb drawn has to be on a player's list.
+    drawn = len(rows) - len(rows.translate(None, b'0123456789abcdefghijklmnopqrstuvwxyz'))
+    if not state.players or drawn != bombs:
+        return None
+    return state
+
+
+def render_map(state, minify=True, newline='\n'):
+    """map.txt text of ``state`` the way ``GameMapRender.RenderTextGameState`` draws it, for ``parse_map``.
+
+    The engine ends its lines with ``Environment.NewLine``, ``\r\n`` on Windows.
+    """
+    width = state.width
+    rows = bytearray(b' ' * state.size)
+    for cell, power_up in enumerate(state.power_up):
+        if power_up:
+            rows[cell] = b' &!$'[power_up]
+    for cell in range(state.size):
+        if state.wall[cell]:
+            rows[cell] = ord('#')
+        elif state.destructible[cell]:
+            rows[cell] = ord('+')
+    for player in state.players:
+        if not player.killed:
+            rows[player.y * width + player.x] = ord(player.key)
+    placed = [[] for _ in state.players]
+    for cell, fuse, radius, owner in state.bombs():
+        owner_player = state.players[owner]
+        if owner_player.y * width + owner_player.x == cell and not owner_player.killed:
+            rows[cell] = ord(owner_player.key.lower())
+        else:
+            rows[cell] = ord(str(fuse))
+        placed[owner].append('{{x:{},y:{},fuse:{},radius:{}}}'.format(cell % width + 1, cell // width + 1, fuse, radius))
+    for cell, exploding in enumerate(state.exploding):
+        if exploding:
+            rows[cell] = ord('*')
+
+    lines = ['Map Width: {}, Map Height: {}, Current Round: {}, Seed: {}'.format(
+        width, state.height, state.round, state.seed)]
+    text = rows.decode('ascii')
+    lines.extend(text[row:row + width] for row in range(0, state.size, width))
+    for player, bombs in zip(state.players, placed):
+        lines.extend(('-' * 27, 'Player Name: {}'.format(player.name or ''), 'Key: {}'.format(player.key),
+                      'Points: {}'.format(player.points), 'Status: {}'.format('Dead' if player.killed else 'Alive'),
+                      'Bombs: {}'.format((',' if minify else ',' + newline).join(bombs)),
+                      'BombBag: {}'.format(player.bomb_bag - len(bombs)),
+                      'BlastRadius: {}'.format(player.bomb_radius), '-' * 27))
+    return newline.join(lines) + newline
+
+
+def load_round(folder, check=CHECK_SOURCES):
+    """``State`` of the round the engine wrote to ``folder``, from map.txt where it will do.
+
+    map.txt is some 60 times smaller than state.json and parses in a fraction of
+    the time; state.json is read when the text cannot tell the whole round (see
+    ``parse_map``).  With ``check`` both are read and any difference is logged,
+    state.json wins.
+    """
+    state = None
+    try:
+        with open(os.path.join(folder, 'map.txt'), 'rb') as f:
+            state = parse_map(f.read())
+    except OSError:
+        pass
+    if state is None or check:
+        from_json = load_state(os.path.join(folder, 'state.json'))
+        if state is not None and (pack(state) != pack(from_json) or [player.name for player in state.players] !=
+                                  [player.name for player in from_json.players]):
+            logger.warning('map.txt and state.json of round {} differ'.format(from_json.round))
+        state = from_json
+    return state
+
+
+def packed_size(size, players):
+    """Length of ``pack`` output for a map of ``size`` cells and ``players`` players."""
+    return _PACKED_HEADER.size + _PACKED_CELL * size + _PACKED_PLAYER.size * players
+
+
+def pack(state):
+    """The state as ``packed_size`` bytes for ``unpack``, player names are left out."""
+    parts = [_PACKED_HEADER.pack(state.width, state.height, state.round, state.seed, len(state.players))]
+    for grid in (state.wall, state.destructible, state.bomb_fuse, state.bomb_radius,
+                 state.bomb_owner, state.power_up, state.exploding):
+        parts.append(grid.tobytes())
+    for player in state.players:
+        parts.append(_PACKED_PLAYER.pack((player.key or '').encode('utf-8'), player.x, player.y, player.killed,
+                                         player.bomb_bag, player.bomb_radius, player.points))
+    return b''.join(parts)
+
+
+def unpack(data):
+    """``State`` from the output of ``pack`` (any bytes-like object)."""
+    width, height, round, seed, players = _PACKED_HEADER.unpack_from(data)
+    state = State(width, height, round, seed)
+    size, offset = width * height, _PACKED_HEADER.size
+    for grid in (state.wall, state.destructible, state.bomb_fuse, state.bomb_radius,
+                 state.bomb_owner, state.power_up, state.exploding):
+        length = size * grid.itemsize
+        grid[:] = array.array(grid.typecode, bytes(data[offset:offset + length]))
+        offset += length
+    for index in range(players):
+        key, x, y, killed, bomb_bag, radius, points = _PACKED_PLAYER.unpack_from(data, offset)
+        state.players.append(Player(index, key.rstrip(b'\0').decode('utf-8') or None, None, points, bool(killed),
+                                    bomb_bag, radius, x, y))
+        offset += _PACKED_PLAYER.size
+    return state
+
+
+def _benchmark(path):
+    import timeit
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    assert pack(parse_state(data)) == pack(_decode_state(data))
+
+    print('{}: {} bytes'.format(path, len(data)))
+    for name, parse in (('json.loads and dict walking', _decode_state), ('parse_state', parse_state)):
+        seconds = min(timeit.repeat(lambda: parse(data), number=100, repeat=5)) / 100
+        print('{:<30} {:8.1f} us'.format(name, seconds * 1e6))
+
+
+if __name__ == '__main__':
+    import sys
+
+    _benchmark(sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', '..', 'Sample State Files', 'state.json'))
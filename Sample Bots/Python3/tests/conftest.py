@@ -0,0 +1,51 @@
+"""Shared setup of the bot's tests: the bot folder on the path and its caches kept out of it."""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_FILES = os.path.join(BOT_DIR, '..', '..', 'Sample State Files')
+
+# Read when the modules are imported, so set before any of them is.
+os.environ.setdefault('BOT_CACHE_DIR', tempfile.mkdtemp(prefix='bot-tests-'))
+sys.path.insert(0, BOT_DIR)
+
+
+@pytest.fixture(scope='session')
+def sample_files():
+    """Raw state.json and map.txt of the sample round."""
+    files = {}
+    for name in ('state.json', 'map.txt'):
+        with open(os.path.join(STATE_FILES, name), 'rb') as f:
+            files[name] = f.read()
+    return files
+
+
+def _random_game(players, seed, rounds):
+    import random
+
+    import mapgen
+    import search
+    from simulator import ACTIONS, Simulator
+
+    sim = Simulator(mapgen.generate(players, seed), seed=seed)
+    rng = random.Random(seed)
+    states = [sim.to_state()]
+    for _ in range(rounds):
+        if sim.finished():
+            break
+        state = states[-1]
+        # A depth one search keeps the players alive for a while, the random commands add the odd blunder.
+        sim.step([None if player.killed else rng.choice(ACTIONS) if rng.random() < 0.05 else
+                  search.Planner(state, player.key, 0).search()[0] for player in state.players])
+        del sim.log[:]
+        states.append(sim.to_state())
+    return states
+
+
+@pytest.fixture(scope='session')
+def random_games():
+    """The state of every round of a few games played out on the simulator."""
+    return [_random_game(players, seed, 120) for players, seed in ((2, 2), (4, 5), (8, 1))]
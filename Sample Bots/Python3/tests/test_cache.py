@@ -0,0 +1,88 @@
+import shutil
+import struct
+
+import pytest
+
+import cache
+import diff
+
+TABLE_BITS = 10
+KEY = 0x1234567890abcdef
+
+
+@pytest.fixture
+def rounds(random_games):
+    """Two rounds in a row of a played game."""
+    states = random_games[1]
+    return states[10], states[11]
+
+
+def write_round(path, state, player_key='A', table_bits=TABLE_BITS):
+    """Open the cache for ``state``, store its maps and a table entry and close it, the way a round does."""
+    found = cache.open_cache(state, player_key, table_bits, path)
+    found.table.store(KEY, 3, 42.0)
+    found.store(diff.Derived.build(state))
+    found.close()
+
+
+def test_next_round_reuses_the_cache(tmp_path, rounds):
+    path = str(tmp_path / 'bot-A.cache')
+    first, second = rounds
+    with cache.open_cache(first, 'A', TABLE_BITS, path) as found:
+        assert not found.reused and found.previous() is None
+    write_round(path, first)
+    with cache.open_cache(second, 'A', TABLE_BITS, path) as found:
+        assert found.reused
+        assert found.table.lookup(KEY, 3) == 42.0
+        previous = found.previous()
+        built = diff.Derived.build(first)
+        assert previous.state.round == first.round
+        assert (previous.danger, previous.distance, previous.visited) == (built.danger, built.distance, built.visited)
+
+
+@pytest.mark.parametrize('change', ['seed', 'players', 'player key', 'table bits', 'earlier round', 'version'])
+def test_header_of_another_game_invalidates_the_cache(tmp_path, rounds, change):
+    path = str(tmp_path / 'bot-A.cache')
+    first, second = rounds
+    write_round(path, first)
+    player_key, table_bits = 'A', TABLE_BITS
+    if change == 'seed':
+        second = second.copy()
+        second.seed += 1
+    elif change == 'players':
+        second = second.copy()
+        second.players = second.players[:-1]
+    elif change == 'player key':
+        player_key = 'B'
+    elif change == 'table bits':
+        table_bits += 1
+    elif change == 'earlier round':
+        second = second.copy()
+        second.round = first.round - 1
+    elif change == 'version':
+        with open(path, 'r+b') as f:
+            f.seek(8)
+            f.write(struct.pack('<H', cache.VERSION - 1))
+    with cache.open_cache(second, player_key, table_bits, path) as found:
+        assert not found.reused
+        assert found.previous() is None
+        assert found.table.lookup(KEY, 3) is None
+
+
+def test_round_cut_short_leaves_no_maps_behind(tmp_path, rounds):
+    path = str(tmp_path / 'bot-A.cache')
+    first, second = rounds
+    write_round(path, first)
+    # The file as a round that died before ``close`` leaves it.
+    found = cache.open_cache(second, 'A', TABLE_BITS, path)
+    shutil.copy(path, str(tmp_path / 'cut.cache'))
+    found.close()
+    with cache.open_cache(second, 'A', TABLE_BITS, str(tmp_path / 'cut.cache')) as found:
+        assert found.reused and found.previous() is None
+
+
+@pytest.mark.skipif(cache.fcntl is None, reason='the cache is only locked where fcntl is available')
+def test_cache_in_use_is_not_opened_twice(tmp_path, rounds):
+    path = str(tmp_path / 'bot-A.cache')
+    with cache.open_cache(rounds[0], 'A', TABLE_BITS, path):
+        assert cache.open_cache(rounds[0], 'A', TABLE_BITS, path) is None
@@ -0,0 +1,119 @@
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+import daemon
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='the daemon needs Unix sockets')
+
+
+@pytest.fixture
+def serve(tmp_path, monkeypatch):
+    """Start a daemon on a socket in ``tmp_path`` that plays its rounds with the ``bot.main`` given."""
+    import bot
+
+    monkeypatch.setattr(bot, 'configure_logging', lambda *args, **kwargs: None)
+    path = str(tmp_path / 'bot.sock')
+    threads = []
+
+    def start(main):
+        monkeypatch.setattr(bot, 'main', main)
+        thread = threading.Thread(target=daemon.serve, args=(path, 0.5), daemon=True)
+        thread.start()
+        threads.append(thread)
+        started = time.monotonic()
+        while not os.path.exists(path):
+            assert time.monotonic() - started < 5, 'the daemon did not start'
+            time.sleep(0.01)
+        # Bound before it listens.
+        time.sleep(0.1)
+        return path
+
+    yield start
+    for thread in threads:
+        thread.join(5)
+        assert not thread.is_alive()
+
+
+def test_no_daemon_leaves_the_round_to_the_client(tmp_path):
+    assert daemon.request_move('A', str(tmp_path), path=str(tmp_path / 'missing.sock')) is None
+
+
+def test_socket_left_behind_leaves_the_round_to_the_client(tmp_path):
+    path = str(tmp_path / 'stale.sock')
+    left = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    left.bind(path)
+    left.close()
+    assert daemon.request_move('A', str(tmp_path), path=path) is None
+
+
+def test_move_comes_back(tmp_path, serve):
+    asked = []
+
+    def main(player_key, output_path, deadline, pool=None, reply=None):
+        asked.append((player_key, output_path))
+        reply(3)
+
+    path = serve(main)
+    assert daemon.request_move('A', str(tmp_path), path=path) == 3
+    assert asked == [('A', str(tmp_path))]
+
+
+def test_failed_round_is_left_to_the_client(tmp_path, serve):
+    def main(player_key, output_path, deadline, pool=None, reply=None):
+        raise RuntimeError('no state.json')
+
+    path = serve(main)
+    assert daemon.request_move('A', str(tmp_path), path=path) is None
+
+
+def test_round_without_a_move_is_left_to_the_client(tmp_path, serve):
+    def main(player_key, output_path, deadline, pool=None, reply=None):
+        pass
+
+    path = serve(main)
+    assert daemon.request_move('A', str(tmp_path), path=path) is None
+
+
+def test_busy_daemon_turns_the_next_client_away(tmp_path, serve):
+    playing, release = threading.Event(), threading.Event()
+
+    def main(player_key, output_path, deadline, pool=None, reply=None):
+        playing.set()
+        release.wait(5)
+        reply(1)
+
+    path = serve(main)
+    first = []
+    client = threading.Thread(target=lambda: first.append(
+        daemon.request_move('A', str(tmp_path), time.monotonic() + 5, path=path)))
+    client.start()
+    assert playing.wait(5)
+    started = time.monotonic()
+    assert daemon.request_move('B', str(tmp_path), time.monotonic() + 5, path=path) is None
+    assert time.monotonic() - started < 1
+    release.set()
+    client.join(5)
+    assert first == [1]
+
+
+def test_daemon_that_does_not_answer_in_time_times_out(tmp_path, serve):
+    def main(player_key, output_path, deadline, pool=None, reply=None):
+        time.sleep(0.8)
+        reply(1)
+
+    path = serve(main)
+    with pytest.raises(daemon.DaemonTimeout):
+        daemon.request_move('A', str(tmp_path), time.monotonic() + 0.3, path=path)
+
+
+def test_no_time_left_to_ask_times_out(tmp_path, serve):
+    def main(player_key, output_path, deadline, pool=None, reply=None):
+        reply(1)
+
+    path = serve(main)
+    with pytest.raises(daemon.DaemonTimeout):
+        daemon.request_move('A', str(tmp_path), time.monotonic(), path=path)
@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+import diff
+
+
+def assert_same_maps(updated, state):
+    built = diff.Derived.build(state)
+    # ``visited`` is not compared, it keeps every cell stood on since the first state by design.
+    assert updated.danger == built.danger
+    assert updated.distance == built.distance
+
+
+@pytest.mark.parametrize('every', [1, 3])
+def test_update_matches_build_over_played_rounds(random_games, every):
+    for states in random_games:
+        derived = diff.Derived.build(states[0])
+        for previous, state in zip(states[::every], states[every::every]):
+            derived.update(state, diff.diff(previous, state))
+            assert_same_maps(derived, state)
+
+
+def random_delta(state, rng):
+    """A later ``state`` with walls, bombs, power ups and players changed at random."""
+    rounds = rng.choice((1, 1, 2, 3))
+    new = state.copy()
+    new.round += rounds
+    for cell in range(new.size):
+        if new.destructible[cell] and rng.random() < 0.05:
+            new.destructible[cell] = 0
+        if new.bomb_fuse[cell]:
+            fuse = new.bomb_fuse[cell] - rounds
+            if fuse <= 0 or rng.random() < 0.1:
+                new.bomb_fuse[cell], new.bomb_radius[cell], new.bomb_owner[cell] = 0, 0, -1
+            else:
+                # Now and then a trigger.
+                new.bomb_fuse[cell] = 1 if rng.random() < 0.1 else fuse
+        if new.power_up[cell] and rng.random() < 0.1:
+            new.power_up[cell] = 0
+    open_cells = [cell for cell in range(new.size) if not new.wall[cell] and not new.destructible[cell]]
+    for cell in rng.sample(open_cells, 4):
+        if not new.bomb_fuse[cell]:
+            new.bomb_fuse[cell] = rng.randint(1, 10)
+            new.bomb_radius[cell] = rng.choice((1, 2, 4, 8))
+            new.bomb_owner[cell] = rng.randrange(len(new.players))
+    for cell in rng.sample(open_cells, 2):
+        new.power_up[cell] = rng.randint(1, 3)
+    for player in new.players:
+        if rng.random() < 0.5:
+            player.y, player.x = divmod(rng.choice(open_cells), new.width)
+    return new
+
+
+def test_update_matches_build_on_random_deltas(random_games):
+    rng = random.Random(0)
+    for states in random_games:
+        state = states[len(states) // 2]
+        derived = diff.Derived.build(state)
+        for _ in range(30):
+            new = random_delta(state, rng)
+            derived.update(new, diff.diff(state, new))
+            assert_same_maps(derived, new)
+            state = new
+
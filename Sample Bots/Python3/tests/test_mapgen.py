@@ -0,0 +1,53 @@
+import pytest
+
+import mapgen
+import state
+from state import BOMB_BAG, BOMB_RADIUS, SUPER_POWER_UP
+
+
+@pytest.mark.parametrize('seed, expected', [
+    (0, [1559595546, 1755192844, 1649316166]),
+    (42, [1434747710, 302596119, 269548474]),
+])
+def test_dotnet_random_matches_system_random(seed, expected):
+    # new System.Random(seed).Next() on the .NET Framework.
+    rng = mapgen.DotNetRandom(seed)
+    assert [rng.next() for _ in expected] == expected
+
+
+def test_next_many_matches_next():
+    one, many = mapgen.DotNetRandom(7), mapgen.DotNetRandom(7)
+    assert [one.next(3, 40) for _ in range(200)] == many.next_many(200, 3, 40)
+    assert one.next() == many.next()
+
+
+def test_sample_round_is_on_the_map_of_its_seed(sample_files):
+    # The engine generated the sample game from MapSeed 203279916, 165 rounds before the sample round.
+    sample = state.parse_state(sample_files['state.json'])
+    generated = mapgen.generate(len(sample.players), sample.seed)
+    assert (generated.width, generated.height) == (sample.width, sample.height)
+    assert list(generated.wall) == list(sample.wall)
+    # Walls only ever get destroyed, and the power ups revealed since were under them.
+    assert all(generated.destructible[cell] for cell in range(sample.size) if sample.destructible[cell])
+    assert sum(generated.destructible) > sum(sample.destructible)
+    for cell in range(sample.size):
+        if sample.power_up[cell]:
+            assert sample.power_up[cell] == generated.power_up[cell]
+
+
+@pytest.mark.parametrize('players', [2, 3, 4, 5, 8, 12])
+def test_power_ups_are_hidden_under_walls(players):
+    generated = mapgen.generate(players, 12345)
+    assert generated.width == {2: 21, 3: 21, 4: 21, 5: 31, 8: 31, 12: 41}[players]
+    middle = generated.size // 2
+    assert generated.power_up[middle] == SUPER_POWER_UP and not generated.destructible[middle]
+    hidden = [cell for cell in range(generated.size) if generated.power_up[cell] in (BOMB_BAG, BOMB_RADIUS)]
+    assert hidden and all(generated.destructible[cell] and not generated.wall[cell] for cell in hidden)
+    for player in generated.players:
+        cell = generated.index(player.x, player.y)
+        assert not generated.wall[cell] and not generated.destructible[cell]
+
+
+def test_generate_is_deterministic():
+    assert state.pack(mapgen.generate(4, 99)) == state.pack(mapgen.generate(4, 99))
+    assert state.pack(mapgen.generate(4, 99)) != state.pack(mapgen.generate(4, 100))
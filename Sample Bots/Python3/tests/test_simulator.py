@@ -0,0 +1,106 @@
+import array
+
+import pytest
+
+import mapgen
+import state as compact
+from simulator import (DO_NOTHING, MOVE_DOWN, MOVE_RIGHT, PLACE_BOMB, POINTS_WALL, TRIGGER_BOMB, Simulator,
+                       bomb_timer)
+
+
+def open_map(*positions):
+    """A 21x21 map with nothing but its fixed walls and players standing on ``positions``."""
+    state = mapgen.generate(len(positions), 1)
+    state.destructible = array.array('b', bytes(state.size))
+    state.power_up = array.array('b', bytes(state.size))
+    for player, (x, y) in zip(state.players, positions):
+        player.x, player.y = x, y
+    return state
+
+
+def add_bomb(state, x, y, fuse, radius, owner):
+    cell = state.index(x, y)
+    state.bomb_fuse[cell], state.bomb_radius[cell], state.bomb_owner[cell] = fuse, radius, owner
+    return cell
+
+
+@pytest.mark.parametrize('bomb_bag, fuse', [(1, 4), (2, 7), (3, 10), (4, 10), (9, 10)])
+def test_placed_bomb_timer(bomb_bag, fuse):
+    # PlaceBombCommand: min(9, bombbag * 3) + 1.
+    assert bomb_timer(bomb_bag) == fuse
+    state = open_map((1, 1), (19, 19))
+    state.players[0].bomb_bag = bomb_bag
+    sim = Simulator(state, seed=0)
+    assert sim.step([PLACE_BOMB, DO_NOTHING]) == []
+    cell = state.index(1, 1)
+    assert sim.fuse(cell) == fuse and sim.to_state().bomb_fuse[cell] == fuse
+    sim.step([MOVE_DOWN, DO_NOTHING])
+    assert sim.to_state().bomb_fuse[cell] == fuse - 1
+
+
+def test_bomb_goes_off_when_its_timer_runs_out():
+    state = open_map((9, 1), (19, 19))
+    cell = add_bomb(state, 1, 1, 2, 1, 0)
+    sim = Simulator(state, seed=0)
+    sim.step([DO_NOTHING, DO_NOTHING])
+    assert sim.fuse(cell) == 1 and not any(sim.to_state().exploding)
+    sim.step([DO_NOTHING, DO_NOTHING])
+    after = sim.to_state()
+    assert cell not in sim.detonates
+    assert {cell for cell in range(after.size) if after.exploding[cell]} == {
+        state.index(1, 1), state.index(2, 1), state.index(1, 2)}
+    # The blast is cleared the round after.
+    sim.step([DO_NOTHING, DO_NOTHING])
+    assert not any(sim.to_state().exploding)
+
+
+def test_chain_reaction_goes_off_in_one_round_and_shares_points():
+    state = open_map((9, 1), (3, 3))
+    first = add_bomb(state, 3, 1, 1, 2, 0)
+    second = add_bomb(state, 5, 1, 5, 1, 1)
+    wall = state.index(6, 1)
+    state.destructible[wall] = 1
+    sim = Simulator(state, seed=0)
+    points = list(sim.points)
+
+    sim.step([DO_NOTHING, DO_NOTHING])
+    after = sim.to_state()
+    assert first not in sim.detonates and second not in sim.detonates
+    assert not after.destructible[wall]
+    assert {cell for cell in range(after.size) if after.exploding[cell]} == {state.index(x, y) for x, y in (
+        (1, 1), (2, 1), (3, 1), (4, 1), (5, 1), (3, 2), (3, 3), (6, 1), (5, 2))}
+    # The first bomb's blast kills B, the second takes the wall: one chain, whose points go to the owners still alive.
+    assert sim.killed == [False, True]
+    assert sim.points[0] == points[0] + POINTS_WALL + sim.kill_points
+    assert sim.points[1] == points[1] - sim.kill_points
+
+
+def test_blast_stops_at_the_first_destructible_wall():
+    state = open_map((9, 1), (19, 19))
+    add_bomb(state, 1, 1, 1, 5, 0)
+    for x in (3, 4):
+        state.destructible[state.index(x, 1)] = 1
+    sim = Simulator(state, seed=0)
+    sim.step([DO_NOTHING, DO_NOTHING])
+    assert [sim.destructible[state.index(x, 1)] for x in (3, 4)] == [0, 1]
+    assert sim.points[0] == POINTS_WALL
+
+
+def test_trigger_sets_the_lowest_timer_to_one():
+    state = open_map((9, 1), (19, 19))
+    near = add_bomb(state, 1, 1, 5, 1, 0)
+    far = add_bomb(state, 1, 5, 8, 1, 0)
+    sim = Simulator(state, seed=0)
+    sim.step([TRIGGER_BOMB, DO_NOTHING])
+    assert sim.fuse(near) == 1 and sim.fuse(far) == 7
+
+
+def test_undo_restores_the_position_and_its_hash(random_games):
+    for states in random_games:
+        sim = Simulator(states[len(states) // 2], seed=0)
+        before, hash = compact.pack(sim.to_state()), sim.hash
+        mark = sim.mark()
+        for _ in range(5):
+            sim.step([None if killed else action for killed, action in zip(sim.killed, [PLACE_BOMB, MOVE_RIGHT] * 6)])
+        sim.undo(mark)
+        assert compact.pack(sim.to_state()) == before and sim.hash == hash
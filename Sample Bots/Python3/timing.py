@@ -0,0 +1,192 @@
+"""Where the time of a round goes, one line per round.
+
+``Timer`` keeps a ``time.monotonic`` timestamp and adds the time since the
+previous mark to the phase named at every ``mark``, next to counters such as
+nodes searched.  It is cheap enough to leave on: a clock read and a dict update
+per phase.  After move.txt is written ``bot.py`` appends the round as one
+compact JSON line to ``timing.jsonl`` in its output folder, so the engine's
+Replays folder ends up holding one for every round the bot played:
+
+    {"round":165,"key":"A","total":1.702,"phases":{"imports":0.081,...},"counters":{"nodes":4846,...}}
+
+Phases are in seconds.  Run this module on a Replays folder (or any timing
+files) for the 50th, 95th and 99th percentile of every phase and counter:
+
+    python timing.py Replays
+
+Everything before the first line of bot.py runs, and the imports the timer sees
+as one phase, are broken down with ``--startup``: bot.py is run on a copy of
+the sample state under ``python -X importtime`` a few times, and the wall clock
+time of the process and every module it imports directly are reported.
+
+    python timing.py --startup
+"""
+import collections
+import json
+import os
+import time
+
+LOG_NAME = 'timing.jsonl'
+PERCENTILES = (50, 95, 99)
+BOT_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_DIR = os.path.join(BOT_DIR, '..', '..', 'Sample State Files')
+
+
+class Timer(object):
+    """Phase durations and counters of one round."""
+
+    def __init__(self, started=None):
+        self.started = self.last = time.monotonic() if started is None else started
+        self.phases = collections.OrderedDict()
+        self.counters = collections.OrderedDict()
+
+    def mark(self, phase, now=None):
+        """Add the time since the last mark (until ``now`` if given) to ``phase``."""
+        if now is None:
+            now = time.monotonic()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def count(self, name, value):
+        self.counters[name] = value
+
+    def record(self, **fields):
+        record = collections.OrderedDict(fields)
+        record['total'] = round(self.last - self.started, 6)
+        record['phases'] = collections.OrderedDict((phase, round(seconds, 6)) for phase, seconds in self.phases.items())
+        record['counters'] = self.counters
+        return record
+
+    def write(self, folder, **fields):
+        """Append the round to the timing log in ``folder``."""
+        with open(os.path.join(folder, LOG_NAME), 'a') as f:
+            f.write(json.dumps(self.record(**fields), separators=(',', ':')) + '\n')
+
+
+def log_files(paths):
+    """Timing logs among ``paths`` and in the folders under them."""
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for folder, _, names in os.walk(path):
+            if LOG_NAME in names:
+                yield os.path.join(folder, LOG_NAME)
+
+
+def read_records(paths):
+    for path in log_files(paths):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def percentile(ordered, percent):
+    """Nearest rank percentile of the sorted list ``ordered``."""
+    rank = max(int(-(-percent * len(ordered) // 100)), 1)
+    return ordered[rank - 1]
+
+
+def summarise(records):
+    """``{name: sorted values}`` of the total, every phase and every numeric counter."""
+    values = collections.OrderedDict()
+    values['total'] = []
+    for record in records:
+        values['total'].append(record['total'])
+        for phase, seconds in record['phases'].items():
+            values.setdefault(phase, []).append(seconds)
+        for name, value in record['counters'].items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                values.setdefault('#' + name, []).append(value)
+    for name in values:
+        values[name].sort()
+    return values
+
+
+def report(values):
+    labels = ['p{}'.format(p) for p in PERCENTILES] + ['max']
+    print('{:<16} {:>7} {}'.format('', 'rounds', ' '.join('{:>10}'.format(label) for label in labels)))
+    for name, ordered in values.items():
+        if not ordered:
+            continue
+        if name.startswith('#'):
+            cells = ['{:>10g}'.format(percentile(ordered, p)) for p in PERCENTILES + (100,)]
+        else:
+            cells = ['{:>8.1f}ms'.format(1000 * percentile(ordered, p)) for p in PERCENTILES + (100,)]
+        print('{:<16} {:>7} {}'.format(name.lstrip('#'), len(ordered), ' '.join(cells)))
+
+
+def import_times(command, cwd=None, env=None):
+    """Seconds ``python -X importtime`` took to run ``command``, and milliseconds by module it imported directly."""
+    # bot.py imports this module every round, these are only wanted here.
+    import subprocess
+    import sys
+
+    started = time.monotonic()
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + command, cwd=cwd, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.monotonic() - started
+    modules = collections.OrderedDict()
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented by two spaces a level.
+        if cumulative.strip().isdigit() and not name.startswith('  '):
+            modules[name.strip()] = int(cumulative) / 1000
+    return elapsed, modules
+
+
+def startup(runs=5, bot_args=()):
+    """Median process time and direct imports of ``runs`` rounds played by bot.py on the sample state."""
+    import shutil
+    import tempfile
+
+    folder = tempfile.mkdtemp()
+    try:
+        for name in ('state.json', 'map.txt'):
+            shutil.copy(os.path.join(SAMPLE_DIR, name), folder)
+        env = dict(os.environ, BOT_CACHE_DIR=folder)
+        command = [os.path.join(BOT_DIR, 'bot.py'), 'A', folder] + list(bot_args)
+        elapsed, modules = [], collections.defaultdict(list)
+        for _ in range(runs):
+            seconds, imported = import_times(command, folder, env)
+            elapsed.append(seconds)
+            for name, milliseconds in imported.items():
+                modules[name].append(milliseconds)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    median = lambda values: sorted(values)[len(values) // 2]
+    return median(elapsed), sorted(((median(values), name) for name, values in modules.items()), reverse=True)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('paths', nargs='*', help='Replays folders or timing logs')
+    parser.add_argument('--startup', action='store_true', help='break down the start of bot.py instead')
+    parser.add_argument('--runs', type=int, default=5, help='times bot.py is run with --startup')
+    parser.add_argument('--bot-args', nargs=argparse.REMAINDER, default=[],
+                        help='options passed on to bot.py with --startup, e.g. --no-daemon')
+    args = parser.parse_args()
+
+    if args.startup:
+        elapsed, modules = startup(args.runs, args.bot_args)
+        print('bot.py ran in {:.1f} ms, {:.1f} ms of it importing'.format(
+            elapsed * 1000, sum(milliseconds for milliseconds, _ in modules)))
+        for milliseconds, name in modules:
+            if milliseconds >= 0.5:
+                print('  {:<24} {:8.1f} ms'.format(name, milliseconds))
+        return
+    if not args.paths:
+        parser.error('give a Replays folder or timing log, or --startup')
+    values = summarise(read_records(args.paths))
+    if not values['total']:
+        parser.exit(1, 'No {} found\n'.format(LOG_NAME))
+    report(values)
+
+
+if __name__ == '__main__':
+    main()
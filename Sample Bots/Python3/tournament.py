@@ -0,0 +1,212 @@
+"""Self-play matches between bots, run offline on the simulator.
+
+Every match generates the engine's map for its seed (see ``mapgen``), then
+plays it out round by round with ``simulator.Simulator`` as the referee: each
+player still alive is handed the round's state as state.json would show it and asked for a command by a
+decision function with the signature of ``search.choose_action``.  Every bot
+keeps its transposition table and ``diff.Derived`` maps from round to round in
+memory, the way ``bot.py`` keeps them in its cache file.
+
+Matches are independent, so they are spread over a ``ProcessPoolExecutor`` and
+throughput grows with the number of cores.  Bots take turns in every seat, and
+the results are ranked with the engine's leader board rules: players alive
+first, then by points, then by the round they were killed in.
+
+    python tournament.py --matches 1000 --players 2 4 --think 0.05 --output results.jsonl
+
+Bots are given as ``module:function``, importable from the bot folder; a
+function can be compared against an older copy of itself saved under another
+module name.
+"""
+import argparse
+import collections
+import concurrent.futures
+import importlib
+import json
+import logging
+import os
+import random
+import time
+
+import diff
+import mapgen
+from search import TABLE_BITS
+from simulator import Simulator
+from zobrist import TranspositionTable
+
+DEFAULT_BOT = 'search:choose_action'
+
+logger = logging.getLogger(__name__)
+
+_bots = {}
+
+
+class BotMemory(object):
+    """What one bot carries from round to round, an in-memory ``cache.Cache``."""
+
+    def __init__(self, table_bits=TABLE_BITS):
+        self.table = TranspositionTable(table_bits)
+        self.state = None
+        self._derived = None
+
+    def previous(self):
+        """Last round's maps, brought forward in place by the next ``derived``."""
+        return self._derived
+
+    def derived(self, previous=None):
+        derived = self._derived
+        if derived is None:
+            return diff.Derived.build(self.state)
+        derived.update(self.state, diff.diff(derived.state, self.state))
+        return derived
+
+    def store(self, derived):
+        self._derived = derived
+
+
+def load_bot(spec):
+    """Decision function named by a ``module:function`` spec."""
+    bot = _bots.get(spec)
+    if bot is None:
+        module, _, name = spec.partition(':')
+        bot = _bots[spec] = getattr(importlib.import_module(module), name or 'choose_action')
+    return bot
+
+
+def leader_board(sim, killed_round):
+    """Player indices in ``BombermanEngine.LeaderBoard`` order."""
+    return sorted(range(len(sim.killed)), key=lambda index: (sim.killed[index], -sim.score(index),
+                                                             killed_round[index]))
+
+
+def play_match(seed, bots, think, table_bits=TABLE_BITS):
+    """Play one match with ``bots[i]`` (a spec) in seat ``i`` and return its record.
+
+    Every bot gets ``think`` seconds per round.
+    """
+    started = time.monotonic()
+    state = mapgen.generate(len(bots), seed)
+    sim = Simulator(state, seed=seed)
+    deciders = [load_bot(spec) for spec in bots]
+    memories = [BotMemory(table_bits) for _ in bots]
+    killed_round = [0] * len(bots)
+    keys = [player.key for player in state.players]
+    while not sim.finished():
+        state = sim.to_state()
+        actions = []
+        for index, decide in enumerate(deciders):
+            if sim.killed[index]:
+                actions.append(None)
+                continue
+            memories[index].state = state
+            actions.append(decide(state, keys[index], time.monotonic() + think, memories[index]))
+        sim.step(actions)
+        # The referee never undoes a round.
+        del sim.log[:]
+        for index, killed in enumerate(sim.killed):
+            if killed and not killed_round[index]:
+                killed_round[index] = sim.round
+
+    ranking = leader_board(sim, killed_round)
+    seats = []
+    for index, spec in enumerate(bots):
+        seats.append({
+            'bot': spec,
+            'key': keys[index],
+            'rank': ranking.index(index),
+            'points': sim.score(index),
+            'killed': sim.killed[index],
+            'killed_round': killed_round[index],
+        })
+    return {'seed': seed, 'players': len(bots), 'rounds': sim.round, 'seconds': time.monotonic() - started,
+            'seats': seats}
+
+
+def schedule(bots, players, matches, seed):
+    """``(seed, seat bots)`` for every match, rotating ``bots`` through the seats and cycling ``players``."""
+    rng = random.Random(seed)
+    for number in range(matches):
+        count = players[number % len(players)]
+        seats = [bots[(number + seat) % len(bots)] for seat in range(count)]
+        yield rng.getrandbits(31), seats
+
+
+def summarise(records):
+    """Per bot: matches, wins, win rate, mean points and rank, deaths and the mean round of death."""
+    totals = collections.OrderedDict()
+    for record in records:
+        for seat in record['seats']:
+            total = totals.setdefault(seat['bot'], collections.Counter())
+            total['seats'] += 1
+            total['wins'] += seat['rank'] == 0
+            total['points'] += seat['points']
+            total['rank'] += seat['rank']
+            if seat['killed']:
+                total['deaths'] += 1
+                total['killed_round'] += seat['killed_round']
+    summary = collections.OrderedDict()
+    for bot, total in totals.items():
+        seats = total['seats']
+        summary[bot] = {
+            'seats': seats,
+            'wins': total['wins'],
+            'win_rate': total['wins'] / seats,
+            'points': total['points'] / seats,
+            'rank': total['rank'] / seats,
+            'deaths': total['deaths'],
+            'killed_round': total['killed_round'] / total['deaths'] if total['deaths'] else None,
+        }
+    return summary
+
+
+def run(bots, players, matches, seed, think, workers=None, output=None):
+    """Play every scheduled match over a process pool, returns the records in order of completion."""
+    records = []
+    started = time.monotonic()
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(play_match, match_seed, seats, think)
+                   for match_seed, seats in schedule(bots, players, matches, seed)]
+        for future in concurrent.futures.as_completed(futures):
+            record = future.result()
+            records.append(record)
+            if output is not None:
+                output.write(json.dumps(record) + '\n')
+                output.flush()
+            logger.info('{}/{} matches, seed {} took {} rounds'.format(
+                len(records), matches, record['seed'], record['rounds']))
+    elapsed = time.monotonic() - started
+    rounds = sum(record['rounds'] for record in records)
+    logger.info('{} matches, {} rounds in {:.1f}s: {:.0f} matches/hour'.format(
+        len(records), rounds, elapsed, 3600 * len(records) / elapsed if elapsed else 0))
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--bots', nargs='+', default=[DEFAULT_BOT], help='module:function of every bot taking part')
+    parser.add_argument('--players', nargs='+', type=int, default=[2], help='players per match, cycled through')
+    parser.add_argument('--matches', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0, help='seed the map seeds are drawn from')
+    parser.add_argument('--think', type=float, default=0.05, help='seconds every bot gets per round')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--output', help='file to write one JSON record per match to')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)-7s - [%(funcName)s] %(message)s')
+    # Bots log every round, keep the workers quiet.
+    logging.getLogger('search').setLevel(logging.WARNING)
+    output = open(args.output, 'w') if args.output else None
+    try:
+        records = run(args.bots, args.players, args.matches, args.seed, args.think, args.workers, output)
+    finally:
+        if output is not None:
+            output.close()
+    for bot, result in summarise(records).items():
+        print('{}: {} seats, {} wins ({:.1%}), {:.1f} points, rank {:.2f}, {} deaths{}'.format(
+            bot, result['seats'], result['wins'], result['win_rate'], result['points'], result['rank'],
+            result['deaths'], '' if result['killed_round'] is None else
+            ' (round {:.1f} on average)'.format(result['killed_round'])))
+
+
+if __name__ == '__main__':
+    main()
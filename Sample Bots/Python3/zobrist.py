@@ -0,0 +1,187 @@
+"""Zobrist keys for game positions and a fixed size transposition table.
+
+A position hashes to the XOR of one random 64 bit key per feature: every
+destructible wall, visible power up and player still on the map, every bomb
+(its cell combined with the round it goes off in, its radius and owner), each
+player's bomb bag and radius, and the current round.  Indestructible walls never
+change during a game, so they do not need keys of their own.  Keys are drawn
+from a fixed seed, which makes hashes comparable between processes.
+
+Bombs are keyed on the absolute round they detonate in rather than their fuse,
+so time passing only swaps the round key instead of touching every bomb.
+"""
+import array
+import random
+
+SEED = 20160708
+
+_FUSES = 32
+_LEVELS = 16
+_ROUNDS = 64
+
+_keys = {}
+
+
+class Keys(object):
+    """Key tables for one map size and player count."""
+    __slots__ = ('size', 'destructible', 'power_up', 'player', 'bomb_bag', 'radius',
+                 'detonates', 'bomb_radius', 'bomb_owner', 'round', 'side')
+
+    def __init__(self, size, players):
+        generator = random.Random(SEED)
+
+        def table(length):
+            return array.array('Q', [generator.getrandbits(64) for _ in range(length)])
+
+        self.size = size
+        self.destructible = table(size)
+        self.power_up = table(4 * size)
+        self.player = table(players * size)
+        self.bomb_bag = table(players * _LEVELS)
+        self.radius = table(players * _LEVELS)
+        self.detonates = table(_FUSES * size)
+        self.bomb_radius = table(_LEVELS * size)
+        self.bomb_owner = table(_LEVELS * size)
+        self.round = table(_ROUNDS)
+        # Search results depend on whose point of view they were scored from.
+        self.side = table(players)
+
+    def power_up_key(self, cell, kind):
+        return self.power_up[kind * self.size + cell]
+
+    def player_key(self, index, cell):
+        return self.player[index * self.size + cell]
+
+    def bomb_bag_key(self, index, bag):
+        return self.bomb_bag[index * _LEVELS + (bag & (_LEVELS - 1))]
+
+    def radius_key(self, index, radius):
+        return self.radius[index * _LEVELS + (radius.bit_length() & (_LEVELS - 1))]
+
+    def detonates_key(self, cell, detonates):
+        return self.detonates[cell * _FUSES + (detonates & (_FUSES - 1))]
+
+    def bomb_key(self, cell, detonates, radius, owner):
+        return (self.detonates[cell * _FUSES + (detonates & (_FUSES - 1))]
+                ^ self.bomb_radius[cell * _LEVELS + (radius.bit_length() & (_LEVELS - 1))]
+                ^ self.bomb_owner[cell * _LEVELS + (owner & (_LEVELS - 1))])
+
+    def round_key(self, round):
+        return self.round[round & (_ROUNDS - 1)]
+
+
+def keys(size, players):
+    """Shared ``Keys`` for a map of ``size`` cells and ``players`` players."""
+    found = _keys.get((size, players))
+    if found is None:
+        found = _keys[size, players] = Keys(size, players)
+    return found
+
+
+def position_hash(sim):
+    """Hash of a ``simulator.Simulator`` position worked out from scratch."""
+    found = keys(sim.width * sim.height, len(sim.position))
+    value = found.round_key(sim.round)
+    for cell, destructible in enumerate(sim.destructible):
+        if destructible:
+            value ^= found.destructible[cell]
+    for cell, kind in enumerate(sim.power_up):
+        if kind:
+            value ^= found.power_up_key(cell, kind)
+    for cell, detonates in sim.detonates.items():
+        value ^= found.bomb_key(cell, detonates, sim.bomb_radius[cell], sim.bomb_owner[cell])
+    for index, cell in enumerate(sim.position):
+        if sim.on_map[index]:
+            value ^= found.player_key(index, cell)
+        value ^= found.bomb_bag_key(index, sim.bomb_bag[index]) ^ found.radius_key(index, sim.radius[index])
+    return value
+
+
+class TranspositionTable(object):
+    """Search values by position hash in a fixed number of slots.
+
+    Slots come in pairs.  The first of a pair keeps the deepest result stored
+    during the current search and is only given up to a deeper one or to a
+    result of a newer search; anything that does not get in there overwrites the
+    second slot.  Values are stored for an exact remaining depth and looked up
+    for that depth or less.
+
+    The slots live in ``buffer`` if one is given (``footprint(bits)`` writable
+    bytes, e.g. a memory mapped file, used as found), otherwise in a new empty
+    ``bytearray``.
+    """
+
+    def __init__(self, bits=16, buffer=None):
+        slots = 1 << bits
+        self.bits = bits
+        self.mask = slots - 2
+        fresh = buffer is None
+        if fresh:
+            buffer = bytearray(self.footprint(bits))
+        self._view = view = memoryview(buffer)
+        self.hashes = view[:8 * slots].cast('Q')
+        self.values = view[8 * slots:16 * slots].cast('d')
+        self.depths = view[16 * slots:17 * slots].cast('b')
+        self.generations = view[17 * slots:18 * slots].cast('B')
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        if fresh:
+            self.clear()
+
+    @staticmethod
+    def footprint(bits):
+        """Bytes taken by a table of ``1 << bits`` slots."""
+        return 18 << bits
+
+    def clear(self):
+        slots = len(self.depths)
+        self._view[:8 * slots] = bytes(8 * slots)
+        self.depths[:] = array.array('b', [-1]) * slots
+
+    def release(self):
+        """Let go of the buffer, the table cannot be used afterwards."""
+        for view in (self.hashes, self.values, self.depths, self.generations, self._view):
+            view.release()
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @property
+    def memory(self):
+        """Bytes taken by the slots."""
+        return self._view.nbytes
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def new_search(self):
+        """Start a new search: results of earlier ones stay usable but may now be replaced."""
+        self.generation = (self.generation + 1) & 255
+        self.probes = self.hits = self.stores = 0
+
+    def lookup(self, key, depth):
+        """Value stored for ``key`` searched at least ``depth`` deep, or None."""
+        self.probes += 1
+        slot = key & self.mask
+        hashes, depths = self.hashes, self.depths
+        if hashes[slot] == key and depths[slot] >= depth:
+            self.hits += 1
+            return self.values[slot]
+        slot += 1
+        if hashes[slot] == key and depths[slot] >= depth:
+            self.hits += 1
+            return self.values[slot]
+        return None
+
+    def store(self, key, depth, value):
+        slot = key & self.mask
+        if self.hashes[slot] != key and self.generations[slot] == self.generation and self.depths[slot] > depth:
+            slot += 1
+        self.hashes[slot] = key
+        self.values[slot] = value
+        self.depths[slot] = depth
+        self.generations[slot] = self.generation
+        self.stores += 1